@@ -1,102 +1,3266 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, Flask, Response, abort, current_app, render_template, request, redirect, url_for, flash, \
+    jsonify, stream_with_context, request_started, request_finished, make_response, session
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timezone
-import math
+from sqlalchemy import Select, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import date, datetime, timedelta, timezone
+import click
+import numpy as np
+import csv
+import functools
+import gzip
+import hashlib
+import inspect
+import itertools
+import json
+import operator
+import os
+import queue
+import secrets
+import socket
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///rikiki.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+try:
+    import brotli
+except ImportError:  # Optional: responses fall back to gzip
+    brotli = None
 
-db = SQLAlchemy(app)
+import simulator
+from rules import DECK_CARDS, GameState, RuleError, cards_for_round, max_rounds_for, score_round
+
+# Configuration
+# create_app() starts from these defaults, then applies the file named by RIKIKI_CONFIG
+# (Python or JSON), then RIKIKI_* environment variables, then the mapping it is given.
+DEFAULT_CONFIG = {
+    # Unset: a random key per process, so sessions do not survive a restart
+    'SECRET_KEY': None,
+    # Relative SQLite paths are resolved against the instance folder; DATABASE_PATH wins over the URI
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///rikiki.db',
+    'DATABASE_PATH': None,
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    # production enables WAL journaling and a larger connection pool for multi-threaded servers
+    'STORAGE_MODE': 'default',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    # Connection pool; unset keeps the storage mode's defaults
+    'POOL_SIZE': None,
+    'POOL_MAX_OVERFLOW': None,
+    'POOL_TIMEOUT': None,
+    # Rendered pages and their compressed bodies kept in memory per worker process
+    'RENDER_CACHE_MAX_BYTES': 32 * 1024 * 1024,
+    'COMPRESSED_CACHE_MAX_BYTES': 8 * 1024 * 1024,
+    # Requests slower than this are logged with their most expensive statements
+    'SLOW_REQUEST_MS': 500,
+    # Bid advice: simulated deals per answer, and simulator processes (0 simulates inside the request)
+    'BID_ADVICE_HANDS': 10000,
+    'SIMULATION_WORKERS': 0,
+    # Response compression: off leaves it to a reverse proxy
+    'COMPRESSION': True,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    # Background jobs: threads per process running rebuilds, purges and imports
+    'JOB_WORKERS': 1,
+    # Live game event streams: open at once per process (each holds a server thread), and seconds
+    # before one is closed for its client to reconnect
+    'LIVE_STREAMS': 4,
+    'LIVE_STREAM_SECONDS': 300,
+}
+
+def _switch(value):
+    return value.strip().lower() not in ('off', 'false', 'no', '0')
+
+# Environment variable -> (setting, parser)
+ENV_SETTINGS = {
+    'RIKIKI_SECRET_KEY': ('SECRET_KEY', str),
+    'RIKIKI_DATABASE_URI': ('SQLALCHEMY_DATABASE_URI', str),
+    'RIKIKI_DATABASE_PATH': ('DATABASE_PATH', str),
+    'RIKIKI_STORAGE': ('STORAGE_MODE', str),
+    'RIKIKI_SQLITE_BUSY_TIMEOUT_MS': ('SQLITE_BUSY_TIMEOUT_MS', int),
+    'RIKIKI_POOL_SIZE': ('POOL_SIZE', int),
+    'RIKIKI_POOL_MAX_OVERFLOW': ('POOL_MAX_OVERFLOW', int),
+    'RIKIKI_POOL_TIMEOUT': ('POOL_TIMEOUT', float),
+    'RIKIKI_RENDER_CACHE_MAX_BYTES': ('RENDER_CACHE_MAX_BYTES', int),
+    'RIKIKI_COMPRESSED_CACHE_MAX_BYTES': ('COMPRESSED_CACHE_MAX_BYTES', int),
+    'RIKIKI_SLOW_REQUEST_MS': ('SLOW_REQUEST_MS', int),
+    'RIKIKI_BID_ADVICE_HANDS': ('BID_ADVICE_HANDS', int),
+    'RIKIKI_SIMULATION_WORKERS': ('SIMULATION_WORKERS', int),
+    'RIKIKI_COMPRESSION': ('COMPRESSION', _switch),
+    'RIKIKI_GZIP_LEVEL': ('GZIP_LEVEL', int),
+    'RIKIKI_BROTLI_QUALITY': ('BROTLI_QUALITY', int),
+    'RIKIKI_JOB_WORKERS': ('JOB_WORKERS', int),
+    'RIKIKI_LIVE_STREAMS': ('LIVE_STREAMS', int),
+    'RIKIKI_LIVE_STREAM_SECONDS': ('LIVE_STREAM_SECONDS', int),
+}
+
+def load_config(app, overrides=None):
+    """Fill app.config from the defaults, the config file, the environment and overrides, in that order."""
+    app.config.from_mapping(DEFAULT_CONFIG)
+    config_file = os.environ.get('RIKIKI_CONFIG')
+    if config_file:
+        if config_file.endswith('.json'):
+            app.config.from_file(os.path.abspath(config_file), load=json.load)
+        else:
+            app.config.from_pyfile(os.path.abspath(config_file))
+    for variable, (key, parse) in ENV_SETTINGS.items():
+        if variable in os.environ:
+            try:
+                app.config[key] = parse(os.environ[variable])
+            except ValueError:
+                raise ValueError(f'{variable}={os.environ[variable]!r} is not a valid {parse.__name__}')
+    app.config.from_mapping(overrides or {})
+    
+    if app.config['DATABASE_PATH']:
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + app.config['DATABASE_PATH']
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**_engine_options(app.config),
+                                               **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+def _engine_options(config):
+    options = {}
+    if config['STORAGE_MODE'] == 'production':
+        options = {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 30,
+            'connect_args': {
+                'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+                # Pooled connections are handed between request threads
+                'check_same_thread': False
+            }
+        }
+    for key, option in (('POOL_SIZE', 'pool_size'), ('POOL_MAX_OVERFLOW', 'max_overflow'), ('POOL_TIMEOUT', 'pool_timeout')):
+        if config[key] is not None:
+            options[option] = config[key]
+    return options
+
+db = SQLAlchemy()
+
+# Routes and commands are registered on the application by create_app()
+bp = Blueprint('rikiki', __name__, cli_group=None)
+
+def _sqlite_connection_setup(config):
+    busy_timeout_ms = config['SQLITE_BUSY_TIMEOUT_MS']
+    wal = config['STORAGE_MODE'] == 'production'
+    
+    def configure(dbapi_connection, connection_record):
+        # Applied to every new pooled connection
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout = {busy_timeout_ms}')
+        # Deleting a game cascades to its rounds, results and seats
+        cursor.execute('PRAGMA foreign_keys = ON')
+        if wal:
+            # Readers never block behind the writer; NORMAL is durable enough with WAL
+            cursor.execute('PRAGMA journal_mode = WAL')
+            cursor.execute('PRAGMA synchronous = NORMAL')
+        cursor.close()
+    return configure
+
+# Game writes go through one lock per process so SQLite only ever sees a single
+# writer from here; other processes wait on busy_timeout instead of failing. The lock
+# only saves waiting: claim_game rejects any write built on an outdated game
+_write_lock = threading.Lock()
+
+def serialized_write(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'GET':
+            return view(*args, **kwargs)
+        with _write_lock:
+            return view(*args, **kwargs)
+    return wrapper
 
 # Database Models
 class Player(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nickname = db.Column(db.String(50), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped when the player's page changes
+    updated_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Case-insensitive prefix search and alphabetical paging
+        db.Index('ix_player_nickname_nocase', db.collate(nickname, 'NOCASE')),
+        # A new player never takes a deleted one's id, so page ETags cannot be mistaken for theirs
+        {'sqlite_autoincrement': True},
+    )
+    
+    def __repr__(self):
+        return f'<Player {self.nickname}>'
+
+class Game(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)  # When first round was started
+    ended_at = db.Column(db.DateTime, nullable=True)  # When game was completed or ended early
+    is_active = db.Column(db.Boolean, default=True)
+    current_round = db.Column(db.Integer, default=1)
+    max_rounds = db.Column(db.Integer, nullable=False)
+    round_direction = db.Column(db.String(10), default='up')  # 'up' or 'down'
+    current_dealer_index = db.Column(db.Integer, default=0)  # Index of current dealer in player order
+    ended_early = db.Column(db.Boolean, default=False)  # Whether game was ended early
+    deck_type = db.Column(db.String(10), default='single')  # 'single' or 'double'
+    force_conflict = db.Column(db.Boolean, default=True)  # Whether to force conflict (prevent equal sums)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every change to the game
+    updated_at = db.Column(db.DateTime, nullable=True)  # Time of the last version bump
+    
+    __table_args__ = (
+        db.Index('ix_game_active_created', 'is_active', 'created_at'),
+        db.Index('ix_game_updated', 'updated_at'),
+        # Ids of deleted games are never handed out again, so caches and ETags keyed on them stay unique
+        {'sqlite_autoincrement': True},
+    )
+    
+    def __repr__(self):
+        return f'<Game {self.id}>'
+
+class GamePlayer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete='CASCADE'), nullable=False)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    total_points = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        db.Index('uq_game_player_game_player', 'game_id', 'player_id', unique=True),
+        db.Index('ix_game_player_player_game', 'player_id', 'game_id'),
+    )
+    
+    game = db.relationship('Game', backref=db.backref('game_players', passive_deletes=True))
+    player = db.relationship('Player', backref='game_players')
+
+class Round(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete='CASCADE'), nullable=False)
+    round_number = db.Column(db.Integer, nullable=False)
+    cards_per_player = db.Column(db.Integer, nullable=False)
+    is_completed = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped when its guesses or results change
+    
+    __table_args__ = (
+        db.Index('uq_round_game_number', 'game_id', 'round_number', unique=True),
+    )
+    
+    game = db.relationship('Game', backref=db.backref('rounds', passive_deletes=True))
+
+class RoundResult(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    round_id = db.Column(db.Integer, db.ForeignKey('round.id', ondelete='CASCADE'), nullable=False)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    guess = db.Column(db.Integer, nullable=False)
+    hits = db.Column(db.Integer, nullable=True)  # NULL until round is completed
+    points = db.Column(db.Integer, nullable=True)  # NULL until round is completed
+    
+    __table_args__ = (
+        db.Index('uq_round_result_round_player', 'round_id', 'player_id', unique=True),
+    )
+    
+    round = db.relationship('Round', backref=db.backref('results', passive_deletes=True))
+    player = db.relationship('Player', backref='round_results')
+
+class PlayerGameStats(db.Model):
+    # One line per player per finished game, written when the game ends
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete='CASCADE'), nullable=False, index=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    ended_at = db.Column(db.DateTime, nullable=True)  # Game end (or creation) time, used for ordering
+    position = db.Column(db.Integer, nullable=False)
+    points = db.Column(db.Integer, default=0)
+    rounds_played = db.Column(db.Integer, default=0)
+    guesses = db.Column(db.Integer, default=0)
+    correct_guesses = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_player_game_stats_player_ended', 'player_id', 'ended_at'),
+        # Rating order, walked in batches by rebuild_ratings
+        db.Index('ix_player_game_stats_ended_game', 'ended_at', 'game_id'),
+    )
+
+class PlayerStats(db.Model):
+    # All-time aggregate per player, the sum of that player's PlayerGameStats lines
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), primary_key=True)
+    games_played = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    total_points = db.Column(db.Integer, default=0)
+    rounds_played = db.Column(db.Integer, default=0)
+    total_guesses = db.Column(db.Integer, default=0)
+    correct_guesses = db.Column(db.Integer, default=0)
+    position_counts = db.Column(db.JSON, default=dict)  # {"1": 4, "2": 1, ...}
+
+class PlayerDailyStats(db.Model):
+    # Per player and UTC day of the game's end: the sum of that day's PlayerGameStats lines
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    games_played = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    total_points = db.Column(db.Integer, nullable=False, default=0)
+    rounds_played = db.Column(db.Integer, nullable=False, default=0)
+    total_guesses = db.Column(db.Integer, nullable=False, default=0)
+    correct_guesses = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Leaderboards read one date range for every player
+        db.Index('ix_player_daily_stats_day', 'day'),
+    )
+
+class HeadToHead(db.Model):
+    # Record of player_id against opponent_id over finished games; each pair is stored both ways
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), primary_key=True)
+    opponent_id = db.Column(db.Integer, db.ForeignKey('player.id'), primary_key=True)
+    games = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)  # Games where player_id finished above opponent_id
+    points_for = db.Column(db.Integer, default=0)
+    points_against = db.Column(db.Integer, default=0)
+
+class PlayerRating(db.Model):
+    # Current skill rating per player
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), primary_key=True)
+    rating = db.Column(db.Float, nullable=False, default=1500.0)
+    games_rated = db.Column(db.Integer, default=0)
+    
+    player = db.relationship('Player')
+
+class RatingHistory(db.Model):
+    # Rating change of one player in one finished game
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete='CASCADE'), nullable=False)
+    ended_at = db.Column(db.DateTime, nullable=False)  # Same ordering key as PlayerGameStats.ended_at
+    rating_before = db.Column(db.Float, nullable=False)
+    rating_after = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_rating_history_player_ended', 'player_id', 'ended_at'),
+        db.Index('ix_rating_history_ended_game', 'ended_at', 'game_id'),
+    )
+
+class GameEvent(db.Model):
+    # Append-only log of a game; rules.GameState replays it (event types are listed in rules.py)
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1, 2, 3, ... within the game
+    event_type = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    submission_id = db.Column(db.String(64), nullable=True)  # Idempotency token of the form that caused it
+    
+    __table_args__ = (
+        db.Index('uq_game_event_game_seq', 'game_id', 'seq', unique=True),
+        db.Index('uq_game_event_submission', 'submission_id', unique=True),
+    )
+
+class GameSnapshot(db.Model):
+    # Latest saved GameState per game; loading replays only the events after it
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete='CASCADE'), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.JSON, nullable=False)
+
+class Job(db.Model):
+    # A background job and its outcome; status is queued, running, succeeded, failed or cancelled
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    progress_done = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer)
+    message = db.Column(db.String(200))
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100))  # host:pid of the process that runs it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_job_status', 'status'),
+    )
+
+# Schema migrations
+# db.create_all() only creates missing tables, so changes to existing tables are
+# applied here in order. The applied version is kept in SQLite's user_version pragma.
+MIGRATIONS = []
+
+def migration(func):
+    MIGRATIONS.append(func)
+    return func
+
+def _column_names(conn, table):
+    return {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info({table})')}
+
+@migration
+def add_game_options(conn):
+    """Add the deck_type and force_conflict columns to games created before they existed."""
+    columns = _column_names(conn, 'game')
+    if 'deck_type' not in columns:
+        conn.exec_driver_sql("ALTER TABLE game ADD COLUMN deck_type VARCHAR(10) DEFAULT 'single'")
+    if 'force_conflict' not in columns:
+        conn.exec_driver_sql('ALTER TABLE game ADD COLUMN force_conflict BOOLEAN DEFAULT 1')
+
+@migration
+def add_lookup_indexes(conn):
+    """Remove duplicate rows, then add the composite lookup indexes and uniqueness constraints."""
+    # Keep the newest result per round and player (guesses are re-submitted as new rows)
+    conn.exec_driver_sql(
+        'DELETE FROM round_result WHERE id NOT IN '
+        '(SELECT MAX(id) FROM round_result GROUP BY round_id, player_id)')
+    # Keep the first seat per game and player
+    conn.exec_driver_sql(
+        'DELETE FROM game_player WHERE id NOT IN '
+        '(SELECT MIN(id) FROM game_player GROUP BY game_id, player_id)')
+    # Keep the first round per game and number, together with its results
+    conn.exec_driver_sql(
+        'DELETE FROM round_result WHERE round_id IN (SELECT id FROM round WHERE id NOT IN '
+        '(SELECT MIN(id) FROM round GROUP BY game_id, round_number))')
+    conn.exec_driver_sql(
+        'DELETE FROM round WHERE id NOT IN '
+        '(SELECT MIN(id) FROM round GROUP BY game_id, round_number)')
+    
+    conn.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS uq_round_result_round_player ON round_result (round_id, player_id)')
+    conn.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS uq_game_player_game_player ON game_player (game_id, player_id)')
+    conn.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS uq_round_game_number ON round (game_id, round_number)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_game_active_created ON game (is_active, created_at)')
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_player_game_stats_player_id')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_player_game_stats_player_ended ON player_game_stats (player_id, ended_at)')
+
+@migration
+def add_game_version(conn):
+    """Add the per-game version counter used for ETags and live updates."""
+    if 'version' not in _column_names(conn, 'game'):
+        conn.exec_driver_sql('ALTER TABLE game ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+def _rebuild_table(conn, model):
+    # SQLite cannot alter constraints, so copy the rows into a table created from the current model
+    table = model.__table__
+    name = table.name
+    create_sql = str(db.schema.CreateTable(table).compile(conn.engine)).strip()
+    create_sql = create_sql.replace(f'CREATE TABLE {name} (', f'CREATE TABLE {name}_new (', 1)
+    columns = ', '.join(c.name for c in table.columns if c.name in _column_names(conn, name))
+    
+    conn.exec_driver_sql(create_sql)
+    conn.exec_driver_sql(f'INSERT INTO {name}_new ({columns}) SELECT {columns} FROM {name}')
+    conn.exec_driver_sql(f'DROP TABLE {name}')
+    conn.exec_driver_sql(f'ALTER TABLE {name}_new RENAME TO {name}')
+    for index in table.indexes:
+        index.create(conn)
+
+@migration
+def add_delete_cascades(conn):
+    """Rebuild child tables so deleting a game cascades to its rounds, results, seats and stat lines."""
+    for model in (GamePlayer, Round, RoundResult, PlayerGameStats):
+        _rebuild_table(conn, model)
+
+@migration
+def add_player_search_indexes(conn):
+    """Index nicknames case-insensitively and seats by player for search and co-player suggestions."""
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_player_nickname_nocase ON player (nickname COLLATE NOCASE)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_game_player_player_game ON game_player (player_id, game_id)')
+
+@migration
+def add_cache_validators(conn):
+    """Add the player version and the update times behind ETag and Last-Modified headers."""
+    if 'updated_at' not in _column_names(conn, 'game'):
+        conn.exec_driver_sql('ALTER TABLE game ADD COLUMN updated_at DATETIME')
+    player_columns = _column_names(conn, 'player')
+    if 'version' not in player_columns:
+        conn.exec_driver_sql('ALTER TABLE player ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    if 'updated_at' not in player_columns:
+        conn.exec_driver_sql('ALTER TABLE player ADD COLUMN updated_at DATETIME')
+
+@migration
+def add_player_daily_stats(conn):
+    """Fill the daily rollups behind period statistics from the stat lines already stored."""
+    conn.exec_driver_sql('DELETE FROM player_daily_stats')
+    conn.exec_driver_sql(
+        'INSERT INTO player_daily_stats (player_id, day, games_played, wins, total_points, rounds_played, '
+        'total_guesses, correct_guesses) '
+        'SELECT player_id, date(ended_at), COUNT(*), SUM(position = 1), COALESCE(SUM(points), 0), '
+        'COALESCE(SUM(rounds_played), 0), COALESCE(SUM(guesses), 0), COALESCE(SUM(correct_guesses), 0) '
+        'FROM player_game_stats WHERE ended_at IS NOT NULL GROUP BY player_id, date(ended_at)')
+
+@migration
+def add_write_guards(conn):
+    """Add round versions and the submission tokens that make repeated form posts harmless."""
+    if 'version' not in _column_names(conn, 'round'):
+        conn.exec_driver_sql('ALTER TABLE round ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    if 'submission_id' not in _column_names(conn, 'game_event'):
+        conn.exec_driver_sql('ALTER TABLE game_event ADD COLUMN submission_id VARCHAR(64)')
+    conn.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS uq_game_event_submission ON game_event (submission_id)')
+
+def _uses_autoincrement(conn, table):
+    create_sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).scalar()
+    return 'AUTOINCREMENT' in (create_sql or '').upper()
+
+@migration
+def add_game_autoincrement(conn):
+    """Rebuild the game table with AUTOINCREMENT, so a deleted game's id is never reused."""
+    if not _uses_autoincrement(conn, 'game'):
+        _rebuild_table(conn, Game)
+
+@migration
+def add_player_autoincrement(conn):
+    """Rebuild the player table with AUTOINCREMENT, so a deleted player's id is never reused."""
+    if not _uses_autoincrement(conn, 'player'):
+        _rebuild_table(conn, Player)
+
+@migration
+def add_rating_order_index(conn):
+    """Index stat lines in rating order, so a ratings rebuild finds each batch without sorting them all."""
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_player_game_stats_ended_game ON player_game_stats (ended_at, game_id)')
+
+@migration
+def add_game_updated_index(conn):
+    """Index games by their last change, so the analytics snapshot finds the changed ones without a full scan."""
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_game_updated ON game (updated_at)')
+
+def migrate_database():
+    """Create missing tables and apply pending migrations. Returns the names applied."""
+    db.create_all()
+    applied = []
+    with db.engine.connect() as conn:
+        # Table rebuilds must not fire cascades; this has to happen outside a transaction
+        conn.exec_driver_sql('PRAGMA foreign_keys = OFF')
+        try:
+            version = conn.exec_driver_sql('PRAGMA user_version').scalar()
+            for number, step in enumerate(MIGRATIONS, start=1):
+                if number <= version:
+                    continue
+                step(conn)
+                conn.exec_driver_sql(f'PRAGMA user_version = {number}')
+                conn.commit()
+                applied.append(step.__name__)
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql('PRAGMA foreign_keys = ON')
+    return applied
+
+def prepare_database():
+    """Migrate, then fill the statistics and ratings stores the first time they exist. Returns the migrations applied."""
+    applied = migrate_database()
+    if Game.query.filter_by(is_active=False).first() and not (PlayerStats.query.first() and HeadToHead.query.first()):
+        rebuild_player_stats()
+    if not PlayerRating.query.first() and PlayerGameStats.query.first():
+        rebuild_ratings()
+    return applied
+
+def pending_migrations():
+    """Names of the migrations the database still needs; all of them for a new database."""
+    with db.engine.connect() as conn:
+        version = conn.exec_driver_sql('PRAGMA user_version').scalar()
+    return [step.__name__ for step in MIGRATIONS[version:]]
+
+@bp.cli.command('migrate-db')
+def migrate_db_command():
+    """Upgrade the database schema in place."""
+    applied = prepare_database()
+    if applied:
+        for name in applied:
+            print(f'Applied migration {name}')
+    else:
+        print('Database schema is up to date')
+
+def route_query_plans():
+    """EXPLAIN QUERY PLAN output for the lookups behind the main routes."""
+    statements = {
+        'index: active games': db.select(Game).filter_by(is_active=True).order_by(Game.created_at.desc()),
+        'history: completed games': db.select(Game).filter_by(is_active=False).order_by(Game.created_at.desc()),
+        'game: current round': db.select(Round).filter_by(game_id=1, round_number=1),
+        'game: round results': db.select(RoundResult).filter_by(round_id=1),
+        'game: players': db.select(GamePlayer).filter_by(game_id=1),
+        'score series: game results': (
+            db.select(Round.round_number, RoundResult.player_id, RoundResult.points)
+            .outerjoin(RoundResult, RoundResult.round_id == Round.id)
+            .filter(Round.game_id == 1, Round.is_completed == True)
+            .order_by(Round.round_number)
+        ),
+        'submit_results: player result': db.select(RoundResult).filter_by(round_id=1, player_id=1),
+        'submit_results: seat': db.select(GamePlayer).filter_by(game_id=1, player_id=1),
+        'player: game lines': db.select(PlayerGameStats).filter_by(player_id=1).order_by(PlayerGameStats.ended_at),
+        'player: last 30 days': db.select(db.func.sum(PlayerDailyStats.wins)).where(
+            PlayerDailyStats.player_id == 1, PlayerDailyStats.day.between(date(2024, 1, 1), date(2024, 1, 30))),
+        'leaderboards: period rollups': (
+            db.select(PlayerDailyStats.player_id, db.func.sum(PlayerDailyStats.wins))
+            .where(PlayerDailyStats.day.between(date(2024, 1, 1), date(2024, 1, 31)))
+            .group_by(PlayerDailyStats.player_id)
+        ),
+        'players: prefix search': db.select(Player).where(nickname_prefix_filter('ab')).order_by(_nickname_key(), Player.id),
+        'new_game: recent seats of players': (
+            db.select(GamePlayer.game_id).where(GamePlayer.player_id.in_([1, 2]))
+            .order_by(GamePlayer.game_id.desc()).limit(PLAYER_SUGGESTION_GAMES)
+        ),
+    }
+    plans = {}
+    for name, statement in statements.items():
+        sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        try:
+            plans[name] = [row[3] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))]
+        except OperationalError as e:
+            # Tables added by newer versions are missing until the database is migrated
+            db.session.rollback()
+            plans[name] = [f'unavailable: {e.orig}']
+    return plans
+
+@bp.cli.command('query-plans')
+def query_plans_command():
+    """Show query plans for the main route queries and flag full table scans."""
+    full_scans = 0
+    for name, plan in route_query_plans().items():
+        print(name)
+        for detail in plan:
+            # "SCAN table" without an index means every row is read
+            is_full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+            full_scans += is_full_scan
+            print(f"  {'!! ' if is_full_scan else ''}{detail}")
+    print(f'\n{full_scans} full table scan(s)')
+
+# Player statistics store
+def compute_game_stat_lines(game_ids):
+    """Build PlayerGameStats rows for finished games from the raw RoundResult rows."""
+    if not game_ids:
+        return []
+    
+    # Completed rounds per game
+    rounds_played = dict(
+        db.session.query(Round.game_id, db.func.count(Round.id))
+        .filter(Round.game_id.in_(game_ids), Round.is_completed == True)
+        .group_by(Round.game_id)
+        .all()
+    )
+    
+    # Guesses, correct guesses and points per game and player
+    totals = {}
+    rows = (
+        db.session.query(
+            Round.game_id,
+            RoundResult.player_id,
+            db.func.count(RoundResult.id),
+            db.func.sum(db.case((RoundResult.guess == RoundResult.hits, 1), else_=0)),
+            db.func.coalesce(db.func.sum(RoundResult.points), 0),
+        )
+        .join(Round, RoundResult.round_id == Round.id)
+        .filter(Round.game_id.in_(game_ids), Round.is_completed == True)
+        .group_by(Round.game_id, RoundResult.player_id)
+        .all()
+    )
+    for game_id, player_id, guesses, correct, points in rows:
+        totals[(game_id, player_id)] = (guesses, correct or 0, points)
+    
+    # Seats in player order, with the game's end time for chronological ordering
+    seats = (
+        db.session.query(GamePlayer.game_id, GamePlayer.player_id, Game.ended_at, Game.created_at)
+        .join(Game, GamePlayer.game_id == Game.id)
+        .filter(GamePlayer.game_id.in_(game_ids))
+        .order_by(GamePlayer.game_id, GamePlayer.id)
+        .all()
+    )
+    
+    lines_by_game = {}
+    for game_id, player_id, ended_at, created_at in seats:
+        guesses, correct, points = totals.get((game_id, player_id), (0, 0, 0))
+        lines_by_game.setdefault(game_id, []).append(PlayerGameStats(
+            game_id=game_id,
+            player_id=player_id,
+            ended_at=ended_at or created_at,
+            position=0,
+            points=points,
+            rounds_played=rounds_played.get(game_id, 0),
+            guesses=guesses,
+            correct_guesses=correct
+        ))
+    
+    # Rank by points; ties keep seating order
+    lines = []
+    for game_lines in lines_by_game.values():
+        for position, line in enumerate(sorted(game_lines, key=lambda l: -l.points), start=1):
+            line.position = position
+            lines.append(line)
+    return lines
+
+def _apply_stat_lines(lines, sign):
+    # Add (sign=1) or subtract (sign=-1) stat lines from the per-player aggregates and daily rollups
+    player_ids = {line.player_id for line in lines}
+    if player_ids:
+        touch_players(player_ids)
+    _apply_daily_stats(lines, sign)
+    
+    deltas = {}
+    for line in lines:
+        delta = deltas.setdefault((line.player_id,), {'games_played': 0, 'wins': 0, 'total_points': 0, 'rounds_played': 0,
+                                                      'total_guesses': 0, 'correct_guesses': 0, 'position_counts': {}})
+        delta['games_played'] += sign
+        delta['wins'] += sign if line.position == 1 else 0
+        delta['total_points'] += sign * line.points
+        delta['rounds_played'] += sign * line.rounds_played
+        delta['total_guesses'] += sign * line.guesses
+        delta['correct_guesses'] += sign * line.correct_guesses
+        position = str(line.position)
+        delta['position_counts'][position] = delta['position_counts'].get(position, 0) + sign
+    _add_to_counters(PlayerStats, deltas, 'games_played', json_columns=('position_counts',))
+
+def _merge_counts(stored, delta):
+    # {name: count} objects: add the delta and drop names that fall to zero
+    counts = dict(stored or {})
+    for name, value in delta.items():
+        counts[name] = counts.get(name, 0) + value
+        if counts[name] <= 0:
+            del counts[name]
+    return counts
+
+def _add_to_counters(model, deltas, count_column, json_columns=()):
+    """Add {primary key: {column: delta}} to a table of counters, creating missing rows.
+    
+    Whole-table statements, one UPDATE and one INSERT, so the cost does not grow with the
+    number of keys. json_columns hold {name: count} objects whose deltas are such objects too;
+    they are merged with the stored ones. Rows whose count_column drops to zero are deleted.
+    """
+    if not deltas:
+        return
+    table = model.__table__
+    keys = list(table.primary_key.columns)
+    existing = {tuple(row[:len(keys)]): row[len(keys):] for row in db.session.execute(
+        db.select(*keys, *(table.c[name] for name in json_columns)).where(
+            *(column.in_({key[i] for key in deltas}) for i, column in enumerate(keys))))}
+    columns = [name for name in next(iter(deltas.values())) if name not in json_columns]
+    
+    updates = [{**{f'key_{column.name}': value for column, value in zip(keys, key)},
+                **{f'add_{name}': values[name] for name in columns},
+                **{f'set_{name}': _merge_counts(stored, values[name]) for name, stored in zip(json_columns, existing[key])}}
+               for key, values in deltas.items() if key in existing]
+    if updates:
+        db.session.execute(
+            db.update(table)
+            .where(*(column == db.bindparam(f'key_{column.name}') for column in keys))
+            .values({**{name: table.c[name] + db.bindparam(f'add_{name}') for name in columns},
+                     **{name: db.bindparam(f'set_{name}', type_=table.c[name].type) for name in json_columns}}),
+            updates
+        )
+    inserts = [{**{column.name: value for column, value in zip(keys, key)},
+                **{name: _merge_counts({}, value) if name in json_columns else value for name, value in values.items()}}
+               for key, values in deltas.items() if key not in existing]
+    if inserts:
+        db.session.execute(db.insert(table), inserts)
+    if any(values[count_column] < 0 for values in deltas.values()):
+        db.session.execute(db.delete(table).where(
+            keys[0].in_({key[0] for key in deltas}), table.c[count_column] <= 0))
+
+def _apply_head_to_head(lines, sign):
+    # Add (sign=1) or subtract (sign=-1) every pairing found in the given games' stat lines
+    lines_by_game = {}
+    for line in lines:
+        lines_by_game.setdefault(line.game_id, []).append(line)
+    
+    deltas = {}
+    for game_lines in lines_by_game.values():
+        for own in game_lines:
+            for other in game_lines:
+                if own.player_id == other.player_id:
+                    continue
+                delta = deltas.setdefault((own.player_id, other.player_id),
+                                          {'games': 0, 'wins': 0, 'points_for': 0, 'points_against': 0})
+                delta['games'] += sign
+                delta['wins'] += sign if own.position < other.position else 0
+                delta['points_for'] += sign * own.points
+                delta['points_against'] += sign * other.points
+    _add_to_counters(HeadToHead, deltas, 'games')
+
+def _apply_daily_stats(lines, sign):
+    # Add (sign=1) or subtract (sign=-1) stat lines from the rollups of the days their games ended
+    deltas = {}
+    for line in lines:
+        delta = deltas.setdefault((line.player_id, line.ended_at.date()), dict.fromkeys(PERIOD_COUNTERS, 0))
+        delta['games_played'] += sign
+        delta['wins'] += sign if line.position == 1 else 0
+        delta['total_points'] += sign * (line.points or 0)
+        delta['rounds_played'] += sign * (line.rounds_played or 0)
+        delta['total_guesses'] += sign * (line.guesses or 0)
+        delta['correct_guesses'] += sign * (line.correct_guesses or 0)
+    _add_to_counters(PlayerDailyStats, deltas, 'games_played')
+
+def _insert_stat_lines(lines):
+    # One executemany instead of an INSERT per seat
+    if not lines:
+        return
+    columns = [column.key for column in PlayerGameStats.__table__.columns if column.key != 'id']
+    db.session.execute(db.insert(PlayerGameStats), [{key: getattr(line, key) for key in columns} for line in lines])
+
+def record_game_stats(game_id):
+    """Fold a finished game into the player statistics store (caller commits)."""
+    db.session.flush()
+    lines = compute_game_stat_lines([game_id])
+    _insert_stat_lines(lines)
+    _apply_stat_lines(lines, 1)
+    _apply_head_to_head(lines, 1)
+
+def discard_game_stats(game_id):
+    """Remove a game's contribution from the player statistics store (caller commits)."""
+    lines = PlayerGameStats.query.filter_by(game_id=game_id).all()
+    if not lines:
+        return
+    _apply_stat_lines(lines, -1)
+    _apply_head_to_head(lines, -1)
+    PlayerGameStats.query.filter_by(game_id=game_id).delete()
+
+def rebuild_player_stats(batch_size=500, progress=None, should_stop=None):
+    """Regenerate the whole player statistics store from RoundResult rows.
+    
+    Each batch of games has its stat lines replaced in its own short transaction, so game writes
+    carry on in between; the aggregates are then summed from the lines in one last transaction.
+    progress(done, total) is called after every batch. When should_stop() turns true the remaining
+    batches are skipped; the aggregates are still summed. Returns the number of games rebuilt.
+    """
+    finished = db.select(Game.id).where(Game.is_active == False)
+    total = db.session.execute(db.select(db.func.count()).select_from(finished.subquery())).scalar()
+    done = 0
+    last_id = 0
+    while True:
+        batch = db.session.execute(finished.where(Game.id > last_id).order_by(Game.id).limit(batch_size)).scalars().all()
+        if not batch:
+            break
+        last_id = batch[-1]
+        
+        with _write_lock:
+            # Deleting first takes the database write lock before the results are read
+            db.session.execute(db.delete(PlayerGameStats).where(PlayerGameStats.game_id.in_(batch)))
+            _insert_stat_lines(compute_game_stat_lines(batch))
+            touch_players(db.select(GamePlayer.player_id).where(GamePlayer.game_id.in_(batch)))
+            db.session.commit()
+        
+        done += len(batch)
+        if progress:
+            progress(done, max(done, total))
+        if should_stop and should_stop():
+            break
+    
+    with _write_lock:
+        _sum_stat_lines()
+        db.session.commit()
+    return done
+
+def _sum_stat_lines():
+    # Refill the aggregates from all stat lines, one INSERT ... SELECT per table (caller commits)
+    db.session.execute(db.delete(PlayerGameStats).where(
+        PlayerGameStats.game_id.in_(db.select(Game.id).where(Game.is_active == True))))
+    db.session.execute(db.delete(PlayerStats))
+    db.session.execute(db.delete(PlayerDailyStats))
+    db.session.execute(db.delete(HeadToHead))
+    
+    by_position = db.select(
+        PlayerGameStats.player_id,
+        PlayerGameStats.position,
+        db.func.count().label('games'),
+        db.func.coalesce(db.func.sum(PlayerGameStats.points), 0).label('points'),
+        db.func.coalesce(db.func.sum(PlayerGameStats.rounds_played), 0).label('rounds_played'),
+        db.func.coalesce(db.func.sum(PlayerGameStats.guesses), 0).label('guesses'),
+        db.func.coalesce(db.func.sum(PlayerGameStats.correct_guesses), 0).label('correct_guesses'),
+    ).group_by(PlayerGameStats.player_id, PlayerGameStats.position).subquery()
+    db.session.execute(db.insert(PlayerStats).from_select(
+        ['player_id', 'games_played', 'wins', 'total_points', 'rounds_played', 'total_guesses', 'correct_guesses',
+         'position_counts'],
+        db.select(
+            by_position.c.player_id,
+            db.func.sum(by_position.c.games),
+            db.func.sum(db.case((by_position.c.position == 1, by_position.c.games), else_=0)),
+            db.func.sum(by_position.c.points),
+            db.func.sum(by_position.c.rounds_played),
+            db.func.sum(by_position.c.guesses),
+            db.func.sum(by_position.c.correct_guesses),
+            db.func.json_group_object(db.cast(by_position.c.position, db.String), by_position.c.games),
+        ).group_by(by_position.c.player_id)))
+    
+    day = db.func.date(PlayerGameStats.ended_at)
+    db.session.execute(db.insert(PlayerDailyStats).from_select(
+        ['player_id', 'day', *PERIOD_COUNTERS],
+        db.select(
+            PlayerGameStats.player_id,
+            day,
+            db.func.count(),
+            db.func.sum(db.case((PlayerGameStats.position == 1, 1), else_=0)),
+            db.func.coalesce(db.func.sum(PlayerGameStats.points), 0),
+            db.func.coalesce(db.func.sum(PlayerGameStats.rounds_played), 0),
+            db.func.coalesce(db.func.sum(PlayerGameStats.guesses), 0),
+            db.func.coalesce(db.func.sum(PlayerGameStats.correct_guesses), 0),
+        ).where(PlayerGameStats.ended_at.isnot(None)).group_by(PlayerGameStats.player_id, day)))
+    
+    own, other = db.aliased(PlayerGameStats), db.aliased(PlayerGameStats)
+    db.session.execute(db.insert(HeadToHead).from_select(
+        ['player_id', 'opponent_id', 'games', 'wins', 'points_for', 'points_against'],
+        db.select(
+            own.player_id,
+            other.player_id,
+            db.func.count(),
+            db.func.sum(db.case((own.position < other.position, 1), else_=0)),
+            db.func.coalesce(db.func.sum(own.points), 0),
+            db.func.coalesce(db.func.sum(other.points), 0),
+        ).join(other, db.and_(other.game_id == own.game_id, other.player_id != own.player_id))
+        .group_by(own.player_id, other.player_id)))
+    touch_players()
+
+# Period statistics
+# Finished games are also summed per player and UTC day of their end (PlayerDailyStats), so
+# statistics and leaderboards over any date range add up at most one row per player and day
+# instead of reading the game history.
+PERIOD_COUNTERS = ('games_played', 'wins', 'total_points', 'rounds_played', 'total_guesses', 'correct_guesses')
+LEADERBOARD_PERIODS = ('week', 'month', 'year', 'last-30-days')
+LEADERBOARD_SORTS = ('wins', 'points', 'average_points', 'accuracy')
+RECENT_STATS_DAYS = 30
+
+def period_bounds(period, day):
+    """First and last day (inclusive) of the week (from Monday), month or year containing day,
+    or of the 30 days ending on it."""
+    if period == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if period == 'month':
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    if period == 'year':
+        return day.replace(month=1, day=1), day.replace(month=12, day=31)
+    if period == 'last-30-days':
+        return day - timedelta(days=RECENT_STATS_DAYS - 1), day
+    raise ValueError(f'Unknown period {period!r}; use one of {", ".join(LEADERBOARD_PERIODS)}')
+
+def _period_totals():
+    return {name: db.func.sum(getattr(PlayerDailyStats, name)) for name in PERIOD_COUNTERS}
+
+def _period_summary(row):
+    summary = {name: int(getattr(row, name) or 0) for name in PERIOD_COUNTERS}
+    games = summary['games_played']
+    summary['win_rate'] = summary['wins'] / games * 100 if games else 0
+    summary['average_points'] = summary['total_points'] / games if games else 0
+    summary['accuracy'] = (summary['correct_guesses'] / summary['total_guesses'] * 100
+                           if summary['total_guesses'] else 0)
+    return summary
+
+def period_stats(player_id, start, end):
+    """One player's totals over the games that ended from start to end (dates, inclusive)."""
+    totals = _period_totals()
+    row = db.session.execute(
+        db.select(*(total.label(name) for name, total in totals.items()))
+        .where(PlayerDailyStats.player_id == player_id, PlayerDailyStats.day.between(start, end))
+    ).one()
+    return _period_summary(row)
+
+def period_leaderboard(start, end, sort='wins', min_games=1, limit=None):
+    """Players with at least min_games finished from start to end, best first, with their totals."""
+    if sort not in LEADERBOARD_SORTS:
+        raise ValueError(f'Unknown sort {sort!r}; use one of {", ".join(LEADERBOARD_SORTS)}')
+    totals = _period_totals()
+    average_points = totals['total_points'] * 1.0 / totals['games_played']
+    accuracy = totals['correct_guesses'] * 1.0 / db.func.nullif(totals['total_guesses'], 0)
+    order = {
+        'wins': (totals['wins'].desc(), average_points.desc()),
+        'points': (totals['total_points'].desc(),),
+        'average_points': (average_points.desc(),),
+        'accuracy': (accuracy.desc(), totals['games_played'].desc()),
+    }[sort]
+    statement = (
+        db.select(PlayerDailyStats.player_id, Player.nickname, *(total.label(name) for name, total in totals.items()))
+        .join(Player, Player.id == PlayerDailyStats.player_id)
+        .where(PlayerDailyStats.day.between(start, end))
+        .group_by(PlayerDailyStats.player_id, Player.nickname)
+        .having(totals['games_played'] >= max(1, min_games))
+        .order_by(*order, Player.nickname)
+        .limit(limit)
+    )
+    return [dict(_period_summary(row), player_id=row.player_id, nickname=row.nickname)
+            for row in db.session.execute(statement)]
+
+# Skill ratings
+# Multiplayer Elo: a game counts as a match between every pair of seats, ranked by points.
+# Games are rated in (ended_at, game_id) order, the same key PlayerGameStats uses.
+RATING_START = 1500.0
+RATING_K = 32.0
+
+def rating_deltas(ratings, points):
+    """Rating change per player for one game, given ratings and final points by player id."""
+    n_players = len(points)
+    if n_players < 2:
+        return {player_id: 0.0 for player_id in points}
+    
+    deltas = {}
+    for player_id, own_points in points.items():
+        score = 0.0
+        expected = 0.0
+        for other_id, other_points in points.items():
+            if other_id == player_id:
+                continue
+            expected += 1 / (1 + 10 ** ((ratings[other_id] - ratings[player_id]) / 400))
+            score += 1.0 if own_points > other_points else 0.5 if own_points == other_points else 0.0
+        deltas[player_id] = RATING_K * (score - expected) / (n_players - 1)
+    return deltas
+
+def _rating_key_filter(column_ended_at, column_game_id, ended_at, game_id):
+    # Rows at or after (ended_at, game_id)
+    return db.or_(column_ended_at > ended_at, db.and_(column_ended_at == ended_at, column_game_id >= game_id))
+
+def _replay_ratings(lines, ratings, games_rated, batch_size):
+    # Apply games in order from a stream of stat lines sorted by game; returns the players touched
+    touched = set()
+    history = []
+    for game_id, game_lines in itertools.groupby(lines, key=lambda line: line.game_id):
+        game_lines = list(game_lines)
+        before = {line.player_id: ratings.get(line.player_id, RATING_START) for line in game_lines}
+        deltas = rating_deltas(before, {line.player_id: line.points for line in game_lines})
+        for line in game_lines:
+            ratings[line.player_id] = before[line.player_id] + deltas[line.player_id]
+            games_rated[line.player_id] = games_rated.get(line.player_id, 0) + 1
+            touched.add(line.player_id)
+            history.append({
+                'player_id': line.player_id,
+                'game_id': game_id,
+                'ended_at': line.ended_at,
+                'rating_before': before[line.player_id],
+                'rating_after': ratings[line.player_id]
+            })
+        if len(history) >= batch_size:
+            db.session.execute(db.insert(RatingHistory), history)
+            history = []
+    if history:
+        db.session.execute(db.insert(RatingHistory), history)
+    return touched
+
+def _store_ratings(player_ids, ratings, games_rated):
+    # One executemany UPDATE for rated players and one INSERT for new ones, however many changed
+    if not player_ids:
+        return
+    touch_players(player_ids)
+    existing = set(db.session.execute(
+        db.select(PlayerRating.player_id).where(PlayerRating.player_id.in_(player_ids))).scalars())
+    rows = [{'player_id': player_id, 'rating': ratings.get(player_id, RATING_START),
+             'games_rated': games_rated.get(player_id, 0)} for player_id in player_ids]
+    if existing:
+        db.session.execute(db.update(PlayerRating), [row for row in rows if row['player_id'] in existing])
+    if len(existing) < len(rows):
+        db.session.execute(db.insert(PlayerRating), [row for row in rows if row['player_id'] not in existing])
+
+def recompute_ratings_from(ended_at=None, game_id=0, batch_size=1000, until=None):
+    """Replay ratings for every game at or after (ended_at, game_id); everything when ended_at is None.
+    
+    With until, an (ended_at, game_id) key, only the games before it are replayed and the current
+    ratings are left alone; rebuild_ratings replays a slice at a time that way.
+    """
+    if ended_at is None:
+        affected = {player_id for (player_id,) in db.session.query(PlayerRating.player_id)}
+        history_filter = db.true()
+        lines_filter = db.true()
+    else:
+        history_filter = _rating_key_filter(RatingHistory.ended_at, RatingHistory.game_id, ended_at, game_id)
+        affected = {player_id for (player_id,) in db.session.query(RatingHistory.player_id).filter(history_filter).distinct()}
+        lines_filter = _rating_key_filter(PlayerGameStats.ended_at, PlayerGameStats.game_id, ended_at, game_id)
+    if until is not None:
+        history_filter = db.and_(history_filter, db.not_(_rating_key_filter(RatingHistory.ended_at, RatingHistory.game_id, *until)))
+        lines_filter = db.and_(lines_filter, db.not_(_rating_key_filter(PlayerGameStats.ended_at, PlayerGameStats.game_id, *until)))
+    RatingHistory.query.filter(history_filter).delete(synchronize_session=False)
+    if ended_at is None:
+        ratings, games_rated = {}, {}
+    else:
+        # Each player's rating as of the last game before the replay point
+        ratings, games_rated = _latest_ratings(db.not_(
+            _rating_key_filter(RatingHistory.ended_at, RatingHistory.game_id, ended_at, game_id)))
+    
+    # Stream the stat lines in rating order
+    lines = (PlayerGameStats.query.filter(lines_filter)
+             .with_entities(PlayerGameStats.game_id, PlayerGameStats.player_id, PlayerGameStats.ended_at, PlayerGameStats.points)
+             .order_by(PlayerGameStats.ended_at, PlayerGameStats.game_id, PlayerGameStats.position)
+             .yield_per(batch_size))
+    affected |= _replay_ratings(lines, ratings, games_rated, batch_size)
+    if until is None:
+        _store_ratings(affected, ratings, games_rated)
+
+def _latest_ratings(history_filter=db.true()):
+    # Each player's rating after their last game in the matching history, and the number of games rated
+    ranked = db.session.query(
+        RatingHistory.player_id,
+        RatingHistory.rating_after,
+        db.func.row_number().over(partition_by=RatingHistory.player_id,
+                                  order_by=(RatingHistory.ended_at.desc(), RatingHistory.game_id.desc())).label('recency'),
+        db.func.count().over(partition_by=RatingHistory.player_id).label('games_rated'),
+    ).filter(history_filter).subquery()
+    latest = db.session.query(ranked.c.player_id, ranked.c.rating_after, ranked.c.games_rated).filter(ranked.c.recency == 1).all()
+    return ({player_id: rating for player_id, rating, _ in latest},
+            {player_id: count for player_id, _, count in latest})
+
+def rebuild_ratings(batch_size=1000, progress=None, should_stop=None):
+    """Replay every rating from the first finished game, batch_size games per transaction.
+    
+    Game writes carry on between the batches: a game rated meanwhile before the batch reached
+    replays everything after it as usual, later ones are replayed when their batch comes. The
+    current ratings are stored in one last transaction. progress(done, total) is called after every
+    batch; when should_stop() turns true the ratings and their history are left as they are.
+    Returns the number of players rated.
+    """
+    key = db.tuple_(PlayerGameStats.ended_at, PlayerGameStats.game_id)
+    keys = db.select(PlayerGameStats.ended_at, PlayerGameStats.game_id).distinct().order_by(
+        PlayerGameStats.ended_at, PlayerGameStats.game_id)
+    total = db.session.execute(db.select(db.func.count(db.distinct(PlayerGameStats.game_id)))).scalar()
+    start = (None,)
+    done = 0
+    while True:
+        # The batch ends where the next one starts: batch_size games on, walked along the index
+        following = keys if start == (None,) else keys.where(key >= db.tuple_(*start))
+        until = db.session.execute(following.offset(batch_size).limit(1)).first()
+        if until is None:
+            break
+        until = tuple(until)
+        with _write_lock:
+            recompute_ratings_from(*start, batch_size=batch_size, until=until)
+            db.session.commit()
+        start = until
+        done += batch_size
+        if progress:
+            progress(done, max(done, total))
+        if should_stop and should_stop():
+            return None
+    
+    with _write_lock:
+        recompute_ratings_from(*start, batch_size=batch_size)
+        # Players whose last game came before the final batch
+        ratings, games_rated = _latest_ratings()
+        player_ids = set(ratings) | {player_id for (player_id,) in db.session.query(PlayerRating.player_id)}
+        _store_ratings(player_ids, ratings, games_rated)
+        db.session.commit()
+    if progress:
+        progress(max(done, total), max(done, total))
+    return len(player_ids)
+
+def update_ratings(game_id):
+    """Rate a game that has just been recorded in the statistics store (caller commits)."""
+    lines = PlayerGameStats.query.filter_by(game_id=game_id).order_by(PlayerGameStats.position).all()
+    if not lines:
+        return
+    ended_at = lines[0].ended_at
+    
+    # Usually the newest game; anything rated after it has to be replayed
+    later_rated = db.session.query(RatingHistory.query.filter(
+        _rating_key_filter(RatingHistory.ended_at, RatingHistory.game_id, ended_at, game_id)).exists()).scalar()
+    if later_rated:
+        recompute_ratings_from(ended_at, game_id)
+        return
+    
+    current = {r.player_id: r for r in PlayerRating.query.filter(PlayerRating.player_id.in_([l.player_id for l in lines]))}
+    ratings = {player_id: r.rating for player_id, r in current.items()}
+    games_rated = {player_id: r.games_rated or 0 for player_id, r in current.items()}
+    touched = _replay_ratings(lines, ratings, games_rated, batch_size=len(lines))
+    _store_ratings(touched, ratings, games_rated)
+
+def game_rating_key(game):
+    return (game.ended_at or game.created_at, game.id)
+
+@bp.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    """Recompute all skill ratings from the finished games, oldest first."""
+    print(f'Rated {rebuild_ratings()} players')
+
+# Bulk deletion
+def purge_games(game_ids=None, older_than=None, deck_type=None, include_active=False, chunk_size=500, progress=None,
+                should_stop=None):
+    """Delete games in chunks, each in its own short transaction. Returns the number deleted.
+    
+    When should_stop() turns true the remaining chunks are skipped; ratings are still replayed.
+    """
+    selection = db.select(Game.id)
+    if game_ids is not None:
+        selection = selection.where(Game.id.in_(game_ids))
+    if older_than is not None:
+        selection = selection.where(db.func.coalesce(Game.ended_at, Game.created_at) < older_than)
+    if deck_type:
+        selection = selection.where(Game.deck_type == deck_type)
+    if not include_active:
+        selection = selection.where(Game.is_active == False)
+    
+    deleted = 0
+    last_id = 0
+    replay_from = None
+    while True:
+        chunk = db.session.execute(selection.where(Game.id > last_id).order_by(Game.id).limit(chunk_size)).scalars().all()
+        if not chunk:
+            break
+        last_id = chunk[-1]
+        
+        with _write_lock:
+            # Retract the chunk's stat lines, then let the cascades remove the rest
+            lines = db.session.query(
+                PlayerGameStats.game_id, PlayerGameStats.player_id, PlayerGameStats.position, PlayerGameStats.points,
+                PlayerGameStats.rounds_played, PlayerGameStats.guesses, PlayerGameStats.correct_guesses,
+                PlayerGameStats.ended_at
+            ).filter(PlayerGameStats.game_id.in_(chunk)).all()
+            _apply_stat_lines(lines, -1)
+            _apply_head_to_head(lines, -1)
+            if lines:
+                earliest = min(line.ended_at for line in lines)
+                replay_from = earliest if replay_from is None else min(replay_from, earliest)
+            if include_active:
+                # Deleted active games leave their players' pages too
+                touch_players(db.select(GamePlayer.player_id).where(GamePlayer.game_id.in_(chunk)))
+            db.session.execute(db.delete(Game).where(Game.id.in_(chunk)).execution_options(synchronize_session=False))
+            db.session.commit()
+        
+        for game_id in chunk:
+            game_events.publish(game_id, 'deleted', {'game_id': game_id})
+        deleted += len(chunk)
+        if progress:
+            progress(deleted)
+        if should_stop and should_stop():
+            break
+    
+    # Ratings after the oldest purged game no longer hold
+    if replay_from is not None:
+        with _write_lock:
+            recompute_ratings_from(replay_from)
+            db.session.commit()
+    return deleted
+
+@bp.cli.command('purge-games')
+@click.option('--ids', help='Comma-separated game ids')
+@click.option('--older-than-days', type=int, help='Only games that ended more than this many days ago')
+@click.option('--deck', type=click.Choice(['single', 'double']), help='Only games with this deck type')
+@click.option('--include-active', is_flag=True, help='Also delete games that are still running')
+@click.option('--chunk-size', default=500, show_default=True)
+def purge_games_command(ids, older_than_days, deck, include_active, chunk_size):
+    """Delete many games at once."""
+    game_ids = [int(game_id) for game_id in ids.split(',')] if ids else None
+    older_than = datetime.utcnow() - timedelta(days=older_than_days) if older_than_days is not None else None
+    if game_ids is None and older_than is None and not deck:
+        raise click.UsageError('Give --ids, --older-than-days or --deck')
+    deleted = purge_games(game_ids, older_than, deck, include_active, chunk_size,
+                          progress=lambda n: print(f'  {n} games deleted'))
+    print(f'Purged {deleted} games')
+
+@bp.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Rebuild the materialized player statistics."""
+    n_games = rebuild_player_stats()
+    print(f'Rebuilt player statistics from {n_games} finished games')
+
+# Game rules
+# Schedule, scoring and validation live in rules.py. Every change to a game goes through
+# claim_game, so two writers can never both build on the same version of it.
+class GameConflict(Exception):
+    """The game or round changed after the page that submitted a write was loaded."""
+    
+    def __init__(self):
+        super().__init__('This game was changed from another device in the meantime. '
+                         'Check the current state and submit again.')
+
+class DuplicateSubmission(Exception):
+    """A form was posted again after its first copy had already been applied."""
+    
+    def __init__(self, game_id):
+        super().__init__(f'Submission already applied to game {game_id}')
+        self.game_id = game_id
+
+def claim_game(game):
+    """Bump the game's version, if it is still the one loaded, before changing the game (caller commits).
+    
+    A compare-and-swap: the UPDATE matches no row once another write has moved the version on,
+    and then GameConflict is raised. On SQLite it is the first write of the transaction, so it also
+    takes the write lock before the game's state is read.
+    """
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        db.update(Game).where(Game.id == game.id, Game.version == game.version)
+        .values(version=Game.version + 1, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if claimed.rowcount != 1:
+        raise GameConflict()
+    # In step with the row, without a second UPDATE at flush
+    set_committed_value(game, 'version', game.version + 1)
+    set_committed_value(game, 'updated_at', now)
+
+def touch_games(game_ids):
+    """Bump the version of many games in one statement; game_ids may be a list or a select (caller commits)."""
+    db.session.execute(db.update(Game).where(Game.id.in_(game_ids))
+                       .values(version=Game.version + 1, updated_at=datetime.utcnow())
+                       .execution_options(synchronize_session=False))
+
+def touch_players(player_ids=None):
+    """Mark player pages as changed: statistics, ratings or active games moved (caller commits).
+    
+    player_ids may be a list or a select; None touches every player. The players are collected
+    and bumped in a single UPDATE when the session commits, however often a request calls this.
+    """
+    touched = db.session.info.setdefault('touched_players', {'ids': set(), 'selects': [], 'all': False})
+    if player_ids is None:
+        touched['all'] = True
+    elif isinstance(player_ids, Select):
+        touched['selects'].append(player_ids)
+    else:
+        touched['ids'].update(player_ids)
+
+@event.listens_for(db.session, 'before_commit')
+def _bump_touched_players(session):
+    touched = session.info.pop('touched_players', None)
+    if touched is None:
+        return
+    statement = db.update(Player).values(version=Player.version + 1, updated_at=datetime.utcnow())
+    if not touched['all']:
+        statement = statement.where(db.or_(Player.id.in_(touched['ids']),
+                                           *(Player.id.in_(select) for select in touched['selects'])))
+    session.execute(statement.execution_options(synchronize_session=False))
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_touched_players(session, previous_transaction):
+    session.info.pop('touched_players', None)
+
+# Game event log
+# Routes turn requests into events. apply_game_event checks each one against the game's
+# rules state, appends it to the log and projects the change onto the tables everything
+# else reads. Games recorded before the log existed are adopted on their first change.
+GAME_SNAPSHOT_INTERVAL = 20  # Events between saved states
+GAME_EVENT_PROJECTIONS = {}
+
+def projection(event_type):
+    def register(func):
+        GAME_EVENT_PROJECTIONS[event_type] = func
+        return func
+    return register
+
+def _adopted_state(game):
+    """Rules state of a game built from its rows."""
+    player_ids = db.session.execute(
+        db.select(GamePlayer.player_id).filter_by(game_id=game.id).order_by(GamePlayer.id)).scalars().all()
+    seats = {player_id: seat for seat, player_id in enumerate(player_ids)}
+    rounds = {}
+    for number, cards, completed, player_id, guess, hits, points in db.session.execute(
+            db.select(Round.round_number, Round.cards_per_player, Round.is_completed,
+                      RoundResult.player_id, RoundResult.guess, RoundResult.hits, RoundResult.points)
+            .outerjoin(RoundResult, RoundResult.round_id == Round.id)
+            .where(Round.game_id == game.id)
+            .order_by(Round.round_number)):
+        if number not in rounds:
+            empty = [None] * len(player_ids)
+            rounds[number] = [number, cards, bool(completed), list(empty), list(empty), list(empty)]
+        if player_id in seats:
+            seat = seats[player_id]
+            rounds[number][3][seat], rounds[number][4][seat], rounds[number][5][seat] = guess, hits, points
+    return {
+        'player_ids': player_ids,
+        'deck_type': game.deck_type or 'single',
+        'force_conflict': game.force_conflict if game.force_conflict is not None else True,
+        'max_rounds': game.max_rounds,
+        'dealer_index': game.current_dealer_index or 0,
+        'is_active': bool(game.is_active),
+        'ended_early': bool(game.ended_early),
+        'rounds': list(rounds.values()),
+    }
+
+def _append_game_event(game_id, state, event, submission_id=None):
+    db.session.execute(db.insert(GameEvent).values(game_id=game_id, seq=state.seq, event_type=event['type'],
+                                                   payload=event, created_at=datetime.utcnow(),
+                                                   submission_id=submission_id))
+    if state.seq % GAME_SNAPSHOT_INTERVAL == 0:
+        db.session.execute(db.delete(GameSnapshot).filter_by(game_id=game_id))
+        db.session.execute(db.insert(GameSnapshot).values(game_id=game_id, seq=state.seq, state=state.to_dict()))
+
+def load_game_state(game):
+    """Latest snapshot plus the events after it, read in one query and replayed."""
+    snapshot_seq = db.select(GameSnapshot.seq).where(GameSnapshot.game_id == game.id).scalar_subquery()
+    rows = db.session.execute(
+        db.union_all(
+            db.select(GameSnapshot.seq, GameSnapshot.state.label('data'), db.literal(True).label('is_snapshot'))
+            .where(GameSnapshot.game_id == game.id),
+            db.select(GameEvent.seq, GameEvent.payload.label('data'), db.literal(False).label('is_snapshot'))
+            .where(GameEvent.game_id == game.id, GameEvent.seq > db.func.coalesce(snapshot_seq, 0))
+        ).order_by('seq')
+    ).all()
+    if not rows:
+        state = GameState().apply({'type': 'game_adopted', 'state': _adopted_state(game)})
+        _append_game_event(game.id, state, {'type': 'game_adopted', 'state': state.to_dict()})
+        return state
+    snapshot = rows[0].data if rows[0].is_snapshot else None
+    return GameState.replay([row.data for row in rows if not row.is_snapshot], snapshot)
+
+def submitted_game_id(submission_id):
+    """The game a form with this idempotency token was already applied to, or None."""
+    if not submission_id:
+        return None
+    return db.session.execute(db.select(GameEvent.game_id).filter_by(submission_id=submission_id)).scalar()
+
+def apply_game_event(game, event, submission_id=None, expected_rounds=(), **rows):
+    """Validate and record one event, then update the game's rows. Raises RuleError if the rules forbid it.
+    
+    submission_id is the submitted form's idempotency token and expected_rounds pairs the rounds it
+    changes with the versions the form was built from. Raises DuplicateSubmission if the token was
+    applied already and GameConflict if the game or one of those rounds has changed since; nothing
+    of a rejected event is kept. rows passes objects the route already loaded on to the projection.
+    Returns the live update delta.
+    """
+    try:
+        duplicate_of = submitted_game_id(submission_id)
+        if duplicate_of is not None:
+            raise DuplicateSubmission(duplicate_of)
+        if any(expected is not None and round_obj.version != expected for round_obj, expected in expected_rounds):
+            raise GameConflict()
+        if event['type'] != 'game_created':
+            try:
+                claim_game(game)
+            except GameConflict:
+                # Another worker may have just applied a copy of this very form
+                duplicate_of = submitted_game_id(submission_id)
+                if duplicate_of is not None:
+                    raise DuplicateSubmission(duplicate_of) from None
+                raise
+        state = GameState() if event['type'] == 'game_created' else load_game_state(game)
+        state.apply(event)
+    except (RuleError, GameConflict, DuplicateSubmission):
+        # Release the claimed game at once
+        db.session.rollback()
+        raise
+    _append_game_event(game.id, state, event, submission_id)
+    return GAME_EVENT_PROJECTIONS[event['type']](game, state, event, **rows)
+
+@projection('game_created')
+def _project_game_created(game, state, event):
+    game.max_rounds = state.max_rounds
+    game.current_round = 1
+    game.current_dealer_index = state.dealer_index
+    db.session.add_all([GamePlayer(game_id=game.id, player_id=player_id) for player_id in state.player_ids])
+    db.session.add(Round(game_id=game.id, round_number=1, cards_per_player=state.current.cards))
+    # The game shows up among their active games
+    touch_players(state.player_ids)
+    return {}
+
+@projection('guesses_set')
+def _project_guesses_set(game, state, event, round_obj):
+    # Guesses are re-submitted as a whole: upsert the given ones, drop those of seats left blank
+    guesses = {player_id: guess for player_id, guess in zip(state.player_ids, state.current.guesses)
+               if guess is not None}
+    if len(guesses) < len(state.player_ids):
+        db.session.execute(db.delete(RoundResult).where(RoundResult.round_id == round_obj.id,
+                                                        RoundResult.player_id.not_in(list(guesses))))
+    if guesses:
+        upsert = sqlite_insert(RoundResult)
+        db.session.execute(upsert.on_conflict_do_update(index_elements=['round_id', 'player_id'],
+                                                        set_={'guess': upsert.excluded.guess}),
+                           [{'round_id': round_obj.id, 'player_id': player_id, 'guess': guess}
+                            for player_id, guess in guesses.items()])
+    
+    # Set started_at timestamp if this is the first round and game hasn't started yet
+    if round_obj.round_number == 1 and not game.started_at:
+        game.started_at = datetime.now(timezone.utc)
+    
+    round_obj.version += 1
+    return {
+        'version': game.version,
+        'round_number': round_obj.round_number,
+        'guesses': {str(player_id): guess for player_id, guess in guesses.items()}
+    }
+
+@projection('results_set')
+def _project_results_set(game, state, event, round_obj):
+    round_state = state.round_state(round_obj.round_number)
+    submitted = {state.seats[player_id] for player_id, _ in event['hits']}
+    
+    # Write all scored results with one executemany
+    rows = db.session.execute(
+        db.select(RoundResult.id, RoundResult.player_id).filter_by(round_id=round_obj.id)).all()
+    scored = [(result_id, player_id, state.seats[player_id]) for result_id, player_id in rows
+              if state.seats.get(player_id) in submitted and round_state.hits[state.seats[player_id]] is not None]
+    if scored:
+        db.session.execute(db.update(RoundResult), [
+            {'id': result_id, 'hits': round_state.hits[seat], 'points': round_state.points[seat]}
+            for result_id, _, seat in scored
+        ])
+    
+    # Every seat's total in one UPDATE
+    totals = dict(zip(state.player_ids, state.totals))
+    db.session.execute(
+        db.update(GamePlayer)
+        .where(GamePlayer.game_id == game.id)
+        .values(total_points=db.case(totals, value=GamePlayer.player_id, else_=GamePlayer.total_points))
+        .execution_options(synchronize_session=False)
+    )
+    round_obj.is_completed = True
+    round_obj.version += 1
+    
+    delta = {
+        'version': game.version,
+        'round_number': round_obj.round_number,
+        'results': {str(player_id): {'guess': round_state.guesses[seat], 'hits': round_state.hits[seat],
+                                     'points': round_state.points[seat]}
+                    for _, player_id, seat in scored},
+        'totals': {str(player_id): total for player_id, total in totals.items()}
+    }
+    
+    if state.is_active:
+        # Next round, with the dealer moved on; the players' pages show the round reached
+        touch_players(state.player_ids)
+        game.current_round = state.current.number
+        game.current_dealer_index = state.dealer_index
+        db.session.add(Round(game_id=game.id, round_number=state.current.number,
+                             cards_per_player=state.current.cards))
+        delta['next_round'] = {'round_number': game.current_round, 'cards_per_player': state.current.cards,
+                               'dealer_index': game.current_dealer_index}
+    else:
+        # Game finished
+        game.is_active = False
+        game.ended_at = datetime.now(timezone.utc)
+        record_game_stats(game.id)
+        update_ratings(game.id)
+        delta['is_active'] = False
+    return delta
+
+@projection('game_ended_early')
+def _project_game_ended_early(game, state, event):
+    game.is_active = False
+    game.ended_early = True
+    game.ended_at = datetime.now(timezone.utc)
+    record_game_stats(game.id)
+    update_ratings(game.id)
+    return {'version': game.version, 'is_active': False, 'ended_early': True}
+
+@projection('results_edited')
+def _project_results_edited(game, state, event, rounds, results, game_players):
+    rounds_by_number = {round_obj.round_number: round_obj for round_obj in rounds}
+    for number in {cell[0] for cell in event['cells']}:
+        rounds_by_number[number].version += 1
+    for number, player_id, guess, hits in event['cells']:
+        round_obj = rounds_by_number[number]
+        round_result = results.get((round_obj.id, player_id))
+        if not round_result:
+            round_result = RoundResult(round_id=round_obj.id, player_id=player_id)
+            db.session.add(round_result)
+            results[(round_obj.id, player_id)] = round_result
+        round_result.guess = guess
+        round_result.hits = hits
+        round_result.points = state.round_state(number).points[state.seats[player_id]]
+    
+    for round_obj in rounds:
+        if state.round_state(round_obj.round_number).completed and not round_obj.is_completed:
+            round_obj.is_completed = True
+    for game_player in game_players:
+        total = state.totals[state.seats[game_player.player_id]]
+        if game_player.total_points != total:
+            game_player.total_points = total
+    
+    # Refresh this game's contribution to player statistics
+    if not game.is_active:
+        discard_game_stats(game.id)
+        record_game_stats(game.id)
+        recompute_ratings_from(*game_rating_key(game))
+    
+    return {'version': game.version}
+
+def replayed_state_mismatches(game):
+    """What differs between replaying the game's log and its rows; empty when they agree."""
+    logged = load_game_state(game)
+    stored = GameState.from_dict(_adopted_state(game))
+    mismatches = [name for name in ('player_ids', 'max_rounds', 'dealer_index', 'is_active', 'ended_early', 'totals')
+                  if getattr(logged, name) != getattr(stored, name)]
+    if len(logged.rounds) != len(stored.rounds):
+        mismatches.append('rounds')
+    for ours, theirs in zip(logged.rounds, stored.rounds):
+        if (ours.cards, ours.completed, ours.guesses, ours.hits, ours.points) != \
+                (theirs.cards, theirs.completed, theirs.guesses, theirs.hits, theirs.points):
+            mismatches.append(f'round {ours.number}')
+    return mismatches
+
+@bp.cli.command('verify-game-log')
+def verify_game_log_command():
+    """Replay every game's event log and compare it with the stored rows."""
+    checked = mismatched = 0
+    for game in Game.query.join(GameEvent, GameEvent.game_id == Game.id).distinct().order_by(Game.id):
+        checked += 1
+        mismatches = replayed_state_mismatches(game)
+        if mismatches:
+            mismatched += 1
+            print(f"❌ Game {game.id}: {', '.join(mismatches)}")
+    print(f"Checked {checked} logged games, {mismatched} mismatched")
+
+# Data maintenance
+# Integrity checks run as set-based SQL over one window of ids at a time, so memory use and
+# transaction size stay bounded however large the tables grow. A check returns the number of
+# bad rows in its window and, when repairing, the games whose rounds or results it changed.
+DATA_CHECK_BATCH_SIZE = 10000
+DATA_CHECKS = {}
+
+def data_check(name, window_column):
+    def register(func):
+        DATA_CHECKS[name] = (window_column, func)
+        return func
+    return register
+
+def _id_windows(column, size):
+    # (low, high, last) ranges of at most size values; each starts at the next value present, so gaps cost nothing
+    low, last = db.session.execute(db.select(db.func.min(column), db.func.max(column))).one()
+    while low is not None:
+        high = low + size - 1
+        yield low, min(high, last), last
+        low = db.session.execute(db.select(db.func.min(column)).where(column > high)).scalar()
+
+def _delete_rounds(round_ids):
+    db.session.execute(db.delete(RoundResult).where(RoundResult.round_id.in_(round_ids))
+                       .execution_options(synchronize_session=False))
+    db.session.execute(db.delete(Round).where(Round.id.in_(round_ids)).execution_options(synchronize_session=False))
+
+@data_check('orphan-seats', GamePlayer.id)
+def check_orphan_seats(low, high, repair):
+    """Seats whose game or player no longer exists."""
+    rows = db.session.execute(db.select(GamePlayer.id, GamePlayer.game_id).where(
+        GamePlayer.id.between(low, high),
+        db.or_(~db.exists().where(Game.id == GamePlayer.game_id),
+               ~db.exists().where(Player.id == GamePlayer.player_id)))).all()
+    if repair and rows:
+        db.session.execute(db.delete(GamePlayer).where(GamePlayer.id.in_([row.id for row in rows]))
+                           .execution_options(synchronize_session=False))
+    return len(rows), {row.game_id for row in rows}
+
+@data_check('orphan-rounds', Round.id)
+def check_orphan_rounds(low, high, repair):
+    """Rounds of games that no longer exist."""
+    round_ids = db.session.execute(db.select(Round.id).where(
+        Round.id.between(low, high), ~db.exists().where(Game.id == Round.game_id))).scalars().all()
+    if repair and round_ids:
+        _delete_rounds(round_ids)
+    return len(round_ids), set()
+
+@data_check('orphan-results', RoundResult.id)
+def check_orphan_results(low, high, repair):
+    """Results without a round, or for a player who has no seat in the round's game."""
+    seated = db.exists().where(GamePlayer.game_id == Round.game_id, GamePlayer.player_id == RoundResult.player_id)
+    rows = db.session.execute(
+        db.select(RoundResult.id, Round.game_id)
+        .outerjoin(Round, Round.id == RoundResult.round_id)
+        .where(RoundResult.id.between(low, high), db.or_(Round.id.is_(None), ~seated))).all()
+    if repair and rows:
+        db.session.execute(db.delete(RoundResult).where(RoundResult.id.in_([row.id for row in rows]))
+                           .execution_options(synchronize_session=False))
+    return len(rows), {row.game_id for row in rows if row.game_id is not None}
+
+@data_check('duplicate-rounds', Round.game_id)
+def check_duplicate_rounds(low, high, repair):
+    """More than one round with the same number in a game; the first one is kept."""
+    kept = db.select(db.func.min(Round.id)).where(Round.game_id.between(low, high)) \
+        .group_by(Round.game_id, Round.round_number)
+    rows = db.session.execute(db.select(Round.id, Round.game_id).where(
+        Round.game_id.between(low, high), Round.id.not_in(kept))).all()
+    if repair and rows:
+        _delete_rounds([row.id for row in rows])
+    return len(rows), {row.game_id for row in rows}
+
+@data_check('duplicate-results', RoundResult.round_id)
+def check_duplicate_results(low, high, repair):
+    """More than one result per round and player; the newest one is kept, as guesses used to be re-inserted."""
+    kept = db.select(db.func.max(RoundResult.id)).where(RoundResult.round_id.between(low, high)) \
+        .group_by(RoundResult.round_id, RoundResult.player_id)
+    rows = db.session.execute(
+        db.select(RoundResult.id, Round.game_id)
+        .join(Round, Round.id == RoundResult.round_id)
+        .where(RoundResult.round_id.between(low, high), RoundResult.id.not_in(kept))).all()
+    if repair and rows:
+        db.session.execute(db.delete(RoundResult).where(RoundResult.id.in_([row.id for row in rows]))
+                           .execution_options(synchronize_session=False))
+    return len(rows), {row.game_id for row in rows}
+
+@data_check('round-schedule', Round.game_id)
+def check_round_schedule(low, high, repair):
+    """Rounds numbered outside the game's schedule (deleted) or dealt the wrong number of cards (corrected)."""
+    # cards_for_round() in SQL
+    max_cards = Game.max_rounds // 2 + 1
+    scheduled = db.case((Round.round_number <= max_cards, Round.round_number),
+                        else_=max_cards - (Round.round_number - max_cards))
+    outside = db.or_(Round.round_number < 1, Round.round_number > Game.max_rounds)
+    rows = db.session.execute(
+        db.select(Round.id, Round.game_id, outside.label('outside'), scheduled.label('cards'))
+        .join(Game, Game.id == Round.game_id)
+        .where(Round.game_id.between(low, high), db.or_(outside, Round.cards_per_player != scheduled))).all()
+    if repair and rows:
+        removed = [row.id for row in rows if row.outside]
+        if removed:
+            _delete_rounds(removed)
+        corrected = [{'id': row.id, 'cards_per_player': row.cards} for row in rows if not row.outside]
+        if corrected:
+            db.session.execute(db.update(Round), corrected)
+    return len(rows), {row.game_id for row in rows}
+
+@data_check('result-points', RoundResult.round_id)
+def check_result_points(low, high, repair):
+    """Points that do not follow the scoring rule for the stored guess and hits."""
+    # score_round() in SQL; no points until hits are entered
+    scored = db.case((RoundResult.hits.is_(None), None),
+                     (RoundResult.guess == RoundResult.hits, 10 + 2 * RoundResult.hits),
+                     else_=-2 * db.func.abs(RoundResult.guess - RoundResult.hits))
+    rows = db.session.execute(
+        db.select(RoundResult.id, Round.game_id)
+        .join(Round, Round.id == RoundResult.round_id)
+        .where(RoundResult.round_id.between(low, high), RoundResult.points.is_distinct_from(scored))).all()
+    if repair and rows:
+        db.session.execute(db.update(RoundResult).where(RoundResult.id.in_([row.id for row in rows]))
+                           .values(points=scored).execution_options(synchronize_session=False))
+    return len(rows), {row.game_id for row in rows}
+
+@data_check('game-totals', GamePlayer.game_id)
+def check_game_totals(low, high, repair):
+    """Seats whose total_points differ from the sum of their round points."""
+    sums = (db.select(Round.game_id, RoundResult.player_id, db.func.sum(RoundResult.points).label('points'))
+            .join(RoundResult, RoundResult.round_id == Round.id)
+            .where(Round.game_id.between(low, high))
+            .group_by(Round.game_id, RoundResult.player_id)
+            .subquery())
+    points = db.func.coalesce(sums.c.points, 0)
+    rows = db.session.execute(
+        db.select(GamePlayer.id, GamePlayer.game_id, points.label('points'))
+        .outerjoin(sums, db.and_(sums.c.game_id == GamePlayer.game_id, sums.c.player_id == GamePlayer.player_id))
+        .where(GamePlayer.game_id.between(low, high), GamePlayer.total_points.is_distinct_from(points))).all()
+    if repair and rows:
+        db.session.execute(db.update(GamePlayer), [{'id': row.id, 'total_points': row.points} for row in rows])
+    return len(rows), {row.game_id for row in rows}
+
+@data_check('timestamps', Game.id)
+def check_timestamps(low, high, repair):
+    """Started games without started_at and finished games without ended_at.
+    
+    Both are set to created_at, the time statistics and ratings already order such games by,
+    so nothing else has to be recomputed.
+    """
+    window = Game.id.between(low, high)
+    guessed = db.exists().where(Round.game_id == Game.id).where(
+        db.exists().where(RoundResult.round_id == Round.id))
+    not_started = db.and_(Game.started_at.is_(None), guessed)
+    not_ended = db.and_(Game.is_active == False, Game.ended_at.is_(None))
+    found = db.session.execute(db.select(db.func.count()).where(window, db.or_(not_started, not_ended))).scalar()
+    if repair and found:
+        for condition, column in ((not_started, 'started_at'), (not_ended, 'ended_at')):
+            db.session.execute(db.update(Game).where(window, condition)
+                               .values({column: Game.created_at, 'version': Game.version + 1,
+                                        'updated_at': datetime.utcnow()})
+                               .execution_options(synchronize_session=False))
+    return found, set()
+
+def _refresh_repaired_games(game_ids):
+    """Drop the event logs of repaired games and refresh their statistics; returns the earliest rating key."""
+    games = db.session.execute(db.select(Game.id, Game.is_active, Game.ended_at, Game.created_at)
+                               .where(Game.id.in_(game_ids))).all()
+    if not games:
+        return None
+    ids = [game.id for game in games]
+    # The repaired rows are the truth now; each game starts a new log from them on its next change
+    db.session.execute(db.delete(GameEvent).where(GameEvent.game_id.in_(ids)))
+    db.session.execute(db.delete(GameSnapshot).where(GameSnapshot.game_id.in_(ids)))
+    touch_games(ids)
+    
+    finished = [game for game in games if not game.is_active]
+    if not finished:
+        return None
+    finished_ids = [game.id for game in finished]
+    old_lines = PlayerGameStats.query.filter(PlayerGameStats.game_id.in_(finished_ids)).all()
+    _apply_stat_lines(old_lines, -1)
+    _apply_head_to_head(old_lines, -1)
+    PlayerGameStats.query.filter(PlayerGameStats.game_id.in_(finished_ids)).delete(synchronize_session=False)
+    lines = compute_game_stat_lines(finished_ids)
+    _insert_stat_lines(lines)
+    _apply_stat_lines(lines, 1)
+    _apply_head_to_head(lines, 1)
+    return min((game.ended_at or game.created_at, game.id) for game in finished)
+
+def run_data_checks(names=None, repair=False, batch_size=DATA_CHECK_BATCH_SIZE, progress=None):
+    """Run checks (all by default) window by window; returns the problems found per check.
+    
+    With repair=True every window is fixed and committed on its own, and ratings are replayed
+    once at the end from the earliest game whose results changed.
+    progress(name, position, last, found) is called after every window.
+    """
+    found = {}
+    replay_from = None
+    for name in names or DATA_CHECKS:
+        column, check = DATA_CHECKS[name]
+        found[name] = 0
+        for low, high, last in _id_windows(column, batch_size):
+            if repair:
+                with _write_lock:
+                    count, game_ids = check(low, high, True)
+                    key = _refresh_repaired_games(game_ids) if game_ids else None
+                    db.session.commit()
+                if key is not None:
+                    replay_from = key if replay_from is None else min(replay_from, key)
+            else:
+                count, _ = check(low, high, False)
+                # End the read transaction between windows
+                db.session.commit()
+            found[name] += count
+            if progress:
+                progress(name, high, last, found[name])
+    
+    if replay_from is not None:
+        with _write_lock:
+            recompute_ratings_from(*replay_from)
+            db.session.commit()
+    return found
+
+@bp.cli.group('maintenance')
+def maintenance_cli():
+    """Check and repair the game tables in bounded batches."""
+
+def _print_check_progress():
+    # At most one line a second per check, plus the last window
+    printed = {}
+    def report(name, position, last, found):
+        now = time.monotonic()
+        if position == last or now - printed.get(name, 0) >= 1:
+            printed[name] = now
+            print(f'  {name}: {position}/{last} scanned, {found} found')
+    return report
+
+def _print_check_summary(found, repaired):
+    for name, count in found.items():
+        mark = '✅' if not count else '🔧' if repaired else '❌'
+        print(f"{mark} {name}: {count} {'repaired' if repaired else 'found'} — {DATA_CHECKS[name][1].__doc__.splitlines()[0]}")
+
+def _check_options(command):
+    command = click.option('--batch-size', default=DATA_CHECK_BATCH_SIZE, show_default=True, help='Ids per window')(command)
+    return click.option('--only', 'names', multiple=True, type=click.Choice(list(DATA_CHECKS)),
+                        help='Run only this check (repeatable)')(command)
+
+@maintenance_cli.command('check')
+@_check_options
+def maintenance_check_command(names, batch_size):
+    """Report integrity problems without changing anything; exits with 1 if there are any."""
+    found = run_data_checks(names, repair=False, batch_size=batch_size, progress=_print_check_progress())
+    _print_check_summary(found, repaired=False)
+    if any(found.values()):
+        sys.exit(1)
+
+@maintenance_cli.command('repair')
+@_check_options
+@click.option('--dry-run', is_flag=True, help='Only report what would be repaired')
+def maintenance_repair_command(names, batch_size, dry_run):
+    """Fix integrity problems: orphans, duplicates, off-schedule rounds, points, totals and timestamps."""
+    found = run_data_checks(names, repair=not dry_run, batch_size=batch_size, progress=_print_check_progress())
+    _print_check_summary(found, repaired=not dry_run)
+
+@maintenance_cli.command('backfill-timestamps')
+@click.option('--batch-size', default=DATA_CHECK_BATCH_SIZE, show_default=True, help='Games per window')
+@click.option('--dry-run', is_flag=True, help='Only count the games that would be updated')
+def maintenance_backfill_timestamps_command(batch_size, dry_run):
+    """Set missing started_at and ended_at timestamps."""
+    found = run_data_checks(['timestamps'], repair=not dry_run, batch_size=batch_size,
+                            progress=_print_check_progress())
+    _print_check_summary(found, repaired=not dry_run)
+    
+    summary = db.session.execute(db.select(
+        db.func.count(Game.id),
+        db.func.count(Game.id).filter(Game.is_active == True),
+        db.func.count(Game.started_at),
+        db.func.count(Game.ended_at),
+    )).one()
+    print(f"\n📊 {summary[0]} games ({summary[1]} active), {summary[2]} with started_at, {summary[3]} with ended_at")
+
+# History export and import
+# NDJSON holds one player per line, then one game per line with its seats, rounds and
+# results nested; import_history reads the same format back. CSV writes one table per file.
+EXPORT_BATCH_SIZE = 1000
+EXPORT_TABLES = {'players': Player, 'games': Game, 'game_players': GamePlayer, 'rounds': Round, 'results': RoundResult}
+GAME_EXPORT_FIELDS = ('id', 'created_at', 'started_at', 'ended_at', 'is_active', 'ended_early', 'deck_type',
+                      'force_conflict', 'max_rounds', 'current_round', 'current_dealer_index')
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _streamed(statement):
+    # Rows are fetched in batches so memory stays flat however large the table is; request
+    # metrics do not count them
+    return db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE, count_rows=False))
+
+def _rows_by_game(rows):
+    # Rows start with the game id
+    for game_id, group in itertools.groupby(rows, key=operator.itemgetter(0)):
+        yield game_id, list(group)
+
+def _take_game(game_id, pending, groups):
+    """Rows of one game from a grouped stream ordered by game id; returns (rows, next pending group)."""
+    while pending is not None and pending[0] < game_id:
+        pending = next(groups, None)
+    if pending is not None and pending[0] == game_id:
+        return pending[1], next(groups, None)
+    return [], pending
+
+def _chunked(pieces, size=EXPORT_BATCH_SIZE):
+    """Join small pieces so a streamed response is written in fewer, larger chunks."""
+    batch = []
+    for piece in pieces:
+        batch.append(piece)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+def export_history_ndjson():
+    """Yield the whole history as NDJSON lines, holding one game in memory at a time."""
+    for player in _streamed(db.select(Player.id, Player.nickname, Player.created_at).order_by(Player.id)):
+        yield json.dumps({'type': 'player', 'id': player.id, 'nickname': player.nickname,
+                          'created_at': _export_value(player.created_at)}) + '\n'
+    
+    # Seats and results are streamed alongside the games and merged on game id
+    seats = _rows_by_game(_streamed(
+        db.select(GamePlayer.game_id, GamePlayer.player_id, GamePlayer.total_points)
+        .order_by(GamePlayer.game_id, GamePlayer.id)
+    ))
+    results = _rows_by_game(_streamed(
+        db.select(Round.game_id, Round.round_number, Round.cards_per_player, Round.is_completed,
+                  RoundResult.player_id, RoundResult.guess, RoundResult.hits, RoundResult.points)
+        .outerjoin(RoundResult, RoundResult.round_id == Round.id)
+        .order_by(Round.game_id, Round.round_number, RoundResult.id)
+    ))
+    pending_seats, pending_results = next(seats, None), next(results, None)
+    
+    games = _streamed(db.select(*[getattr(Game, field) for field in GAME_EXPORT_FIELDS]).order_by(Game.id))
+    for game in games:
+        game_seats, pending_seats = _take_game(game.id, pending_seats, seats)
+        game_results, pending_results = _take_game(game.id, pending_results, results)
+        
+        rounds = []
+        for round_number, round_rows in itertools.groupby(game_results, key=operator.itemgetter(1)):
+            round_rows = list(round_rows)
+            rounds.append({
+                'round_number': round_number,
+                'cards_per_player': round_rows[0].cards_per_player,
+                'is_completed': bool(round_rows[0].is_completed),
+                'results': [{'player_id': player_id, 'guess': guess, 'hits': hits, 'points': points}
+                            for _, _, _, _, player_id, guess, hits, points in round_rows if player_id is not None]
+            })
+        record = {'type': 'game', **{field: _export_value(value) for field, value in game._mapping.items()}}
+        record['players'] = [{'player_id': seat.player_id, 'total_points': seat.total_points} for seat in game_seats]
+        record['rounds'] = rounds
+        yield json.dumps(record) + '\n'
+
+class _CSVLine:
+    # csv.writer target that hands back each formatted line instead of storing it
+    def write(self, value):
+        return value
+
+def export_table_csv(table):
+    """Yield one table as CSV lines."""
+    model = EXPORT_TABLES[table]
+    columns = list(model.__table__.columns)
+    writer = csv.writer(_CSVLine())
+    yield writer.writerow([column.key for column in columns])
+    for row in _streamed(db.select(*columns).order_by(model.id)):
+        yield writer.writerow([_export_value(value) for value in row])
+
+def _parse_timestamp(value, line_number, field):
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'line {line_number}: {field} is not an ISO timestamp')
+    # Stored timestamps are naive UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _validate_imported_game(record, player_map, line_number, check_tricks=True):
+    """Check a game record against the rules and compute its totals; returns the rows to insert."""
+    def fail(message):
+        raise ValueError(f'line {line_number}: {message}')
+    
+    seat_ids = [seat.get('player_id') for seat in record.get('players') or []]
+    if len(seat_ids) < 2:
+        fail('a game needs at least 2 players')
+    if len(set(seat_ids)) != len(seat_ids):
+        fail('a player is seated twice')
+    for player_id in seat_ids:
+        if player_id not in player_map:
+            fail(f'unknown player id {player_id}')
+    
+    deck_type = record.get('deck_type', 'single')
+    if deck_type not in DECK_CARDS:
+        fail(f'unknown deck type {deck_type!r}')
+    max_rounds = max_rounds_for(len(seat_ids), deck_type)
+    if record.get('max_rounds', max_rounds) != max_rounds:
+        fail(f'{len(seat_ids)} players with a {deck_type} deck play {max_rounds} rounds, not {record["max_rounds"]}')
+    force_conflict = bool(record.get('force_conflict', True))
+    is_active = bool(record.get('is_active', False))
+    
+    round_records = record.get('rounds') or []
+    if not round_records:
+        fail('a game needs at least one round')
+    if len(round_records) > max_rounds:
+        fail(f'{len(round_records)} rounds recorded but the game only has {max_rounds}')
+    
+    totals = dict.fromkeys(seat_ids, 0)
+    rounds = []
+    for round_number, round_record in enumerate(round_records, start=1):
+        if round_record.get('round_number') != round_number:
+            fail(f'round {round_number} is missing or out of order')
+        cards = cards_for_round(round_number, max_rounds)
+        if round_record.get('cards_per_player', cards) != cards:
+            fail(f'round {round_number} deals {cards} cards per player, not {round_record["cards_per_player"]}')
+        
+        # Only the last round may still be in progress, and in an active game it always is
+        is_completed = bool(round_record.get('is_completed', True))
+        is_last = round_number == len(round_records)
+        if not is_completed and not is_last:
+            fail(f'round {round_number} is not completed')
+        if is_completed and is_last and is_active:
+            fail(f'round {round_number} is completed but the game is still active')
+        
+        results = {}
+        for result in round_record.get('results') or []:
+            player_id = result.get('player_id')
+            if player_id not in totals or player_id in results:
+                fail(f'round {round_number} has an unexpected result for player {player_id}')
+            results[player_id] = result
+        if results and set(results) != set(seat_ids):
+            fail(f'round {round_number} needs a result for every player')
+        if is_completed and not results:
+            fail(f'round {round_number} has no results')
+        
+        guesses = [result.get('guess') for result in results.values()]
+        if any(not isinstance(guess, int) or not 0 <= guess <= cards for guess in guesses):
+            fail(f'round {round_number} has a guess outside 0..{cards}')
+        if check_tricks and results and force_conflict and sum(guesses) == cards:
+            fail(f'round {round_number} guesses add up to the number of cards')
+        
+        result_rows = []
+        for player_id, result in results.items():
+            hits, points = result.get('hits'), result.get('points')
+            if is_completed:
+                if not isinstance(hits, int) or not 0 <= hits <= cards:
+                    fail(f'round {round_number} has hits outside 0..{cards}')
+                expected = score_round(result['guess'], hits)
+                if points is not None and points != expected:
+                    fail(f'round {round_number} scores {points} for player {player_id}, expected {expected}')
+                points = expected
+                totals[player_id] += points
+            elif hits is not None or points is not None:
+                fail(f'round {round_number} is in progress but has hits')
+            result_rows.append((player_map[player_id], result['guess'], hits, points))
+        if check_tricks and is_completed and sum(row[2] for row in result_rows) != cards:
+            fail(f'round {round_number} hits do not add up to {cards}')
+        rounds.append(((round_number, cards, is_completed), result_rows))
+    
+    for seat in record['players']:
+        if seat.get('total_points') is not None and seat['total_points'] != totals[seat['player_id']]:
+            fail(f'player {seat["player_id"]} totals {totals[seat["player_id"]]}, not {seat["total_points"]}')
+    
+    dealer_index = record.get('current_dealer_index', 0)
+    if not isinstance(dealer_index, int) or not 0 <= dealer_index < len(seat_ids):
+        fail('current_dealer_index is not a seat')
+    created_at = _parse_timestamp(record.get('created_at'), line_number, 'created_at') or datetime.utcnow()
+    game = {
+        'created_at': created_at,
+        'started_at': _parse_timestamp(record.get('started_at'), line_number, 'started_at'),
+        'ended_at': None if is_active else _parse_timestamp(record.get('ended_at'), line_number, 'ended_at'),
+        'is_active': is_active,
+        'current_round': len(rounds),
+        'max_rounds': max_rounds,
+        'round_direction': 'up',
+        'current_dealer_index': dealer_index,
+        'ended_early': not is_active and sum(1 for round_row, _ in rounds if round_row[2]) < max_rounds,
+        'deck_type': deck_type,
+        'force_conflict': force_conflict,
+        'version': 0
+    }
+    seats = [(player_map[player_id], totals[player_id]) for player_id in seat_ids]
+    return {'game': game, 'seats': seats, 'rounds': rounds}
+
+def _insert_imported_players(pending, player_map):
+    local_ids = db.session.execute(
+        db.insert(Player).returning(Player.id, sort_by_parameter_order=True), [row for _, row in pending]
+    ).scalars().all()
+    for (exported_id, _), local_id in zip(pending, local_ids):
+        player_map[exported_id] = local_id
+    pending.clear()
+
+def _executemany(table, columns, rows):
+    # Plain DB-API executemany; SQLAlchemy's per-row parameter handling would dominate a bulk load.
+    # Only for integer and boolean columns, whose storage does not depend on SQLAlchemy's type processing.
+    sql = f'INSERT INTO {table.name} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})'
+    db.session.connection().exec_driver_sql(sql, rows)
+
+def _insert_imported_games(games):
+    game_ids = db.session.execute(
+        db.insert(Game.__table__).returning(Game.id, sort_by_parameter_order=True), [game['game'] for game in games]
+    ).scalars().all()
+    _executemany(GamePlayer.__table__, ('game_id', 'player_id', 'total_points'),
+                 [(game_id, player_id, total) for game_id, game in zip(game_ids, games) for player_id, total in game['seats']])
+    _executemany(Round.__table__, ('game_id', 'round_number', 'cards_per_player', 'is_completed'),
+                 [(game_id,) + round_row for game_id, game in zip(game_ids, games) for round_row, _ in game['rounds']])
+    
+    # Look the round ids up by (game, number) rather than RETURNING them row by row
+    round_ids = {(game_id, number): round_id for round_id, game_id, number in db.session.execute(
+        db.select(Round.id, Round.game_id, Round.round_number).where(Round.game_id.in_(game_ids)))}
+    _executemany(RoundResult.__table__, ('round_id', 'player_id', 'guess', 'hits', 'points'),
+                 [(round_ids[(game_id, round_row[0])],) + result
+                  for game_id, game in zip(game_ids, games) for round_row, results in game['rounds'] for result in results])
+    return game_ids
+
+def import_history(lines, batch_size=500, progress=None, check_tricks=True):
+    """Import an NDJSON export in a single transaction; raises ValueError on the first invalid line.
+    
+    Players are matched to existing ones by nickname. Imported games get new ids. With
+    check_tricks=False, rounds whose hits or guesses edit_game let through are accepted.
+    """
+    known_players = dict(db.session.execute(db.select(Player.nickname, Player.id)).all())
+    player_map = {}  # Exported player id -> local id (None until inserted)
+    pending_players, pending_games = [], []
+    finished = []  # (rating key, game id) of imported finished games
+    counts = {'players': 0, 'games': 0, 'rounds': 0}
+    
+    def flush_games():
+        game_ids = _insert_imported_games(pending_games)
+        for game_id, game in zip(game_ids, pending_games):
+            if not game['game']['is_active']:
+                finished.append(((game['game']['ended_at'] or game['game']['created_at'], game_id), game_id))
+        counts['games'] += len(pending_games)
+        pending_games.clear()
+        if progress:
+            progress(counts['games'])
+    
+    with _write_lock:
+        try:
+            for line_number, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise ValueError(f'line {line_number}: not valid JSON')
+                
+                if record.get('type') == 'player':
+                    nickname = (record.get('nickname') or '').strip()
+                    if not nickname or record.get('id') is None:
+                        raise ValueError(f'line {line_number}: a player needs an id and a nickname')
+                    if nickname in known_players:
+                        if known_players[nickname] is None:
+                            raise ValueError(f'line {line_number}: nickname {nickname!r} appears twice')
+                        player_map[record['id']] = known_players[nickname]
+                        continue
+                    player_map[record['id']] = None
+                    known_players[nickname] = None
+                    pending_players.append((record['id'], {
+                        'nickname': nickname,
+                        'created_at': _parse_timestamp(record.get('created_at'), line_number, 'created_at') or datetime.utcnow()
+                    }))
+                    counts['players'] += 1
+                elif record.get('type') == 'game':
+                    # Players precede the games in an export; give them local ids before the first game
+                    if pending_players:
+                        _insert_imported_players(pending_players, player_map)
+                    game = _validate_imported_game(record, player_map, line_number, check_tricks)
+                    pending_games.append(game)
+                    counts['rounds'] += len(game['rounds'])
+                    if len(pending_games) >= batch_size:
+                        flush_games()
+                else:
+                    raise ValueError(f'line {line_number}: unknown record type {record.get("type")!r}')
+            if pending_players:
+                _insert_imported_players(pending_players, player_map)
+            if pending_games:
+                flush_games()
+            
+            # Fold the imported games into statistics, then replay ratings from the oldest one
+            finished.sort()
+            for start in range(0, len(finished), batch_size):
+                lines_batch = compute_game_stat_lines([game_id for _, game_id in finished[start:start + batch_size]])
+                _insert_stat_lines(lines_batch)
+                _apply_stat_lines(lines_batch, 1)
+                _apply_head_to_head(lines_batch, 1)
+                db.session.flush()
+            if finished:
+                recompute_ratings_from(*finished[0][0])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return counts
+
+@bp.cli.command('export-history')
+@click.option('--format', 'export_format', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+@click.option('--table', type=click.Choice(sorted(EXPORT_TABLES)), help='Table to write as CSV')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write (default: stdout)')
+def export_history_command(export_format, table, output):
+    """Write the game history as NDJSON, or one table as CSV."""
+    if export_format == 'csv' and not table:
+        raise click.UsageError('--format csv needs --table')
+    pieces = export_history_ndjson() if export_format == 'ndjson' else export_table_csv(table)
+    for chunk in _chunked(pieces):
+        output.write(chunk)
+
+@bp.cli.command('import-history')
+@click.argument('source', type=click.File('r'))
+@click.option('--batch-size', default=500, show_default=True, help='Games per executemany batch')
+@click.option('--skip-trick-checks', is_flag=True,
+              help='Accept rounds whose hits do not add up to the cards or whose guesses break the forced conflict')
+def import_history_command(source, batch_size, skip_trick_checks):
+    """Import games from an NDJSON export."""
+    try:
+        counts = import_history(source, batch_size, progress=lambda n: print(f'  {n} games imported'),
+                                check_tricks=not skip_trick_checks)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    print(f"Imported {counts['players']} new players, {counts['games']} games and {counts['rounds']} rounds")
+
+# Live game updates
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 2000  # Reconnection delay asked of clients whose stream was closed
+
+class GameEventBroker:
+    """Fans out game updates to the Server-Sent Event streams of this process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._streams = 0
+    
+    def open_stream(self, limit):
+        """Take one of limit stream slots; False when they are all in use."""
+        with self._lock:
+            if self._streams >= limit:
+                return False
+            self._streams += 1
+            return True
+    
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+    
+    def subscribe(self, game_id):
+        subscription = queue.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.setdefault(game_id, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, game_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(game_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(game_id, None)
+    
+    def publish(self, game_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(game_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait((event, data))
+            except queue.Full:
+                # A stalled client only misses deltas; the version poll resyncs it
+                pass
+
+game_events = GameEventBroker()
+
+def _sse_message(event, data, version=None):
+    lines = [f'event: {event}']
+    if version is not None:
+        lines.append(f'id: {version}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def _current_game_version(game_id):
+    with db.engine.connect() as conn:
+        return conn.execute(db.select(Game.version).where(Game.id == game_id)).scalar()
+
+# Render cache
+class RenderCache:
+    """LRU cache of rendered fragments, validated against a version and capped in bytes.
+    
+    Each worker process has its own cache. Entries are only served while the version
+    stored in the database still matches, so a write in another process is never hidden.
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+    
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key, version, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # One entry per key: a newer version replaces the old one
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = (version, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+# Process-wide; create_app() sizes them from its configuration
+render_cache = RenderCache(DEFAULT_CONFIG['RENDER_CACHE_MAX_BYTES'])
+
+# HTTP caching and compression
+# Pages built from one game or one player carry an ETag made of its version and a
+# Last-Modified time, so a client that already has the page gets a 304 after a single
+# lookup. Static files are served under a content hash and cached for a year. Text
+# responses are compressed with brotli when it is installed and accepted, else gzip.
+STATIC_MAX_AGE = 365 * 24 * 3600
+COMPRESS_MIN_BYTES = 500
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+                          'application/javascript', 'application/json'}
+
+@functools.lru_cache(maxsize=None)
+def static_file_hash(filename):
+    with open(os.path.join(current_app.static_folder, filename), 'rb') as source:
+        return hashlib.sha1(source.read()).hexdigest()[:12]
+
+@bp.app_template_global()
+def static_url(filename):
+    """URL of a static file that changes whenever its content does, so it can be cached for good."""
+    return url_for('static', filename=filename, v=static_file_hash(filename))
+
+@functools.lru_cache(maxsize=None)
+def asset_version():
+    """Hash of the templates and static files; part of every page ETag so a deploy invalidates them."""
+    digest = hashlib.sha1()
+    for folder in (os.path.join(current_app.root_path, current_app.template_folder), current_app.static_folder):
+        for root, dirs, files in sorted(os.walk(folder)):
+            dirs.sort()
+            for name in sorted(files):
+                with open(os.path.join(root, name), 'rb') as source:
+                    digest.update(name.encode() + source.read())
+    return digest.hexdigest()[:8]
+
+def conditional_page(etag, last_modified, render):
+    """render() with validators for the client to revalidate, or 304 when its copy is current.
+    
+    Pages with a flash message waiting are always rendered so the message is shown once. They
+    carry no validators, so the compressed cache neither stores nor serves their body.
+    """
+    if session.get('_flashes'):
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    etag = f'{etag}-{asset_version()}'
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+        if response.status_code != 200:
+            return response
+    # Weak, so the same tag holds for the compressed and uncompressed bodies
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=current_app.config['GZIP_LEVEL'])
+
+# Compressed bodies of validated responses, reused while their ETag holds
+compressed_cache = RenderCache(DEFAULT_CONFIG['COMPRESSED_CACHE_MAX_BYTES'])
+
+@bp.after_app_request
+def cache_and_compress(response):
+    if request.endpoint == 'static' and request.args.get('v'):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    
+    if (not current_app.config['COMPRESSION'] or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.status_code != 200 or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed and not response.direct_passthrough:
+        # Exports are streamed to keep memory flat; they stay uncompressed
+        return response
+    accepted = request.accept_encodings
+    encoding = 'br' if brotli is not None and accepted['br'] else 'gzip' if accepted['gzip'] else None
+    if encoding is None:
+        return response
+    
+    # Static files are sent straight from disk; read them so they can be compressed too
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    etag, _ = response.get_etag()
+    key = (request.path, encoding)
+    body = compressed_cache.get(key, etag) if etag else None
+    if body is None:
+        body = _compress(data, encoding)
+        if etag:
+            compressed_cache.put(key, etag, body)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Bidding analytics
+# Completed results are held as NumPy column arrays per process; breakdowns use bincount
+# over whole columns instead of looping over rows.
+ANALYTICS_COLUMNS = ('game_id', 'round_id', 'round_number', 'cards', 'player_id', 'guess', 'hits', 'seat',
+                     'n_players', 'dealer_index', 'current_round', 'double_deck', 'force_conflict')
+ANALYTICS_LOAD_CHUNK = 500
+
+def _int_rows(query, width):
+    # Core execution skips the ORM's row loading, and NumPy converts plain tuples far faster than Rows
+    rows = db.session.connection().execute(query.execution_options(count_rows=False))
+    array = np.array([tuple(row) for row in rows], dtype=np.int64).reshape(-1, width)
+    _count_rows(len(array))
+    return array
+
+def _load_analytics_columns(game_ids=None):
+    """Column arrays of the completed results of the given games (all games when None)."""
+    results = (
+        db.select(Round.game_id, Round.id, Round.round_number, Round.cards_per_player, RoundResult.player_id,
+                  RoundResult.guess, RoundResult.hits, Game.current_dealer_index, Game.current_round,
+                  Game.deck_type == 'double', Game.force_conflict)
+        .select_from(RoundResult)
+        .join(Round, RoundResult.round_id == Round.id)
+        .join(Game, Game.id == Round.game_id)
+        .where(Round.is_completed == True, RoundResult.hits.isnot(None))
+    )
+    seats = db.select(GamePlayer.game_id, GamePlayer.player_id).order_by(GamePlayer.game_id, GamePlayer.id)
+    if game_ids is not None:
+        results = results.where(Round.game_id.in_(game_ids))
+        seats = seats.where(GamePlayer.game_id.in_(game_ids))
+    rows = _int_rows(results, 11)
+    seats = _int_rows(seats, 2)
+    
+    # Seat number within each game and the game's player count, from the ordered seat rows
+    _, first_seat, seat_counts = np.unique(seats[:, 0], return_index=True, return_counts=True)
+    seat_number = np.arange(len(seats)) - np.repeat(first_seat, seat_counts)
+    seat_players = np.repeat(seat_counts, seat_counts)
+    
+    # Match every result to its seat by (game, player)
+    stride = int(seats[:, 1].max()) + 1 if len(seats) else 1
+    seat_keys = seats[:, 0] * stride + seats[:, 1]
+    by_key = np.argsort(seat_keys)
+    seat_of_row = by_key[np.searchsorted(seat_keys, rows[:, 0] * stride + rows[:, 4], sorter=by_key)]
+    
+    columns = {name: rows[:, i] for i, name in enumerate(ANALYTICS_COLUMNS[:7])}
+    columns['seat'] = seat_number[seat_of_row]
+    columns['n_players'] = seat_players[seat_of_row]
+    for i, name in enumerate(ANALYTICS_COLUMNS[9:], start=7):
+        columns[name] = rows[:, i]
+    return columns
+
+class BiddingSnapshot:
+    """Per-process column snapshot of every completed result, refreshed game by game.
+    
+    Every write bumps Game.version and sets Game.updated_at, and game ids are never reused, so
+    only new games and games updated since the last refresh are looked at and reloaded.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = None
+        self._versions = {}
+        self._max_id = 0
+        self._seen = None  # Latest Game.updated_at read so far
+        self._analyses = {}
+    
+    def columns(self):
+        # A write stamps updated_at before it waits for the database lock, so it can commit with a
+        # time just before the latest one seen: look back as far as a writer may wait
+        slack = timedelta(milliseconds=current_app.config['SQLITE_BUSY_TIMEOUT_MS'] + 1000)
+        with self._lock:
+            if self._columns is None:
+                recent = None
+            else:
+                # Until a write has been seen, any game with a write time is new to the snapshot
+                updated = Game.updated_at.isnot(None) if self._seen is None else Game.updated_at >= self._seen - slack
+                candidates = db.or_(Game.id > self._max_id, updated)
+                recent = db.session.execute(db.select(Game.id, Game.version, Game.updated_at).where(candidates)).all()
+                n_games = db.session.execute(db.select(db.func.count(Game.id))).scalar()
+                changed = [game_id for game_id, version, _ in recent if self._versions.get(game_id) != version]
+                new_ids = [game_id for game_id, _, _ in recent if game_id not in self._versions]
+                removed = []
+                if n_games != len(self._versions) + len(new_ids):
+                    # Games were deleted: only then are all ids read
+                    current = set(db.session.execute(db.select(Game.id)).scalars())
+                    removed = [game_id for game_id in self._versions if game_id not in current]
+                if not changed and not removed:
+                    return self._columns
+            
+            if recent is None or len(changed) > len(self._versions) // 2:
+                # Versions first: a write landing in between is then reloaded next time
+                rows = db.session.execute(db.select(Game.id, Game.version, Game.updated_at)).all()
+                versions = {game_id: version for game_id, version, _ in rows}
+                columns = _load_analytics_columns()
+            else:
+                keep = ~np.isin(self._columns['game_id'], changed + removed)
+                parts = [{name: values[keep] for name, values in self._columns.items()}]
+                for start in range(0, len(changed), ANALYTICS_LOAD_CHUNK):
+                    parts.append(_load_analytics_columns(changed[start:start + ANALYTICS_LOAD_CHUNK]))
+                columns = {name: np.concatenate([part[name] for part in parts]) for name in ANALYTICS_COLUMNS}
+                rows = recent
+                versions = dict(self._versions)
+                for game_id in removed:
+                    versions.pop(game_id)
+                versions.update((game_id, version) for game_id, version, _ in recent)
+            
+            stamps = [updated_at for _, _, updated_at in rows if updated_at is not None]
+            if stamps:
+                self._seen = max(stamps) if self._seen is None else max(self._seen, max(stamps))
+            self._max_id = max(versions, default=self._max_id)
+            self._columns, self._versions = columns, versions
+            self._analyses = {}
+            return columns
+    
+    def analysis(self, player_id=None):
+        """Breakdowns for everyone or one player, reused until the snapshot changes."""
+        columns = self.columns()
+        with self._lock:
+            cached = self._analyses.get(player_id)
+            if cached is not None and cached[0] is columns:
+                return cached[1]
+        result = compute_bidding_analytics(columns, player_id)
+        with self._lock:
+            if self._columns is columns:
+                self._analyses[player_id] = (columns, result)
+        return result
+    
+    def clear(self):
+        with self._lock:
+            self._columns, self._versions, self._max_id, self._seen, self._analyses = None, {}, 0, None, {}
+
+bidding_snapshot = BiddingSnapshot()
+
+def _bid_breakdown(keys, guess, hits):
+    """Accuracy and over/under-bidding per distinct key."""
+    values, groups = np.unique(keys, return_inverse=True)
+    count = np.bincount(groups, minlength=len(values))
+    error = guess - hits
+    sums = {
+        'correct': np.bincount(groups, weights=error == 0, minlength=len(values)),
+        'over': np.bincount(groups, weights=error > 0, minlength=len(values)),
+        'under': np.bincount(groups, weights=error < 0, minlength=len(values)),
+        'error': np.bincount(groups, weights=error, minlength=len(values)),
+        'guess': np.bincount(groups, weights=guess, minlength=len(values)),
+        'hits': np.bincount(groups, weights=hits, minlength=len(values)),
+    }
+    return [{
+        'key': int(value),
+        'results': int(count[i]),
+        'accuracy': sums['correct'][i] / count[i] * 100,
+        'over_rate': sums['over'][i] / count[i] * 100,
+        'under_rate': sums['under'][i] / count[i] * 100,
+        'mean_bid_error': sums['error'][i] / count[i],
+        'mean_guess': sums['guess'][i] / count[i],
+        'mean_hits': sums['hits'][i] / count[i],
+    } for i, value in enumerate(values)]
+
+def compute_bidding_analytics(columns, player_id=None):
+    """All bidding breakdowns, optionally for one player's bids."""
+    n_players = columns['n_players']
+    # The dealer moves one seat per completed round, so each round's dealer follows from the current one
+    dealer = (columns['dealer_index'] - (columns['current_round'] - columns['round_number'])) % np.maximum(n_players, 1)
+    bid_position = (columns['seat'] - dealer - 1) % np.maximum(n_players, 1)  # 0 bids first, n-1 is the dealer
+    is_last = bid_position == n_players - 1
+    
+    # Guesses of the other players in each round, for the forced-conflict check
+    _, round_index = np.unique(columns['round_id'], return_inverse=True)
+    round_guesses = np.bincount(round_index, weights=columns['guess'])
+    forbidden = columns['cards'] - (round_guesses[round_index] - columns['guess'])
+    constrained = (forbidden >= 0) & (forbidden <= columns['cards'])
+    
+    mine = np.ones(len(columns['guess']), dtype=bool) if player_id is None else columns['player_id'] == player_id
+    guess, hits = columns['guess'][mine], columns['hits'][mine]
+    
+    overall = _bid_breakdown(np.zeros(len(guess), dtype=np.int64), guess, hits)
+    by_position = _bid_breakdown(np.where(is_last, -1, bid_position)[mine], guess, hits)
+    
+    # Last bidders under the forced conflict, compared with last bidders without it
+    forced = mine & is_last & (columns['force_conflict'] == 1)
+    forced_constrained = forced & constrained
+    free_last = mine & is_last & (columns['force_conflict'] == 0)
+    correct = columns['guess'] == columns['hits']
+    
+    def rate(mask, of):
+        total = int(of.sum())
+        return int(mask.sum()) / total * 100 if total else None
+    
+    by_cards = _bid_breakdown(columns['cards'][mine], guess, hits)
+    by_players = _bid_breakdown(n_players[mine], guess, hits)
+    by_deck = _bid_breakdown(columns['double_deck'][mine], guess, hits)
+    for row in by_cards:
+        row['label'] = f"{row['key']} card{'s' if row['key'] != 1 else ''}"
+    for row in by_position:
+        row['label'] = 'Dealer (bids last)' if row['key'] == -1 else f"Bidder {row['key'] + 1}"
+    # Dealer last, after the bidders in order
+    by_position.sort(key=lambda row: (row['key'] == -1, row['key']))
+    for row in by_players:
+        row['label'] = f"{row['key']} players"
+    for row in by_deck:
+        row['label'] = 'Double deck' if row['key'] else 'Single deck'
+    
+    return {
+        'results': int(len(guess)),
+        'overall': overall[0] if overall else None,
+        'by_cards': by_cards,
+        'by_position': by_position,
+        'by_players': by_players,
+        'by_deck': by_deck,
+        'force_conflict': {
+            'last_bids': int(forced.sum()),
+            'constrained': int(forced_constrained.sum()),
+            'constrained_rate': rate(forced_constrained, forced),
+            # The forbidden bid was exactly what the dealer went on to take
+            'forced_off_correct': int((forced_constrained & (forbidden == columns['hits'])).sum()),
+            'forced_off_correct_rate': rate(forced_constrained & (forbidden == columns['hits']), forced),
+            'accuracy_constrained': rate(forced_constrained & correct, forced_constrained),
+            'accuracy_unconstrained': rate(forced & ~constrained & correct, forced & ~constrained),
+            'accuracy_without_rule': rate(free_last & correct, free_last),
+        }
+    }
+
+# Bid advice
+# Answers depend only on table size, cards and deck, and a fixed seed keeps them stable,
+# so each one is simulated once per process.
+_simulation_pool = None
+_simulation_pool_lock = threading.Lock()
+
+def simulation_pool():
+    """Process pool shared by this worker's requests, or None to simulate in-process."""
+    global _simulation_pool
+    if current_app.config['SIMULATION_WORKERS'] <= 0:
+        return None
+    with _simulation_pool_lock:
+        if _simulation_pool is None:
+            _simulation_pool = ProcessPoolExecutor(max_workers=current_app.config['SIMULATION_WORKERS'])
+        return _simulation_pool
+
+@functools.lru_cache(maxsize=256)
+def bid_advice_for(n_players, cards, deck_type, strategy='greedy'):
+    """Simulated advice per seat in bidding order (the dealer last)."""
+    deck_size = DECK_CARDS.get(deck_type, DECK_CARDS['single']) + 1
+    histogram = simulator.simulate_parallel(n_players, cards, deck_size, current_app.config['BID_ADVICE_HANDS'],
+                                            strategy, seed=0, executor=simulation_pool())
+    return simulator.bid_advice(histogram)
+
+# Background jobs
+# Rebuilds, purges and imports run on a thread pool inside the web process; requests only
+# insert or read a row of the job table. Progress is kept in memory while a job runs and
+# copied to its row whenever the database is not locked by the job's own transaction.
+JOB_FINISHED = ('succeeded', 'failed', 'cancelled')
+JOB_PROGRESS_INTERVAL = 1.0  # Seconds between progress writes, which also pick up cancels from other processes
+JOB_HANDLERS = {}
+
+def job_handler(kind):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+class JobCancelled(Exception):
+    """Raised inside a job to stop it; result describes the work that was kept."""
+    
+    def __init__(self, result=None):
+        super().__init__('Cancelled')
+        self.result = result
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _store_job_progress(job_id, values):
+    """Write progress on a separate connection; returns the job's cancel flag, or None if the database was busy."""
+    with db.engine.connect() as conn:
+        # Give up at once rather than wait behind a write transaction
+        conn.exec_driver_sql('PRAGMA busy_timeout = 0')
+        try:
+            cancel_requested = conn.execute(
+                db.update(Job).where(Job.id == job_id).values(**values).returning(Job.cancel_requested)).scalar()
+            conn.commit()
+            return bool(cancel_requested)
+        except OperationalError:
+            conn.rollback()
+            return None
+        finally:
+            conn.exec_driver_sql(f"PRAGMA busy_timeout = {current_app.config['SQLITE_BUSY_TIMEOUT_MS']}")
+
+class JobContext:
+    """Handed to a job handler to report progress and notice cancellation."""
+    
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.done = 0
+        self.total = None
+        self.message = None
+        self._cancel = threading.Event()
+        self._stored_at = 0.0
+    
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+    
+    def cancel(self):
+        self._cancel.set()
+    
+    def report(self, done, total=None, message=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        now = time.monotonic()
+        if now - self._stored_at < JOB_PROGRESS_INTERVAL:
+            return
+        self._stored_at = now
+        cancel_requested = _store_job_progress(self.job_id, {
+            'progress_done': self.done, 'progress_total': self.total, 'message': self.message})
+        if cancel_requested is None:
+            # The job holds the write lock itself; its own transaction can still read the flag
+            cancel_requested = db.session.execute(db.select(Job.cancel_requested).where(Job.id == self.job_id)).scalar()
+        if cancel_requested:
+            self._cancel.set()
+    
+    def check(self):
+        """Raise JobCancelled if the job has been asked to stop."""
+        if self.cancelled:
+            raise JobCancelled()
+    
+    def progress(self, done, total=None, message=None):
+        self.report(done, total, message)
+        self.check()
+
+class JobRunner:
+    """Queues jobs in the job table and runs them on a thread pool of this process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._live = {}  # Job id -> JobContext of the jobs queued or running here
+        self._recovered = False
+    
+    def submit(self, kind, params=None):
+        """Queue a job and return its row; raises ValueError for an unknown kind or parameter."""
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise ValueError(f'Unknown job kind {kind!r}')
+        params = dict(params or {})
+        try:
+            inspect.signature(handler).bind(None, **params)
+        except TypeError as error:
+            raise ValueError(f'{kind}: {error}')
+        self.recover()
+        job = Job(kind=kind, params=params, status='queued', worker=_worker_name())
+        db.session.add(job)
+        db.session.commit()
+        self._start(job.id)
+        return job
+    
+    def _start(self, job_id):
+        context = JobContext(job_id)
+        with self._lock:
+            if self._executor is None:
+                workers = max(1, current_app.config['JOB_WORKERS'])
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rikiki-job')
+            self._live[job_id] = context
+        self._executor.submit(self._run, current_app._get_current_object(), job_id, context)
+    
+    def _run(self, app, job_id, context):
+        with app.app_context():
+            try:
+                job = db.session.get(Job, job_id)
+                kind, params = job.kind, job.params
+                if context.cancelled or job.cancel_requested:
+                    self._finish(job_id, context, 'cancelled')
+                    return
+                job.status = 'running'
+                job.started_at = datetime.utcnow()
+                db.session.commit()
+                try:
+                    result = JOB_HANDLERS[kind](context, **params)
+                except JobCancelled as stop:
+                    db.session.rollback()
+                    self._finish(job_id, context, 'cancelled', result=stop.result)
+                except Exception as error:
+                    db.session.rollback()
+                    app.logger.exception('Job %s (%s) failed', job_id, kind)
+                    self._finish(job_id, context, 'failed', error=str(error))
+                else:
+                    self._finish(job_id, context, 'succeeded', result=result)
+            finally:
+                with self._lock:
+                    self._live.pop(job_id, None)
+    
+    def _finish(self, job_id, context, status, result=None, error=None):
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(
+            status=status, result=result, error=error, progress_done=context.done, progress_total=context.total,
+            message=context.message, finished_at=datetime.utcnow()))
+        db.session.commit()
+    
+    def cancel(self, job):
+        """Ask a job to stop; returns False if it has already finished."""
+        if job.status in JOB_FINISHED:
+            return False
+        with self._lock:
+            context = self._live.get(job.id)
+        if context is not None:
+            # Queued or running here: no database write, so this never waits on a running job
+            context.cancel()
+            return True
+        # Another process runs it and sees the flag at its next progress report
+        job.cancel_requested = True
+        db.session.commit()
+        return True
+    
+    def describe(self, job):
+        """The job as a dict, with live progress when it runs in this process."""
+        with self._lock:
+            context = self._live.get(job.id)
+        live = context is not None and job.status not in JOB_FINISHED
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'params': job.params,
+            'progress': {
+                'done': context.done if live else job.progress_done,
+                'total': context.total if live else job.progress_total,
+                'message': context.message if live else job.message,
+            },
+            'cancel_requested': job.cancel_requested or (live and context.cancelled),
+            'result': job.result,
+            'error': job.error,
+            'worker': job.worker,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        }
     
-    def __repr__(self):
-        return f'<Player {self.nickname}>'
+    def recover(self):
+        """Once per process: fail the jobs of dead processes on this host and take over the ones they never started."""
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+        host = socket.gethostname()
+        requeued = []
+        abandoned = db.session.execute(db.select(Job.id, Job.status, Job.worker).where(
+            Job.status.in_(('queued', 'running')), Job.worker.startswith(f'{host}:'))).all()
+        for job_id, status, worker in abandoned:
+            pid = int(worker.rsplit(':', 1)[1])
+            if pid == os.getpid() or _process_alive(pid):
+                continue
+            # Only one process may claim it
+            claim = db.update(Job).where(Job.id == job_id, Job.worker == worker)
+            if status == 'running':
+                claim = claim.values(status='failed', error='Interrupted: the process running it stopped',
+                                     finished_at=datetime.utcnow())
+            else:
+                claim = claim.values(worker=_worker_name())
+            if db.session.execute(claim).rowcount and status == 'queued':
+                requeued.append(job_id)
+        db.session.commit()
+        for job_id in requeued:
+            self._start(job_id)
 
-class Game(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    started_at = db.Column(db.DateTime, nullable=True)  # When first round was started
-    ended_at = db.Column(db.DateTime, nullable=True)  # When game was completed or ended early
-    is_active = db.Column(db.Boolean, default=True)
-    current_round = db.Column(db.Integer, default=1)
-    max_rounds = db.Column(db.Integer, nullable=False)
-    round_direction = db.Column(db.String(10), default='up')  # 'up' or 'down'
-    current_dealer_index = db.Column(db.Integer, default=0)  # Index of current dealer in player order
-    ended_early = db.Column(db.Boolean, default=False)  # Whether game was ended early
-    deck_type = db.Column(db.String(10), default='single')  # 'single' or 'double'
-    force_conflict = db.Column(db.Boolean, default=True)  # Whether to force conflict (prevent equal sums)
-    
-    def __repr__(self):
-        return f'<Game {self.id}>'
+job_runner = JobRunner()
 
-class GamePlayer(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
-    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
-    total_points = db.Column(db.Integer, default=0)
+def _flag(value):
+    # Job parameters come from JSON or from form fields
+    return value in (True, 1, '1', 'true', 'yes', 'on')
+
+@job_handler('rebuild-stats')
+def rebuild_stats_job(context, batch_size=500):
+    # Batches already rebuilt stay rebuilt when the job is cancelled, and the totals are summed from them
+    n_games = rebuild_player_stats(int(batch_size), progress=lambda done, total: context.report(
+        done, total, f'{done} of {total} games'), should_stop=lambda: context.cancelled)
+    if context.cancelled:
+        raise JobCancelled({'games': n_games})
+    return {'games': n_games}
+
+@job_handler('rebuild-ratings')
+def rebuild_ratings_job(context, batch_size=1000):
+    # A cancelled replay leaves the current ratings as they were
+    n_players = rebuild_ratings(int(batch_size), progress=lambda done, total: context.report(
+        done, total, f'{done} of {total} games'), should_stop=lambda: context.cancelled)
+    if n_players is None:
+        raise JobCancelled()
+    return {'players': n_players}
+
+@job_handler('rebuild-caches')
+def rebuild_caches_job(context):
+    # Caches live per process, so this refreshes the ones of the process running the job
+    render_cache.clear()
+    bid_advice_for.cache_clear()
+    bidding_snapshot.clear()
+    context.progress(0, 1, 'Loading analytics columns')
+    columns = bidding_snapshot.columns()
+    context.report(1, 1, 'Done')
+    return {'analytics_rows': int(len(columns['game_id']))}
+
+@job_handler('purge-games')
+def purge_games_job(context, ids=None, older_than_days=None, deck=None, include_active=False, chunk_size=500):
+    if isinstance(ids, str):
+        ids = [game_id for game_id in ids.split(',') if game_id.strip()] or None
+    game_ids = [int(game_id) for game_id in ids] if ids is not None else None
+    older_than = None
+    if older_than_days not in (None, ''):
+        older_than = datetime.utcnow() - timedelta(days=int(older_than_days))
+    if game_ids is None and older_than is None and not deck:
+        raise ValueError('Give ids, older_than_days or deck')
+    # Chunks already deleted stay deleted when the job is cancelled
+    deleted = purge_games(game_ids, older_than, deck or None, _flag(include_active), int(chunk_size),
+                          progress=lambda n: context.report(n, message=f'{n} games deleted'),
+                          should_stop=lambda: context.cancelled)
+    if context.cancelled:
+        raise JobCancelled({'deleted': deleted})
+    return {'deleted': deleted}
+
+@job_handler('import-history')
+def import_history_job(context, path, skip_trick_checks=False, batch_size=500, remove_source=False):
+    # Cancelling rolls the whole import back, like an invalid line does
+    try:
+        with open(path) as source:
+            return import_history(source, int(batch_size),
+                                  progress=lambda n: context.progress(n, message=f'{n} games imported'),
+                                  check_tricks=not _flag(skip_trick_checks))
+    finally:
+        if remove_source and os.path.exists(path):
+            os.remove(path)
+
+# Request metrics
+REQUEST_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+REQUEST_STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+SLOW_REQUEST_TOP_STATEMENTS = 5
+
+# SQL counters of the request running on this thread; unset outside requests
+_request_sql = threading.local()
+
+def _count_fetched_row(cursor, row):
+    stats = getattr(_request_sql, 'stats', None)
+    if stats is not None:
+        stats['rows'] += 1
+    return row
+
+def _count_rows(n):
+    # For bulk reads that skip the per-row count and add up their rows at once
+    stats = getattr(_request_sql, 'stats', None)
+    if stats is not None:
+        stats['rows'] += n
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, so a statement that raises leaves nothing behind
+    if context is not None:
+        context.query_start_time = time.perf_counter()
+        # Rows are counted one by one only inside measured requests, and not for bulk reads
+        if getattr(_request_sql, 'stats', None) is not None and context.execution_options.get('count_rows', True):
+            cursor.row_factory = _count_fetched_row
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'query_start_time', None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    stats = getattr(_request_sql, 'stats', None)
+    if stats is None:
+        return
+    stats['statements'] += 1
+    stats['time'] += elapsed
+    per_statement = stats['by_statement'].setdefault(statement, [0, 0.0])
+    per_statement[0] += 1
+    per_statement[1] += elapsed
+
+def _histogram_lines(name, labels, buckets, counts, total, count):
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(buckets, counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+    lines.append(f'{name}_sum{{{labels}}} {total}')
+    lines.append(f'{name}_count{{{labels}}} {count}')
+    return lines
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class RequestMetrics:
+    """Per-endpoint latency and SQL totals of this process, rendered in Prometheus text format."""
     
-    game = db.relationship('Game', backref='game_players')
-    player = db.relationship('Player', backref='game_players')
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._responses = {}
+    
+    def record(self, endpoint, method, status, duration, sql):
+        with self._lock:
+            entry = self._endpoints.get((endpoint, method))
+            if entry is None:
+                entry = self._endpoints[(endpoint, method)] = {
+                    'latency': [0] * len(REQUEST_LATENCY_BUCKETS), 'latency_sum': 0.0,
+                    'statements': [0] * len(REQUEST_STATEMENT_BUCKETS), 'statements_sum': 0,
+                    'count': 0, 'sql_time': 0.0, 'rows': 0
+                }
+            entry['count'] += 1
+            entry['latency_sum'] += duration
+            entry['statements_sum'] += sql['statements']
+            entry['sql_time'] += sql['time']
+            entry['rows'] += sql['rows']
+            for i, bound in enumerate(REQUEST_LATENCY_BUCKETS):
+                if duration <= bound:
+                    entry['latency'][i] += 1
+                    break
+            for i, bound in enumerate(REQUEST_STATEMENT_BUCKETS):
+                if sql['statements'] <= bound:
+                    entry['statements'][i] += 1
+                    break
+            key = (endpoint, method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+    
+    def render(self):
+        with self._lock:
+            endpoints = {key: dict(entry, latency=list(entry['latency']), statements=list(entry['statements']))
+                         for key, entry in self._endpoints.items()}
+            responses = dict(self._responses)
+        
+        lines = ['# HELP rikiki_requests_total Requests handled, by endpoint, method and status.',
+                 '# TYPE rikiki_requests_total counter']
+        for (endpoint, method, status), count in sorted(responses.items()):
+            lines.append(f'rikiki_requests_total{{endpoint="{_label_value(endpoint)}",method="{method}",status="{status}"}} {count}')
+        
+        duration_lines, statement_lines, sql_time_lines, row_lines = [], [], [], []
+        for (endpoint, method), entry in sorted(endpoints.items()):
+            labels = f'endpoint="{_label_value(endpoint)}",method="{method}"'
+            duration_lines.extend(_histogram_lines('rikiki_request_duration_seconds', labels, REQUEST_LATENCY_BUCKETS,
+                                                   entry['latency'], entry['latency_sum'], entry['count']))
+            statement_lines.extend(_histogram_lines('rikiki_request_sql_statements', labels, REQUEST_STATEMENT_BUCKETS,
+                                                    entry['statements'], entry['statements_sum'], entry['count']))
+            sql_time_lines.append(f'rikiki_sql_duration_seconds_total{{{labels}}} {entry["sql_time"]}')
+            row_lines.append(f'rikiki_sql_rows_fetched_total{{{labels}}} {entry["rows"]}')
+        
+        lines += ['# HELP rikiki_request_duration_seconds Time from request start until the response is returned.',
+                  '# TYPE rikiki_request_duration_seconds histogram'] + duration_lines
+        lines += ['# HELP rikiki_request_sql_statements SQL statements executed per request.',
+                  '# TYPE rikiki_request_sql_statements histogram'] + statement_lines
+        lines += ['# HELP rikiki_sql_duration_seconds_total Time spent executing SQL statements.',
+                  '# TYPE rikiki_sql_duration_seconds_total counter'] + sql_time_lines
+        lines += ['# HELP rikiki_sql_rows_fetched_total Rows fetched from the database.',
+                  '# TYPE rikiki_sql_rows_fetched_total counter'] + row_lines
+        return '\n'.join(lines) + '\n'
 
-class Round(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
-    round_number = db.Column(db.Integer, nullable=False)
-    cards_per_player = db.Column(db.Integer, nullable=False)
-    is_completed = db.Column(db.Boolean, default=False)
+request_metrics = RequestMetrics()
+
+def _start_request_metrics(sender, **extra):
+    _request_sql.stats = {'statements': 0, 'time': 0.0, 'rows': 0, 'by_statement': {}}
+    _request_sql.started = time.perf_counter()
+
+def _finish_request_metrics(sender, response, **extra):
+    stats = getattr(_request_sql, 'stats', None)
+    if stats is None:
+        return
+    _request_sql.stats = None
+    duration = time.perf_counter() - _request_sql.started
+    # Labels keep the view name without the blueprint prefix
+    endpoint = (request.endpoint or 'unmatched').rpartition('.')[2]
+    request_metrics.record(endpoint, request.method, response.status_code, duration, stats)
     
-    game = db.relationship('Game', backref='rounds')
+    if duration * 1000 >= current_app.config['SLOW_REQUEST_MS']:
+        top = sorted(stats['by_statement'].items(), key=lambda item: item[1][1], reverse=True)[:SLOW_REQUEST_TOP_STATEMENTS]
+        details = ''.join(f'\n  {elapsed * 1000:.1f} ms x{count}: {" ".join(statement.split())[:200]}'
+                          for statement, (count, elapsed) in top)
+        current_app.logger.warning('Slow request %s %s (%s): %.1f ms, %d statements, %.1f ms SQL, %d rows%s',
+                           request.method, request.full_path.rstrip('?'), endpoint, duration * 1000,
+                           stats['statements'], stats['time'] * 1000, stats['rows'], details)
 
-class RoundResult(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    round_id = db.Column(db.Integer, db.ForeignKey('round.id'), nullable=False)
-    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
-    guess = db.Column(db.Integer, nullable=False)
-    hits = db.Column(db.Integer, nullable=True)  # NULL until round is completed
-    points = db.Column(db.Integer, nullable=True)  # NULL until round is completed
+# Player search
+# Nicknames are matched by case-insensitive prefix as a range on the NOCASE index, and
+# suggestions come from the latest seats of the selected players, never the whole table.
+PLAYER_PAGE_SIZE = 50
+PLAYER_SEARCH_LIMIT = 10
+PLAYER_SUGGESTION_GAMES = 200  # Most recent games looked at for co-player suggestions
+
+def _nickname_key():
+    return Player.nickname.collate('NOCASE')
+
+def nickname_prefix_filter(prefix):
+    """Case-insensitive "starts with"; U+10FFFF sorts after anything that can follow the prefix."""
+    return db.and_(_nickname_key() >= prefix, _nickname_key() < prefix + '\U0010ffff')
+
+def search_players(prefix, limit=PLAYER_SEARCH_LIMIT, after=None):
+    """Players in nickname order, optionally filtered by prefix; after is the (nickname, id) of the previous page's last row."""
+    query = Player.query
+    if prefix:
+        query = query.filter(nickname_prefix_filter(prefix))
+    if after:
+        nickname, player_id = after
+        query = query.filter(db.or_(_nickname_key() > nickname,
+                                    db.and_(_nickname_key() == nickname, Player.id > player_id)))
+    return query.order_by(_nickname_key(), Player.id).limit(limit).all()
+
+def suggest_players(selected_ids=(), limit=PLAYER_SEARCH_LIMIT):
+    """Players seated most often in the recent games of the selected players (or of everyone), most recent first on ties."""
+    if selected_ids:
+        recent_games = (db.select(GamePlayer.game_id).where(GamePlayer.player_id.in_(selected_ids))
+                        .order_by(GamePlayer.game_id.desc()).limit(PLAYER_SUGGESTION_GAMES))
+    else:
+        recent_games = db.select(Game.id).order_by(Game.id.desc()).limit(PLAYER_SUGGESTION_GAMES)
+    games_together = db.func.count().label('games_together')
+    last_game_id = db.func.max(GamePlayer.game_id).label('last_game_id')
+    rows = db.session.execute(
+        db.select(Player, games_together, last_game_id)
+        .join(GamePlayer, GamePlayer.player_id == Player.id)
+        .where(GamePlayer.game_id.in_(recent_games), Player.id.not_in(selected_ids))
+        .group_by(Player.id)
+        .order_by(games_together.desc(), last_game_id.desc())
+        .limit(limit)
+    ).all()
+    return [{'id': player.id, 'nickname': player.nickname, 'games_together': games, 'last_game_id': last_game}
+            for player, games, last_game in rows]
+
+def _player_ids_arg(value):
+    """Comma-separated ids from a query string, ignoring anything else."""
+    return [int(part) for part in value.split(',') if part.strip().isdigit()]
+
+# Score series
+def compute_score_series(game_id, game_players):
+    """Cumulative points chart and per-player guess figures for a game, from one query."""
+    rows = (
+        db.session.query(Round.round_number, RoundResult.player_id, RoundResult.guess, RoundResult.hits, RoundResult.points)
+        .outerjoin(RoundResult, RoundResult.round_id == Round.id)
+        .filter(Round.game_id == game_id, Round.is_completed == True)
+        .order_by(Round.round_number)
+        .all()
+    )
     
-    round = db.relationship('Round', backref='results')
-    player = db.relationship('Player', backref='round_results')
+    # Group results by round, keeping completed rounds without results as labels
+    round_numbers = []
+    results_by_round = {}
+    for round_number, player_id, guess, hits, points in rows:
+        if round_number not in results_by_round:
+            round_numbers.append(round_number)
+            results_by_round[round_number] = {}
+        if player_id is not None:
+            results_by_round[round_number][player_id] = (guess, hits, points or 0)
+    
+    # Always start with Round 0 (starting point)
+    chart_data = {
+        'labels': ['Round 0'] + [f'Round {n}' for n in round_numbers],
+        'datasets': []
+    }
+    player_figures = {}
+    
+    for i, game_player in enumerate(game_players):
+        player_id = game_player.player_id
+        cumulative_points = 0
+        data = [0]
+        rounds_played = 0
+        correct_guesses = 0
+        
+        for round_number in round_numbers:
+            result = results_by_round[round_number].get(player_id)
+            if result:
+                guess, hits, points = result
+                cumulative_points += points
+                rounds_played += 1
+                if guess == hits:
+                    correct_guesses += 1
+            data.append(cumulative_points)
+        
+        chart_data['datasets'].append({
+            'label': game_player.player.nickname,
+            'data': data,
+            'borderColor': f'hsl({i * 360 // len(game_players)}, 70%, 50%)',
+            'backgroundColor': f'hsla({i * 360 // len(game_players)}, 70%, 50%, 0.1)',
+            'tension': 0.1
+        })
+        player_figures[player_id] = {
+            'rounds_played': rounds_played,
+            'correct_guesses': correct_guesses,
+            'total_guesses': rounds_played,
+            'accuracy': (correct_guesses / rounds_played * 100) if rounds_played > 0 else 0
+        }
+    
+    return chart_data, player_figures
 
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
-    players = Player.query.all()
-    active_games = Game.query.filter_by(is_active=True).order_by(Game.created_at.desc()).all()
-    return render_template('index.html', players=players, active_games=active_games)
+    # The three newest players, with the total counted in the same query
+    rows = db.session.execute(
+        db.select(Player, db.func.count().over()).order_by(Player.id.desc()).limit(3)).all()
+    recent_players = [player for player, _ in reversed(rows)]
+    player_count = rows[0][1] if rows else 0
+    active_games = Game.query.filter_by(is_active=True).options(db.selectinload(Game.game_players)) \
+        .order_by(Game.created_at.desc()).all()
+    return render_template('index.html', player_count=player_count, recent_players=recent_players,
+                           active_games=active_games)
 
-@app.route('/players', methods=['GET', 'POST'])
+@bp.route('/players', methods=['GET', 'POST'])
 def players():
     if request.method == 'POST':
         nickname = request.form['nickname'].strip()
         
         if not nickname:
             flash('Nickname is required!', 'error')
-            return redirect(url_for('players'))
+            return redirect(url_for('.players'))
         
         # Check if nickname already exists
         existing_player = Player.query.filter_by(nickname=nickname).first()
         if existing_player:
             flash(f'Player with nickname "{nickname}" already exists!', 'error')
-            return redirect(url_for('players'))
+            return redirect(url_for('.players'))
         
         new_player = Player(nickname=nickname)
         db.session.add(new_player)
         db.session.commit()
         flash(f'Player "{nickname}" added successfully!', 'success')
-        return redirect(url_for('players'))
+        return redirect(url_for('.players'))
     
-    players = Player.query.all()
-    return render_template('players.html', players=players)
+    # Keyset pagination in nickname order: "after" is the nickname and id of the previous page's last row
+    prefix = request.args.get('q', '').strip()
+    cursor = request.args.get('after', '')
+    after = None
+    if cursor:
+        nickname, _, player_id = cursor.rpartition(',')
+        after = (nickname, int(player_id)) if player_id.isdigit() else None
+    players = search_players(prefix, PLAYER_PAGE_SIZE + 1, after)
+    has_more = len(players) > PLAYER_PAGE_SIZE
+    players = players[:PLAYER_PAGE_SIZE]
+    next_cursor = f'{players[-1].nickname},{players[-1].id}' if has_more else None
+    
+    return render_template('players.html',
+                         players=players,
+                         player_count=Player.query.count(),
+                         prefix=prefix,
+                         is_first_page=after is None,
+                         next_cursor=next_cursor)
+
+@bp.route('/api/players/search')
+def player_search_api():
+    limit = max(1, min(request.args.get('limit', PLAYER_SEARCH_LIMIT, type=int), PLAYER_PAGE_SIZE))
+    players = search_players(request.args.get('q', '').strip(), limit)
+    return jsonify({'players': [{'id': player.id, 'nickname': player.nickname} for player in players]})
 
-@app.route('/edit_player/<int:player_id>', methods=['GET', 'POST'])
+@bp.route('/api/players/suggestions')
+def player_suggestions_api():
+    limit = max(1, min(request.args.get('limit', PLAYER_SEARCH_LIMIT, type=int), PLAYER_PAGE_SIZE))
+    return jsonify({'players': suggest_players(_player_ids_arg(request.args.get('with', '')), limit)})
+
+@bp.route('/edit_player/<int:player_id>', methods=['GET', 'POST'])
 def edit_player(player_id):
     player = Player.query.get_or_404(player_id)
     
@@ -105,108 +3269,127 @@ def edit_player(player_id):
         
         if not new_nickname:
             flash('Nickname is required!', 'error')
-            return redirect(url_for('edit_player', player_id=player_id))
+            return redirect(url_for('.edit_player', player_id=player_id))
         
         # Check if nickname already exists (excluding current player)
         existing_player = Player.query.filter_by(nickname=new_nickname).first()
         if existing_player and existing_player.id != player_id:
             flash(f'Player with nickname "{new_nickname}" already exists!', 'error')
-            return redirect(url_for('edit_player', player_id=player_id))
+            return redirect(url_for('.edit_player', player_id=player_id))
         
         old_nickname = player.nickname
         player.nickname = new_nickname
+        # Nicknames are part of every game view and of opponents' pages, so those change version
+        touch_games(db.select(GamePlayer.game_id).filter(GamePlayer.player_id == player_id))
+        touch_players()
         db.session.commit()
         flash(f'Player "{old_nickname}" updated to "{new_nickname}" successfully!', 'success')
-        return redirect(url_for('players'))
+        return redirect(url_for('.players'))
     
     return render_template('edit_player.html', player=player)
 
-@app.route('/delete_player/<int:player_id>', methods=['POST'])
+@bp.route('/delete_player/<int:player_id>', methods=['POST'])
 def delete_player(player_id):
     player = Player.query.get_or_404(player_id)
     nickname = player.nickname
     
     # Check if player is in any active game
-    active_games = Game.query.filter_by(is_active=True).all()
-    for game in active_games:
-        game_player = GamePlayer.query.filter_by(game_id=game.id, player_id=player_id).first()
-        if game_player:
-            flash(f'Cannot delete player "{nickname}" - they are in an active game!', 'error')
-            return redirect(url_for('players'))
+    in_active_game = db.session.query(GamePlayer.query.join(Game, GamePlayer.game_id == Game.id)
+                                      .filter(GamePlayer.player_id == player_id, Game.is_active == True).exists()).scalar()
+    if in_active_game:
+        flash(f'Cannot delete player "{nickname}" - they are in an active game!', 'error')
+        return redirect(url_for('.players'))
+    
+    # Finished games keep referencing their players
+    has_history = db.session.query(GamePlayer.query.filter_by(player_id=player_id).exists()).scalar()
+    if has_history:
+        flash(f'Cannot delete player "{nickname}" - they appear in the game history! Delete their games first.', 'error')
+        return redirect(url_for('.players'))
     
+    # Rows left behind once their games are gone: totals, a rating back at the start value
+    PlayerStats.query.filter_by(player_id=player_id).delete()
+    PlayerDailyStats.query.filter_by(player_id=player_id).delete()
+    HeadToHead.query.filter(db.or_(HeadToHead.player_id == player_id, HeadToHead.opponent_id == player_id)).delete()
+    RatingHistory.query.filter_by(player_id=player_id).delete()
+    PlayerRating.query.filter_by(player_id=player_id).delete()
     db.session.delete(player)
     db.session.commit()
     flash(f'Player "{nickname}" deleted successfully!', 'success')
-    return redirect(url_for('players'))
+    return redirect(url_for('.players'))
 
-@app.route('/new_game', methods=['GET', 'POST'])
+def form_submission_id():
+    """The idempotency token static/js/forms.js puts into every write form, or None."""
+    return request.form.get('submission_id', '')[:64] or None
+
+@bp.route('/new_game', methods=['GET', 'POST'])
 def new_game():
     if request.method == 'POST':
         player_order = request.form.get('player_order', '')
         
         if not player_order:
             flash('No players selected!', 'error')
-            return redirect(url_for('new_game'))
+            return redirect(url_for('.new_game'))
         
         player_ids = player_order.split(',')
         
         if len(player_ids) < 2:
             flash('At least 2 players are required!', 'error')
-            return redirect(url_for('new_game'))
+            return redirect(url_for('.new_game'))
         
         # Get deck type and force conflict setting
         deck_type = request.form.get('deck_type', 'single')
         force_conflict = request.form.get('force_conflict', 'yes') == 'yes'
         
-        # Calculate max rounds based on deck type
-        n_players = len(player_ids)
-        if deck_type == 'double':
-            max_cards_per_player = math.floor(103 / n_players)
-        else:  # single deck
-            max_cards_per_player = math.floor(51 / n_players)
-        max_rounds = max_cards_per_player * 2 - 1
-        
-        # Create new game with random dealer
+        # Create new game with random dealer; seats follow the specified order
         import random
-        initial_dealer_index = random.randint(0, len(player_ids) - 1)
-        new_game = Game(max_rounds=max_rounds, current_dealer_index=initial_dealer_index, deck_type=deck_type, force_conflict=force_conflict)
+        event = {'type': 'game_created', 'player_ids': [int(player_id) for player_id in player_ids],
+                 'deck_type': deck_type, 'force_conflict': force_conflict,
+                 'dealer_index': random.randint(0, len(player_ids) - 1)}
+        new_game = Game(max_rounds=max_rounds_for(len(player_ids), deck_type), deck_type=deck_type, force_conflict=force_conflict)
         db.session.add(new_game)
-        db.session.commit()
-        
-        # Add players to game in the specified order
-        for player_id in player_ids:
-            game_player = GamePlayer(game_id=new_game.id, player_id=int(player_id))
-            db.session.add(game_player)
-        
-        # Create first round
-        first_round = Round(
-            game_id=new_game.id,
-            round_number=1,
-            cards_per_player=1
-        )
-        db.session.add(first_round)
+        db.session.flush()
+        try:
+            apply_game_event(new_game, event, submission_id=form_submission_id())
+        except DuplicateSubmission as duplicate:
+            # The form was sent twice: the game was already started by the first copy
+            return redirect(url_for('.game', game_id=duplicate.game_id))
+        except RuleError as error:
+            db.session.rollback()
+            flash(str(error), 'error')
+            return redirect(url_for('.new_game'))
         db.session.commit()
         
         flash('New game started!', 'success')
-        return redirect(url_for('game', game_id=new_game.id))
+        return redirect(url_for('.game', game_id=new_game.id))
     
-    players = Player.query.all()
-    return render_template('new_game.html', players=players)
+    return render_template('new_game.html', player_count=Player.query.count(), suggestions=suggest_players())
 
-@app.route('/game/<int:game_id>')
+def game_last_modified(game):
+    return game.updated_at or game.ended_at or game.created_at
+
+def player_last_modified(player):
+    # The last 30 days move on at midnight even when nothing else changes
+    midnight = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    return max(player.updated_at or player.created_at or midnight, midnight)
+
+@bp.route('/game/<int:game_id>')
 def game(game_id):
     game = Game.query.get_or_404(game_id)
+    return conditional_page(f'game-{game.id}-v{game.version}', game_last_modified(game), lambda: render_game(game))
+
+def render_game(game):
+    game_id = game.id
     current_round = Round.query.filter_by(game_id=game_id, round_number=game.current_round).first()
     
     if not current_round:
         flash('No current round found!', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     # Get round results for current round
     round_results = RoundResult.query.filter_by(round_id=current_round.id).all()
     
     # Get all players in this game and order them by dealer
-    game_players = GamePlayer.query.filter_by(game_id=game_id).all()
+    game_players = GamePlayer.query.filter_by(game_id=game_id).options(db.joinedload(GamePlayer.player)).order_by(GamePlayer.id).all()
     
     # Order players: start from player after dealer, end with dealer
     n_players = len(game_players)
@@ -219,46 +3402,7 @@ def game(game_id):
         ordered_players.append(game_players[player_index])
     
     # Prepare chart data
-    chart_data = {
-        'labels': [],
-        'datasets': []
-    }
-    
-    # Get completed rounds for labels
-    completed_rounds = [r for r in game.rounds if r.is_completed]
-    
-    # Always start with Round 0 (starting point)
-    chart_data['labels'] = ['Round 0']
-    
-    # Add completed rounds
-    for round_obj in completed_rounds:
-        chart_data['labels'].append(f'Round {round_obj.round_number}')
-    
-    # Prepare datasets for each player
-    for i, game_player in enumerate(game_players):
-        player_data = {
-            'label': game_player.player.nickname,
-            'data': [],
-            'borderColor': f'hsl({i * 360 // len(game_players)}, 70%, 50%)',
-            'backgroundColor': f'hsla({i * 360 // len(game_players)}, 70%, 50%, 0.1)',
-            'tension': 0.1
-        }
-        
-        # Always start with 0 points
-        player_data['data'] = [0]
-        
-        # Add cumulative points for completed rounds
-        cumulative_points = 0
-        for round_obj in completed_rounds:
-            round_result = RoundResult.query.filter_by(
-                round_id=round_obj.id, 
-                player_id=game_player.player.id
-            ).first()
-            if round_result:
-                cumulative_points += round_result.points
-            player_data['data'].append(cumulative_points)
-        
-        chart_data['datasets'].append(player_data)
+    chart_data, _ = compute_score_series(game_id, game_players)
     
     force_conflict_value = getattr(game, 'force_conflict', True)
     
@@ -278,198 +3422,320 @@ def game(game_id):
                          min_points=min_points,
                          point_range=point_range)
 
-@app.route('/submit_guesses', methods=['POST'])
+@bp.route('/submit_guesses', methods=['POST'])
+@serialized_write
 def submit_guesses():
     game_id = request.form['game_id']
     round_id = request.form['round_id']
     
     game = Game.query.get_or_404(game_id)
     current_round = Round.query.get_or_404(round_id)
+    if current_round.game_id != game.id:
+        abort(404)
     
-    # Clear existing guesses for this round
-    RoundResult.query.filter_by(round_id=round_id).delete()
-    
-    # Collect guesses and validate
-    total_guess = 0
-    guesses = {}
-    
-    for key, value in request.form.items():
-        if key.startswith('guess_'):
-            player_id = int(key.split('_')[1])
-            guess = int(value)
-            guesses[player_id] = guess
-            total_guess += guess
-    
-    # Check if total guesses equals number of cards (only if force_conflict is enabled)
-    force_conflict = getattr(game, 'force_conflict', True)
-    if force_conflict and total_guess == current_round.cards_per_player:
-        flash(f'Total guesses ({total_guess}) cannot equal the number of cards ({current_round.cards_per_player}) in this round! Please adjust your guesses.', 'error')
-        return redirect(url_for('game', game_id=game_id))
-    
-    # Add new guesses
-    for player_id, guess in guesses.items():
-        round_result = RoundResult(
-            round_id=round_id,
-            player_id=player_id,
-            guess=guess
-        )
-        db.session.add(round_result)
-    
-    # Set started_at timestamp if this is the first round and game hasn't started yet
-    if current_round.round_number == 1 and not game.started_at:
-        game.started_at = datetime.now(timezone.utc)
-    
+    guesses = [[int(key.split('_')[1]), int(value)] for key, value in request.form.items() if key.startswith('guess_')]
+    try:
+        # The rules check the round and, if force_conflict is enabled, that the total is not the number of cards
+        delta = apply_game_event(game, {'type': 'guesses_set', 'round': current_round.round_number, 'guesses': guesses},
+                                 submission_id=form_submission_id(),
+                                 expected_rounds=[(current_round, request.form.get('round_version', type=int))],
+                                 round_obj=current_round)
+    except DuplicateSubmission:
+        # A double tap: the first copy was saved, so answer as it did
+        flash('Guesses submitted successfully!', 'success')
+        return redirect(url_for('.game', game_id=game_id))
+    except GameConflict as conflict:
+        flash(str(conflict), 'warning')
+        return redirect(url_for('.game', game_id=game_id))
+    except RuleError as error:
+        flash(str(error), 'error')
+        return redirect(url_for('.game', game_id=game_id))
     db.session.commit()
+    game_events.publish(game.id, 'guesses', delta)
     flash('Guesses submitted successfully!', 'success')
-    return redirect(url_for('game', game_id=game_id))
+    return redirect(url_for('.game', game_id=game_id))
 
-@app.route('/force_end_game/<int:game_id>', methods=['POST'])
+@bp.route('/force_end_game/<int:game_id>', methods=['POST'])
+@serialized_write
 def force_end_game(game_id):
     game = Game.query.get_or_404(game_id)
-    game.is_active = False
-    game.ended_early = True
-    game.ended_at = datetime.now(timezone.utc)
+    try:
+        delta = apply_game_event(game, {'type': 'game_ended_early'}, submission_id=form_submission_id())
+    except DuplicateSubmission:
+        flash('Game ended early!', 'warning')
+        return redirect(url_for('.game_summary', game_id=game_id))
+    except GameConflict as conflict:
+        flash(str(conflict), 'warning')
+        return redirect(url_for('.game', game_id=game_id))
+    except RuleError as error:
+        flash(str(error), 'warning')
+        return redirect(url_for('.game_summary', game_id=game_id))
     db.session.commit()
+    game_events.publish(game.id, 'ended', delta)
     flash('Game ended early!', 'warning')
-    return redirect(url_for('game_summary', game_id=game_id))
+    return redirect(url_for('.game_summary', game_id=game_id))
 
-@app.route('/submit_results', methods=['POST'])
+@bp.route('/submit_results', methods=['POST'])
+@serialized_write
 def submit_results():
     game_id = request.form['game_id']
     round_id = request.form['round_id']
     
     game = Game.query.get_or_404(game_id)
     current_round = Round.query.get_or_404(round_id)
+    if current_round.game_id != game.id:
+        abort(404)
     
-    # Update results and calculate points
-    for key, value in request.form.items():
-        if key.startswith('hits_'):
-            player_id = int(key.split('_')[1])
-            hits = int(value)
-            
-            round_result = RoundResult.query.filter_by(
-                round_id=round_id, 
-                player_id=player_id
-            ).first()
-            
-            if round_result:
-                round_result.hits = hits
-                
-                # Calculate points
-                if round_result.guess == hits:
-                    # Correct guess: 10 + 2*n_hits
-                    round_result.points = 10 + 2 * hits
-                else:
-                    # Incorrect guess: -2*abs(guess-hits) (negative points)
-                    round_result.points = -2 * abs(round_result.guess - hits)
-    
-    # Mark round as completed
-    current_round.is_completed = True
-    
-    # Update total points for each player
-    for round_result in RoundResult.query.filter_by(round_id=round_id).all():
-        game_player = GamePlayer.query.filter_by(
-            game_id=game_id, 
-            player_id=round_result.player_id
-        ).first()
-        if game_player:
-            game_player.total_points += round_result.points
-    
-    # Move to next round or end game
-    if game.current_round < game.max_rounds:
-        game.current_round += 1
-        
-        # Rotate dealer to next player
-        n_players = len(GamePlayer.query.filter_by(game_id=game_id).all())
-        game.current_dealer_index = (game.current_dealer_index + 1) % n_players
-        
-        # Calculate cards for next round
-        if game.current_round <= game.max_rounds // 2 + 1:
-            # Going up: 1, 2, 3, ..., max_cards_per_player
-            cards_per_player = game.current_round
-        else:
-            # Going down: max_cards_per_player-1, max_cards_per_player-2, ..., 1
-            max_cards = game.max_rounds // 2 + 1
-            cards_per_player = max_cards - (game.current_round - max_cards)
-        
-        # Create next round
-        next_round = Round(
-            game_id=game_id,
-            round_number=game.current_round,
-            cards_per_player=cards_per_player
-        )
-        db.session.add(next_round)
-    else:
-        # Game finished
-        game.is_active = False
-        game.ended_at = datetime.now(timezone.utc)
+    hits = [[int(key.split('_')[1]), int(value)] for key, value in request.form.items() if key.startswith('hits_')]
+    try:
+        delta = apply_game_event(game, {'type': 'results_set', 'round': current_round.round_number, 'hits': hits},
+                                 submission_id=form_submission_id(),
+                                 expected_rounds=[(current_round, request.form.get('round_version', type=int))],
+                                 round_obj=current_round)
+    except DuplicateSubmission:
+        # A double tap: the first copy already scored the round and moved the game on
+        return redirect(url_for('.game', game_id=game_id))
+    except GameConflict as conflict:
+        flash(str(conflict), 'warning')
+        return redirect(url_for('.game', game_id=game_id))
+    except RuleError as error:
+        flash(str(error), 'error')
+        return redirect(url_for('.game', game_id=game_id))
+    db.session.commit()
+    game_events.publish(game.id, 'results', delta)
+    
+    if not game.is_active:
         flash('Game completed!', 'success')
-        return redirect(url_for('game_summary', game_id=game_id))
+        return redirect(url_for('.game_summary', game_id=game_id))
+    return redirect(url_for('.game', game_id=game_id))
+
+@bp.route('/api/game/<int:game_id>/state')
+def game_state(game_id):
+    game = Game.query.get_or_404(game_id)
     
-    db.session.commit()
-    return redirect(url_for('game', game_id=game_id))
+    # Conditional GET: unchanged games cost a single primary-key lookup
+    return conditional_page(f'game-state-{game.id}-v{game.version}', game_last_modified(game),
+                            lambda: render_game_state(game))
 
-@app.route('/history')
-def history():
-    completed_games = Game.query.filter_by(is_active=False).order_by(Game.created_at.desc()).all()
-    return render_template('history.html', games=completed_games)
+def render_game_state(game):
+    game_id = game.id
+    game_players = GamePlayer.query.filter_by(game_id=game_id).options(db.joinedload(GamePlayer.player)).order_by(GamePlayer.id).all()
+    current_round = Round.query.filter_by(game_id=game_id, round_number=game.current_round).first()
+    guesses = {}
+    if current_round:
+        guesses = {result.player_id: {'guess': result.guess, 'hits': result.hits, 'points': result.points}
+                   for result in RoundResult.query.filter_by(round_id=current_round.id)}
+    chart_data, _ = compute_score_series(game_id, game_players)
+    
+    return jsonify({
+        'game_id': game.id,
+        'version': game.version,
+        'is_active': game.is_active,
+        'ended_early': game.ended_early,
+        'deck_type': game.deck_type,
+        'force_conflict': game.force_conflict,
+        'max_rounds': game.max_rounds,
+        'dealer_index': game.current_dealer_index,
+        'current_round': {
+            'id': current_round.id,
+            'round_number': current_round.round_number,
+            'cards_per_player': current_round.cards_per_player,
+            'is_completed': current_round.is_completed,
+            'results': {str(player_id): result for player_id, result in guesses.items()}
+        } if current_round else None,
+        'players': [{
+            'id': game_player.player_id,
+            'nickname': game_player.player.nickname,
+            'total_points': game_player.total_points
+        } for game_player in game_players],
+        'score_series': {
+            'labels': chart_data['labels'],
+            'points': {str(game_player.player_id): dataset['data']
+                       for game_player, dataset in zip(game_players, chart_data['datasets'])}
+        }
+    })
 
-@app.route('/game_summary/<int:game_id>')
-def game_summary(game_id):
+@bp.route('/api/game/<int:game_id>/bid_advice')
+def game_bid_advice(game_id):
     game = Game.query.get_or_404(game_id)
+    current_round = Round.query.filter_by(game_id=game_id, round_number=game.current_round).first_or_404()
+    strategy = request.args.get('strategy', 'greedy')
+    if strategy not in simulator.STRATEGIES:
+        abort(400)
     
-    # Fix: Ensure completed games have ended_at timestamp
-    if not game.is_active and not game.ended_at:
-        game.ended_at = datetime.now(timezone.utc)
-        db.session.commit()
+    # Seats in bidding order: from the player after the dealer to the dealer
+    game_players = GamePlayer.query.filter_by(game_id=game_id).options(db.joinedload(GamePlayer.player)).order_by(GamePlayer.id).all()
+    n_players = len(game_players)
+    ordered_players = [game_players[(game.current_dealer_index + 1 + i) % n_players] for i in range(n_players)]
+    advice = bid_advice_for(n_players, current_round.cards_per_player, game.deck_type, strategy)
     
-    game_players = GamePlayer.query.filter_by(game_id=game_id).order_by(GamePlayer.total_points.desc()).all()
-    rounds = Round.query.filter_by(game_id=game_id).order_by(Round.round_number).all()
+    return jsonify({
+        'game_id': game.id,
+        'round_number': current_round.round_number,
+        'cards': current_round.cards_per_player,
+        'deck_type': game.deck_type,
+        'force_conflict': game.force_conflict,
+        'strategy': strategy,
+        'hands': current_app.config['BID_ADVICE_HANDS'],
+        'seats': [dict(seat_advice, player_id=game_player.player_id, nickname=game_player.player.nickname,
+                       is_dealer=seat_advice['seat'] == n_players - 1)
+                  for game_player, seat_advice in zip(ordered_players, advice)]
+    })
+
+@bp.route('/api/game/<int:game_id>/events')
+def game_event_stream(game_id):
+    game = Game.query.get_or_404(game_id)
+    start_version = request.headers.get('Last-Event-ID', type=int)
+    current_version = game.version
+    # Hand the connection back to the pool before the long-lived stream starts
+    db.session.close()
     
-    # Prepare chart data
-    chart_data = {
-        'labels': [],
-        'datasets': []
-    }
+    # Every stream holds a server thread: past the limit, clients poll the state API instead
+    if not game_events.open_stream(current_app.config['LIVE_STREAMS']):
+        return '', 204
+    closes_at = time.monotonic() + current_app.config['LIVE_STREAM_SECONDS']
     
-    # Get completed rounds for labels
-    completed_rounds = [r for r in rounds if r.is_completed]
+    def stream():
+        subscription = game_events.subscribe(game_id)
+        try:
+            version = current_version
+            yield f'retry: {SSE_RETRY_MS}\n\n'
+            if start_version is not None and start_version < current_version:
+                # Reconnecting client missed updates: tell it to refetch the state
+                yield _sse_message('state', {'version': current_version}, current_version)
+            else:
+                # The version the client resumes from when it reconnects
+                yield f'id: {current_version}\n\n'
+            
+            while True:
+                remaining = closes_at - time.monotonic()
+                if remaining <= 0:
+                    # Free the thread; the client reconnects with Last-Event-ID after SSE_RETRY_MS
+                    return
+                try:
+                    event, data = subscription.get(timeout=min(SSE_KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    # Pick up changes committed by other worker processes
+                    latest = _current_game_version(game_id)
+                    if latest is None:
+                        yield _sse_message('deleted', {'game_id': game_id})
+                        return
+                    if latest > version:
+                        version = latest
+                        yield _sse_message('state', {'version': version}, version)
+                    else:
+                        yield ': keep-alive\n\n'
+                    continue
+                
+                if event == 'deleted':
+                    yield _sse_message(event, data)
+                    return
+                if data['version'] <= version:
+                    continue
+                version = data['version']
+                yield _sse_message(event, data, version)
+        finally:
+            game_events.unsubscribe(game_id, subscription)
     
-    # Always start with Round 0 (starting point)
-    chart_data['labels'] = ['Round 0']
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(game_events.close_stream)
+    return response
+
+HISTORY_PAGE_SIZE = 25
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+@bp.route('/history')
+def history():
+    # Filters
+    player_id = request.args.get('player', type=int)
+    deck_type = request.args.get('deck', '')
+    date_from = _parse_date(request.args.get('from', ''))
+    date_to = _parse_date(request.args.get('to', ''))
     
-    # Add completed rounds
-    for round_obj in completed_rounds:
-        chart_data['labels'].append(f'Round {round_obj.round_number}')
+    query = Game.query.filter(Game.is_active == False)
+    if player_id:
+        query = query.filter(Game.id.in_(db.select(GamePlayer.game_id).filter(GamePlayer.player_id == player_id)))
+    if deck_type in ('single', 'double'):
+        query = query.filter(Game.deck_type == deck_type)
+    if date_from:
+        query = query.filter(Game.created_at >= date_from)
+    if date_to:
+        query = query.filter(Game.created_at < date_to + timedelta(days=1))
     
-    # Prepare datasets for each player (ordered by final points)
-    for i, game_player in enumerate(game_players):
-        player_data = {
-            'label': game_player.player.nickname,
-            'data': [],
-            'borderColor': f'hsl({i * 360 // len(game_players)}, 70%, 50%)',
-            'backgroundColor': f'hsla({i * 360 // len(game_players)}, 70%, 50%, 0.1)',
-            'tension': 0.1
-        }
-        
-        # Always start with 0 points
-        player_data['data'] = [0]
-        
-        # Add cumulative points for completed rounds
-        cumulative_points = 0
-        for round_obj in completed_rounds:
-            round_result = RoundResult.query.filter_by(
-                round_id=round_obj.id, 
-                player_id=game_player.player.id
-            ).first()
-            if round_result:
-                cumulative_points += round_result.points
-            player_data['data'].append(cumulative_points)
-        
-        chart_data['datasets'].append(player_data)
+    # Keyset pagination on (created_at, id): "before" is the last row of the previous page
+    cursor = request.args.get('before', '')
+    if cursor:
+        try:
+            cursor_created, cursor_id = cursor.rsplit(',', 1)
+            cursor_created, cursor_id = datetime.fromisoformat(cursor_created), int(cursor_id)
+            query = query.filter(db.or_(
+                Game.created_at < cursor_created,
+                db.and_(Game.created_at == cursor_created, Game.id < cursor_id)
+            ))
+        except ValueError:
+            cursor = ''
+    
+    # Players are loaded for the whole page in one extra query
+    games = (query.options(db.selectinload(Game.game_players).joinedload(GamePlayer.player))
+             .order_by(Game.created_at.desc(), Game.id.desc())
+             .limit(HISTORY_PAGE_SIZE + 1)
+             .all())
+    has_more = len(games) > HISTORY_PAGE_SIZE
+    games = games[:HISTORY_PAGE_SIZE]
+    
+    # Winner per game: highest total, ties go to the earliest seat
+    winners = {}
+    for game in games:
+        if game.game_players:
+            winners[game.id] = max(sorted(game.game_players, key=lambda gp: gp.id), key=lambda gp: gp.total_points)
+    
+    filters = {key: request.args[key] for key in ('player', 'deck', 'from', 'to') if request.args.get(key)}
+    next_cursor = f'{games[-1].created_at.isoformat()},{games[-1].id}' if has_more else None
+    
+    return render_template('history.html',
+                         games=games,
+                         winners=winners,
+                         selected_player=db.session.get(Player, player_id) if player_id else None,
+                         filters=filters,
+                         is_first_page=not cursor,
+                         next_cursor=next_cursor)
+
+@bp.route('/game_summary/<int:game_id>')
+def game_summary(game_id):
+    game = Game.query.get_or_404(game_id)
+    
+    return conditional_page(f'game-summary-{game.id}-v{game.version}', game_last_modified(game),
+                            lambda: render_cached_game_summary(game))
+
+def render_cached_game_summary(game):
+    # The rendered summary only changes when the game's version does
+    summary_html = render_cache.get(('game_summary', game.id), game.version)
+    if summary_html is None:
+        summary_html = render_game_summary(game)
+        render_cache.put(('game_summary', game.id), game.version, summary_html)
+    return render_template('game_summary.html', summary_html=Markup(summary_html))
+
+def render_game_summary(game):
+    game_id = game.id
+    game_players = (GamePlayer.query.filter_by(game_id=game_id)
+                    .options(db.joinedload(GamePlayer.player))
+                    .order_by(GamePlayer.total_points.desc(), GamePlayer.id).all())
+    rounds = (Round.query.filter_by(game_id=game_id)
+              .options(db.selectinload(Round.results))
+              .order_by(Round.round_number).all())
+    
+    # Prepare chart data and per-player guess figures (ordered by final points)
+    chart_data, player_figures = compute_score_series(game_id, game_players)
     
     # Calculate statistics
-    total_rounds = len(completed_rounds)
+    total_rounds = len(chart_data['labels']) - 1
     total_players = len(game_players)
     winner = game_players[0] if game_players else None
     max_points = winner.total_points if winner else 0
@@ -479,36 +3745,21 @@ def game_summary(game_id):
     # Calculate average points per round for each player
     player_stats = []
     for game_player in game_players:
-        total_rounds_played = len([r for r in completed_rounds if 
-            RoundResult.query.filter_by(round_id=r.id, player_id=game_player.player.id).first()])
+        figures = player_figures[game_player.player_id]
+        total_rounds_played = figures['rounds_played']
         avg_points_per_round = game_player.total_points / total_rounds_played if total_rounds_played > 0 else 0
         
-        # Count correct guesses
-        correct_guesses = 0
-        total_guesses = 0
-        for round_obj in completed_rounds:
-            round_result = RoundResult.query.filter_by(
-                round_id=round_obj.id, 
-                player_id=game_player.player.id
-            ).first()
-            if round_result:
-                total_guesses += 1
-                if round_result.guess == round_result.hits:
-                    correct_guesses += 1
-        
-        accuracy = (correct_guesses / total_guesses * 100) if total_guesses > 0 else 0
-        
         player_stats.append({
             'player': game_player.player,
             'total_points': game_player.total_points,
             'avg_points_per_round': avg_points_per_round,
-            'correct_guesses': correct_guesses,
-            'total_guesses': total_guesses,
-            'accuracy': accuracy
+            'correct_guesses': figures['correct_guesses'],
+            'total_guesses': figures['total_guesses'],
+            'accuracy': figures['accuracy']
         })
     
     force_conflict_value = getattr(game, 'force_conflict', True)
-    return render_template('game_summary.html', 
+    return render_template('game_summary_content.html', 
                          game=game, 
                          game_players=game_players,
                          rounds=rounds,
@@ -522,89 +3773,72 @@ def game_summary(game_id):
                          point_spread=point_spread,
                          force_conflict=force_conflict_value)
 
-@app.route('/edit_game/<int:game_id>', methods=['GET', 'POST'])
+@bp.route('/edit_game/<int:game_id>', methods=['GET', 'POST'])
+@serialized_write
 def edit_game(game_id):
     game = Game.query.get_or_404(game_id)
     rounds = Round.query.filter_by(game_id=game_id).order_by(Round.round_number).all()
-    game_players = GamePlayer.query.filter_by(game_id=game_id).all()
+    game_players = GamePlayer.query.filter_by(game_id=game_id).options(db.joinedload(GamePlayer.player)).order_by(GamePlayer.id).all()
+    
+    # The whole grid in one query, keyed by (round_id, player_id)
+    results = {(r.round_id, r.player_id): r for r in
+               RoundResult.query.join(Round, RoundResult.round_id == Round.id).filter(Round.game_id == game_id)}
     
     if request.method == 'POST':
-        # Handle form submission
+        # Record only the cells that differ from what is stored
+        cells = []
         for round_obj in rounds:
             for game_player in game_players:
-                guess_key = f'guess_{round_obj.id}_{game_player.player.id}'
-                hits_key = f'hits_{round_obj.id}_{game_player.player.id}'
+                guess_key = f'guess_{round_obj.id}_{game_player.player_id}'
+                hits_key = f'hits_{round_obj.id}_{game_player.player_id}'
                 
                 if guess_key in request.form and hits_key in request.form:
                     guess = int(request.form[guess_key])
                     hits = int(request.form[hits_key])
                     
-                    # Find or create round result
-                    round_result = RoundResult.query.filter_by(
-                        round_id=round_obj.id,
-                        player_id=game_player.player.id
-                    ).first()
-                    
-                    if not round_result:
-                        round_result = RoundResult(
-                            round_id=round_obj.id,
-                            player_id=game_player.player.id,
-                            guess=guess,
-                            hits=hits
-                        )
-                        db.session.add(round_result)
-                    else:
-                        round_result.guess = guess
-                        round_result.hits = hits
-                    
-                    # Recalculate points
-                    if round_result.guess == round_result.hits:
-                        round_result.points = 10 + 2 * round_result.hits
-                    else:
-                        round_result.points = -2 * abs(round_result.guess - round_result.hits)
-        
-        # Recalculate total points for all players
-        for game_player in game_players:
-            total_points = 0
-            for round_obj in rounds:
-                round_result = RoundResult.query.filter_by(
-                    round_id=round_obj.id,
-                    player_id=game_player.player.id
-                ).first()
-                if round_result and round_result.points is not None:
-                    total_points += round_result.points
-            game_player.total_points = total_points
+                    round_result = results.get((round_obj.id, game_player.player_id))
+                    if round_result and round_result.guess == guess and round_result.hits == hits:
+                        continue
+                    cells.append([round_obj.round_number, game_player.player_id, guess, hits])
         
-        # Mark all rounds as completed if they have results
-        for round_obj in rounds:
-            round_results = RoundResult.query.filter_by(round_id=round_obj.id).all()
-            if round_results:
-                round_obj.is_completed = True
+        if not cells:
+            flash('No changes to save.', 'info')
+            return redirect(url_for('.game_summary', game_id=game_id))
         
+        # Totals, completed rounds, statistics and ratings follow from the corrected cells;
+        # a round someone else changed since the form was loaded is not overwritten
+        rounds_by_number = {round_obj.round_number: round_obj for round_obj in rounds}
+        edited_rounds = [rounds_by_number[number] for number in sorted({cell[0] for cell in cells})]
+        try:
+            delta = apply_game_event(game, {'type': 'results_edited', 'cells': cells},
+                                     submission_id=form_submission_id(),
+                                     expected_rounds=[(round_obj, request.form.get(f'round_version_{round_obj.id}', type=int))
+                                                      for round_obj in edited_rounds],
+                                     rounds=rounds, results=results, game_players=game_players)
+        except DuplicateSubmission:
+            flash('Game data updated successfully! Points and graph have been recalculated.', 'success')
+            return redirect(url_for('.game_summary', game_id=game_id))
+        except GameConflict as conflict:
+            flash(str(conflict), 'warning')
+            return redirect(url_for('.edit_game', game_id=game_id))
+        except RuleError as error:
+            flash(str(error), 'error')
+            return redirect(url_for('.edit_game', game_id=game_id))
         db.session.commit()
+        game_events.publish(game.id, 'state', delta)
         flash('Game data updated successfully! Points and graph have been recalculated.', 'success')
-        return redirect(url_for('game_summary', game_id=game_id))
+        return redirect(url_for('.game_summary', game_id=game_id))
     
     # Prepare data for template
     round_data = []
     for round_obj in rounds:
-        round_info = {
+        round_data.append({
             'round': round_obj,
-            'players': []
-        }
-        
-        for game_player in game_players:
-            round_result = RoundResult.query.filter_by(
-                round_id=round_obj.id,
-                player_id=game_player.player.id
-            ).first()
-            
-            round_info['players'].append({
+            'players': [{
                 'game_player': game_player,
-                'result': round_result
-            })
-        
-        round_data.append(round_info)
+                'result': results.get((round_obj.id, game_player.player_id))
+            } for game_player in game_players]
+        })
     
     return render_template('edit_game.html', 
                          game=game, 
@@ -613,148 +3847,97 @@ def edit_game(game_id):
 
 
 
-@app.route('/player/<int:player_id>')
+@bp.route('/player/<int:player_id>')
 def player_stats(player_id):
     player = Player.query.get_or_404(player_id)
+    return conditional_page(f'player-{player.id}-v{player.version}-{datetime.utcnow():%Y%m%d}', player_last_modified(player),
+                            lambda: render_player_stats(player))
+
+def render_player_stats(player):
+    player_id = player.id
     
-    # Get all games this player has participated in
-    game_players = GamePlayer.query.filter_by(player_id=player_id).all()
-    game_ids = [gp.game_id for gp in game_players]
-    games = Game.query.filter(Game.id.in_(game_ids)).all()
+    # Aggregates are maintained by record_game_stats/discard_game_stats
+    stats = db.session.get(PlayerStats, player_id) or PlayerStats(
+        player_id=player_id, games_played=0, wins=0, total_points=0,
+        rounds_played=0, total_guesses=0, correct_guesses=0, position_counts={})
+    position_counts = {int(pos): count for pos, count in (stats.position_counts or {}).items()}
     
-    # Separate completed and active games
-    completed_games = [g for g in games if not g.is_active]
-    active_games = [g for g in games if g.is_active]
+    # Per-game lines in chronological order
+    game_lines = PlayerGameStats.query.filter_by(player_id=player_id).order_by(
+        PlayerGameStats.ended_at, PlayerGameStats.game_id).all()
+    positions = [line.position for line in game_lines]
+    
+    rating = db.session.get(PlayerRating, player_id)
+    recent = period_stats(player_id, *period_bounds('last-30-days', datetime.utcnow().date()))
+    
+    active_games = (Game.query.join(GamePlayer, GamePlayer.game_id == Game.id)
+                    .filter(GamePlayer.player_id == player_id, Game.is_active == True)
+                    .order_by(Game.created_at.desc()).all())
     
     # Calculate basic statistics
-    total_games = len(completed_games)
-    total_rounds_played = 0
-    total_correct_guesses = 0
-    total_guesses = 0
-    total_points = 0
-    wins = 0
-    positions = []
-    opponent_stats = {}
-    
-    # Process each completed game
-    for game in completed_games:
-        # Get player's performance in this game
-        game_player = GamePlayer.query.filter_by(game_id=game.id, player_id=player_id).first()
-        if not game_player:
-            continue
-            
-        # Count rounds played
-        rounds_in_game = Round.query.filter_by(game_id=game.id, is_completed=True).all()
-        total_rounds_played += len(rounds_in_game)
-        
-        # Calculate position in this game
-        all_game_players = GamePlayer.query.filter_by(game_id=game.id).order_by(GamePlayer.total_points.desc()).all()
-        position = 1
-        for i, gp in enumerate(all_game_players):
-            if gp.player_id == player_id:
-                position = i + 1
-                break
-        positions.append(position)
-        
-        # Check if won (1st place)
-        if position == 1:
-            wins += 1
-        
-        # Add to total points
-        total_points += game_player.total_points
-        
-        # Count correct guesses and total guesses
-        for round_obj in rounds_in_game:
-            round_result = RoundResult.query.filter_by(
-                round_id=round_obj.id, 
-                player_id=player_id
-            ).first()
-            if round_result:
-                total_guesses += 1
-                if round_result.guess == round_result.hits:
-                    total_correct_guesses += 1
-        
-        # Track opponents
-        other_players = [gp for gp in all_game_players if gp.player_id != player_id]
-        for other_gp in other_players:
-            opponent_id = other_gp.player_id
-            opponent = Player.query.get(opponent_id)
-            if opponent_id not in opponent_stats:
-                opponent_stats[opponent_id] = {
-                    'player': opponent,
-                    'games_played': 0,
-                    'wins_against': 0,
-                    'total_points_against': 0,
-                    'total_points_opponent': 0
-                }
-            
-            opponent_stats[opponent_id]['games_played'] += 1
-            opponent_stats[opponent_id]['total_points_against'] += game_player.total_points
-            opponent_stats[opponent_id]['total_points_opponent'] += other_gp.total_points
-            
-            # Check if won against this opponent
-            if position < [i+1 for i, gp in enumerate(all_game_players) if gp.player_id == opponent_id][0]:
-                opponent_stats[opponent_id]['wins_against'] += 1
+    total_games = stats.games_played
+    total_rounds_played = stats.rounds_played
+    total_points = stats.total_points
+    wins = stats.wins
     
     # Calculate derived statistics
     win_rate = (wins / total_games * 100) if total_games > 0 else 0
-    correct_guess_ratio = (total_correct_guesses / total_guesses * 100) if total_guesses > 0 else 0
-    average_position = sum(positions) / len(positions) if positions else 0
+    correct_guess_ratio = (stats.correct_guesses / stats.total_guesses * 100) if stats.total_guesses > 0 else 0
+    average_position = sum(pos * count for pos, count in position_counts.items()) / total_games if total_games > 0 else 0
     average_points_per_game = total_points / total_games if total_games > 0 else 0
     average_points_per_round = total_points / total_rounds_played if total_rounds_played > 0 else 0
     
     # Additional statistics
-    best_position = min(positions) if positions else 0
-    worst_position = max(positions) if positions else 0
-    first_place_finishes = positions.count(1) if positions else 0
-    last_place_finishes = positions.count(max(positions)) if positions else 0
+    best_position = min(position_counts) if position_counts else 0
+    worst_position = max(position_counts) if position_counts else 0
+    first_place_finishes = position_counts.get(1, 0)
+    last_place_finishes = position_counts.get(worst_position, 0)
     
     # Calculate consistency (lower standard deviation = more consistent)
-    if len(positions) > 1:
-        position_variance = sum((pos - average_position) ** 2 for pos in positions) / len(positions)
+    if total_games > 1:
+        position_variance = sum(count * (pos - average_position) ** 2 for pos, count in position_counts.items()) / total_games
         position_std_dev = position_variance ** 0.5
     else:
         position_std_dev = 0
     
-    # Calculate win rate against each opponent
-    for opponent_id, stats in opponent_stats.items():
-        stats['win_rate_against'] = (stats['wins_against'] / stats['games_played'] * 100) if stats['games_played'] > 0 else 0
-        stats['avg_points_against'] = stats['total_points_against'] / stats['games_played'] if stats['games_played'] > 0 else 0
-        stats['avg_points_opponent'] = stats['total_points_opponent'] / stats['games_played'] if stats['games_played'] > 0 else 0
+    # Opponents come straight from the head-to-head store
+    opponent_stats = []
+    for record, opponent in (db.session.query(HeadToHead, Player)
+                             .join(Player, Player.id == HeadToHead.opponent_id)
+                             .filter(HeadToHead.player_id == player_id)):
+        opponent_stats.append({
+            'player': opponent,
+            'games_played': record.games,
+            'wins_against': record.wins,
+            'total_points_against': record.points_for,
+            'total_points_opponent': record.points_against,
+            'win_rate_against': record.wins / record.games * 100,
+            'avg_points_against': record.points_for / record.games,
+            'avg_points_opponent': record.points_against / record.games
+        })
     
     # Sort opponents by games played (most common first)
-    sorted_opponents = sorted(opponent_stats.values(), key=lambda x: x['games_played'], reverse=True)
+    sorted_opponents = sorted(opponent_stats, key=lambda x: x['games_played'], reverse=True)
     
     # Get recent games (last 10)
-    recent_games = sorted(completed_games, key=lambda x: x.ended_at or x.created_at, reverse=True)[:10]
+    recent_games = list(reversed(game_lines[-10:]))
     
     # Prepare chart data for performance over time
     chart_data = {
-        'labels': [],
+        'labels': [f'Game {line.game_id}' for line in game_lines],
         'datasets': [{
             'label': 'Position',
-            'data': [],
+            'data': positions,
             'borderColor': 'rgb(75, 192, 192)',
             'backgroundColor': 'rgba(75, 192, 192, 0.2)',
             'tension': 0.1
         }]
     }
     
-    # Add data points for each game (in chronological order)
-    chronological_games = sorted(completed_games, key=lambda x: x.ended_at or x.created_at)
-    for game in chronological_games:
-        all_game_players = GamePlayer.query.filter_by(game_id=game.id).order_by(GamePlayer.total_points.desc()).all()
-        position = 1
-        for i, gp in enumerate(all_game_players):
-            if gp.player_id == player_id:
-                position = i + 1
-                break
-        
-        chart_data['labels'].append(f'Game {game.id}')
-        chart_data['datasets'][0]['data'].append(position)
-    
     return render_template('player_stats.html',
                          player=player,
+                         rating=rating.rating if rating else RATING_START,
+                         recent=recent,
                          total_games=total_games,
                          total_rounds_played=total_rounds_played,
                          wins=wins,
@@ -765,6 +3948,7 @@ def player_stats(player_id):
                          average_points_per_round=average_points_per_round,
                          total_points=total_points,
                          positions=positions,
+                         position_counts=position_counts,
                          best_position=best_position,
                          worst_position=worst_position,
                          first_place_finishes=first_place_finishes,
@@ -775,29 +3959,247 @@ def player_stats(player_id):
                          active_games=active_games,
                          chart_data=chart_data)
 
-@app.route('/delete_game/<int:game_id>', methods=['POST'])
+@bp.route('/rankings')
+def rankings():
+    ratings = (PlayerRating.query.options(db.joinedload(PlayerRating.player))
+               .filter(PlayerRating.games_rated > 0)
+               .order_by(PlayerRating.rating.desc()).all())
+    return render_template('rankings.html', ratings=ratings, start_rating=RATING_START)
+
+def load_head_to_head(min_games=1):
+    """Players and the full pairwise matrix {player_id: {opponent_id: record}}, in one query."""
+    rows = (db.session.query(HeadToHead, Player)
+            .join(Player, Player.id == HeadToHead.player_id)
+            .filter(HeadToHead.games >= min_games)
+            .order_by(Player.nickname)
+            .all())
+    players = {}
+    matrix = {}
+    for record, player in rows:
+        players[player.id] = player
+        matrix.setdefault(player.id, {})[record.opponent_id] = record
+    return list(players.values()), matrix
+
+@bp.route('/head_to_head')
+def head_to_head():
+    min_games = request.args.get('min_games', 1, type=int)
+    players, matrix = load_head_to_head(min_games)
+    return render_template('head_to_head.html', players=players, matrix=matrix, min_games=min_games)
+
+@bp.route('/api/head_to_head')
+def head_to_head_api():
+    players, matrix = load_head_to_head(request.args.get('min_games', 1, type=int))
+    return jsonify({
+        'players': [{'id': player.id, 'nickname': player.nickname} for player in players],
+        'matrix': {
+            str(player_id): {
+                str(opponent_id): {
+                    'games': record.games,
+                    'wins': record.wins,
+                    'points_for': record.points_for,
+                    'points_against': record.points_against
+                } for opponent_id, record in records.items()
+            } for player_id, records in matrix.items()
+        }
+    })
+
+def _period_args(default_period='month'):
+    """(period, first day, last day) from ?period=&date= or ?from=&to=; bad values fall back to the defaults."""
+    today = datetime.utcnow().date()
+    date_from = _parse_date(request.args.get('from', ''))
+    date_to = _parse_date(request.args.get('to', ''))
+    if date_from or date_to:
+        return 'range', date_from.date() if date_from else date.min, date_to.date() if date_to else today
+    period = request.args.get('period', default_period)
+    if period not in LEADERBOARD_PERIODS:
+        period = default_period
+    day = _parse_date(request.args.get('date', ''))
+    return (period, *period_bounds(period, day.date() if day else today))
+
+def _leaderboard_args():
+    period, start, end = _period_args()
+    sort = request.args.get('sort', 'wins')
+    if sort not in LEADERBOARD_SORTS:
+        sort = 'wins'
+    return period, start, end, sort, max(1, request.args.get('min_games', 1, type=int) or 1)
+
+@bp.route('/leaderboards')
+def leaderboards():
+    period, start, end, sort, min_games = _leaderboard_args()
+    rows = period_leaderboard(start, end, sort, min_games)
+    # Neighbouring periods are linked by a day inside them; a from/to range has no neighbours
+    previous_day = next_day = None
+    if period == 'last-30-days':
+        previous_day, next_day = start - timedelta(days=1), end + timedelta(days=RECENT_STATS_DAYS)
+    elif period != 'range':
+        previous_day, next_day = start - timedelta(days=1), end + timedelta(days=1)
+    return render_template('leaderboards.html', rows=rows, period=period, start=start, end=end, sort=sort,
+                           min_games=min_games, periods=LEADERBOARD_PERIODS, sorts=LEADERBOARD_SORTS,
+                           previous_day=previous_day,
+                           next_day=next_day if next_day and next_day <= datetime.utcnow().date() else None)
+
+@bp.route('/api/leaderboard')
+def leaderboard_api():
+    period, start, end, sort, min_games = _leaderboard_args()
+    return jsonify({
+        'period': period,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'sort': sort,
+        'min_games': min_games,
+        'players': period_leaderboard(start, end, sort, min_games, limit=request.args.get('limit', type=int)),
+    })
+
+@bp.route('/api/player/<int:player_id>/stats')
+def player_period_stats_api(player_id):
+    player = Player.query.get_or_404(player_id)
+    period, start, end = _period_args('last-30-days')
+    return jsonify({'player_id': player.id, 'nickname': player.nickname, 'period': period,
+                    'from': start.isoformat(), 'to': end.isoformat(), **period_stats(player.id, start, end)})
+
+@bp.route('/analytics')
+def analytics():
+    player_id = request.args.get('player', type=int)
+    analysis = bidding_snapshot.analysis(player_id)
+    selected_player = db.session.get(Player, player_id) if player_id else None
+    return render_template('analytics.html', analysis=analysis, selected_player=selected_player, player_id=player_id)
+
+@bp.route('/api/analytics')
+def analytics_api():
+    player_id = request.args.get('player', type=int)
+    return jsonify(bidding_snapshot.analysis(player_id))
+
+@bp.route('/export/history.ndjson')
+def export_history():
+    return Response(stream_with_context(_chunked(export_history_ndjson())), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=rikiki-history.ndjson'})
+
+@bp.route('/export/<table>.csv')
+def export_table(table):
+    if table not in EXPORT_TABLES:
+        abort(404)
+    return Response(stream_with_context(_chunked(export_table_csv(table))), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename=rikiki-{table}.csv'})
+
+@bp.route('/metrics')
+def metrics():
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/jobs', methods=['GET', 'POST'])
+def jobs_api():
+    if request.method == 'GET':
+        query = Job.query.order_by(Job.id.desc())
+        if request.args.get('status'):
+            query = query.filter(Job.status == request.args['status'])
+        jobs = query.limit(min(request.args.get('limit', 50, type=int), 500)).all()
+        return jsonify({'jobs': [job_runner.describe(job) for job in jobs]})
+    
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        kind, params = payload.get('kind'), payload.get('params') or {}
+    else:
+        kind = request.form.get('kind')
+        params = {name: value for name, value in request.form.items() if name != 'kind'}
+    if not isinstance(params, dict):
+        return jsonify({'error': 'params must be an object'}), 400
+    if kind == 'import-history':
+        # Imports read an uploaded file; server paths are not accepted from the web
+        upload = request.files.get('file')
+        if upload is None or 'path' in params or 'remove_source' in params:
+            return jsonify({'error': 'import-history needs an uploaded file'}), 400
+        upload_dir = os.path.join(current_app.instance_path, 'job-uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        params['path'] = os.path.join(upload_dir, f'{uuid.uuid4().hex}.ndjson')
+        params['remove_source'] = True
+        upload.save(params['path'])
+    try:
+        job = job_runner.submit(kind, params)
+    except ValueError as error:
+        if kind == 'import-history':
+            os.remove(params['path'])
+        return jsonify({'error': str(error)}), 400
+    response = jsonify(job_runner.describe(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('.job_status', job_id=job.id)
+    return response
+
+@bp.route('/api/jobs/<int:job_id>')
+def job_status(job_id):
+    return jsonify(job_runner.describe(Job.query.get_or_404(job_id)))
+
+@bp.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    if not job_runner.cancel(job):
+        return jsonify({'error': f'Job {job_id} has already finished ({job.status})'}), 409
+    response = jsonify(job_runner.describe(job))
+    response.status_code = 202
+    return response
+
+@bp.route('/delete_game/<int:game_id>', methods=['POST'])
+@serialized_write
 def delete_game(game_id):
     game = Game.query.get_or_404(game_id)
     
-    # Delete all related data (cascade delete)
-    # Delete round results first
-    for round_obj in game.rounds:
-        RoundResult.query.filter_by(round_id=round_obj.id).delete()
-    
-    # Delete rounds
-    Round.query.filter_by(game_id=game_id).delete()
+    # Remove the game from player statistics
+    discard_game_stats(game.id)
+    rating_key = game_rating_key(game)
+    was_active = game.is_active
+    if was_active:
+        # It disappears from its players' active games
+        touch_players(db.select(GamePlayer.player_id).filter_by(game_id=game.id))
     
-    # Delete game players
-    GamePlayer.query.filter_by(game_id=game_id).delete()
-    
-    # Delete the game itself
-    db.session.delete(game)
+    # Rounds, results, seats and rating history go with it (ON DELETE CASCADE)
+    Game.query.filter_by(id=game.id).delete()
+    if not was_active:
+        recompute_ratings_from(*rating_key)
     db.session.commit()
+    game_events.publish(game_id, 'deleted', {'game_id': game_id})
     
     flash(f'Game #{game_id} has been permanently deleted.', 'success')
-    return redirect(url_for('history'))
+    return redirect(url_for('.history'))
+
+# Application factory
+def create_app(config=None):
+    """Build a configured application; see load_config() for the order settings are applied in.
+    
+    Nothing here touches the database or starts a thread, so a server can import and create
+    the app once and fork its workers from it. The schema is upgraded by migrate-db.
+    """
+    app = Flask(__name__)
+    load_config(app, config)
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'connect', _sqlite_connection_setup(app.config))
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.register_blueprint(bp)
+    request_started.connect(_start_request_metrics, app)
+    request_finished.connect(_finish_request_metrics, app)
+    
+    # The caches are shared by every app in the process
+    render_cache.max_bytes = app.config['RENDER_CACHE_MAX_BYTES']
+    compressed_cache.max_bytes = app.config['COMPRESSED_CACHE_MAX_BYTES']
+    return app
+
+def warm_up(app):
+    """Compile every template, configure the ORM and hash the static files, without touching the database.
+    
+    A server that preloads the app calls this once so forked workers inherit the results
+    instead of each paying for them on its first requests.
+    """
+    with app.app_context():
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+        configure_mappers()
+        asset_version()
+        for root, dirs, files in os.walk(app.static_folder):
+            for name in files:
+                static_file_hash(os.path.relpath(os.path.join(root, name), app.static_folder).replace(os.sep, '/'))
 
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
-        db.create_all()
+        prepare_database()
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
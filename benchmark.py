@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Per-route benchmark against a synthetic database.
+Times every main route with the Flask test client and fails when a route runs more
+SQL statements than its budget, so N+1 regressions show up as a failed run.
+
+With --startup it instead times a cold start in fresh interpreters: importing the app,
+create_app(), warm_up() and the first requests, and fails if startup runs any SQL.
+
+Usage:
+    python benchmark.py --players 100 --games 5000 --repeat 20
+    python benchmark.py --startup --repeat 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from generate_data import configure_database, generate
+
+# Maximum SQL statements per request, for any size of history and any number of seats.
+# Every game write checks its form's submission token, claims the game's version, loads the game's
+# rules state and appends one event to its log; every 20th event also rewrites the snapshot (+2).
+# Saving an edit or finishing a game refreshes stats, daily rollups, head-to-head rows and ratings for
+# the whole table at once: each of those tables costs at most a SELECT, an UPDATE, an INSERT and a
+# DELETE per pass, however many players changed. The edit case changes the newest finished game;
+# editing an older one also replays the ratings after it, one INSERT per 1000 rating history rows.
+# A request carrying a current validator only reads the version it is based on, and a repeated or
+# stale form is turned away after the token and version checks.
+ROUTE_BUDGETS = {
+    'index': 3,
+    'history': 4,
+    'history_filtered': 4,
+    'game': 6,
+    'game_summary_cold': 6,
+    'game_summary_warm': 2,
+    'game_summary_revalidate': 1,
+    'player': 7,
+    'player_revalidate': 1,
+    'leaderboards': 2,
+    'analytics': 5,
+    'players': 2,
+    'player_search': 1,
+    'new_game_get': 2,
+    'edit_game_get': 5,
+    'edit_game_post': 46,
+    'submit_guesses': 13,
+    'submit_results': 16,
+    'submit_results_final': 35,
+    'submit_results_repeated': 3,
+    'submit_results_stale': 3,
+}
+
+# Importing, creating and warming up the app must not touch the database, so servers can preload it
+STARTUP_STATEMENT_BUDGET = 0
+
+# Run in a fresh interpreter per sample; prints the phase timings as JSON
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+import app as rikiki
+imported = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(1))
+application = rikiki.create_app({'TESTING': True})
+created = time.perf_counter()
+rikiki.warm_up(application)
+warmed = time.perf_counter()
+startup_statements = len(statements)
+client = application.test_client()
+client.get('/')
+first = time.perf_counter()
+client.get('/')
+second = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported, 'warm_up': warmed - created,
+                  'first_request': first - warmed, 'second_request': second - first, 'statements': startup_statements}))
+"""
+STARTUP_PHASES = ('import', 'create_app', 'warm_up', 'first_request', 'second_request')
+
+
+class StatementCounter:
+    """Counts SQL statements sent by the app's engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def measure(client, counter, name, request, repeat, before=None):
+    """Run a request several times; returns timings in ms and the highest statement count."""
+    timings = []
+    statements = 0
+    for _ in range(repeat):
+        if before:
+            before()
+        counter.count = 0
+        start = time.perf_counter()
+        response = request(client)
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name} returned {response.status_code}')
+        statements = max(statements, counter.count)
+    return {'name': name, 'timings': timings, 'statements': statements}
+
+
+def run(repeat):
+    from app import create_app, db, Game, GameEvent, GamePlayer, Round, RoundResult, render_cache
+
+    app = create_app({'TESTING': True})
+    client = app.test_client()
+    with app.app_context():
+        counter = StatementCounter(db.engine)
+        finished = db.session.query(Game).filter_by(is_active=False).order_by(Game.ended_at.desc()).first()
+        active = db.session.query(Game).filter_by(is_active=True).order_by(Game.id).first()
+        busiest_player = db.session.query(GamePlayer.player_id).group_by(GamePlayer.player_id) \
+            .order_by(db.func.count().desc()).limit(1).scalar()
+        seats = [row.player_id for row in GamePlayer.query.filter_by(game_id=finished.id).order_by(GamePlayer.id)]
+        edited_round = Round.query.filter_by(game_id=finished.id, round_number=1).first()
+        edited_result = RoundResult.query.filter_by(round_id=edited_round.id, player_id=seats[0]).first()
+        finished_id, active_id, edit_round_id = finished.id, active.id, edited_round.id
+        edit_guess, edit_cards = edited_result.guess, edited_round.cards_per_player
+
+    state = {}
+
+    def start_game():
+        # A double-deck game for two players gives 103 rounds to play through
+        response = client.post('/new_game', data={'player_order': f'{seats[0]},{seats[1]}', 'deck_type': 'double',
+                                                  'force_conflict': 'no'})
+        state['play_id'] = int(response.headers['Location'].rsplit('/', 1)[1])
+
+    def current_round():
+        with app.app_context():
+            game = db.session.get(Game, state['play_id'])
+            if game.current_round == game.max_rounds:
+                # Leave the finishing round to its own case
+                start_game()
+                game = db.session.get(Game, state['play_id'])
+            round_obj = Round.query.filter_by(game_id=game.id, round_number=game.current_round).first()
+            return round_obj.id, round_obj.cards_per_player
+
+    def post_guesses(client, round_id):
+        return client.post('/submit_guesses', data={'game_id': state['play_id'], 'round_id': round_id,
+                                                     f'guess_{seats[0]}': 0, f'guess_{seats[1]}': 0,
+                                                     'submission_id': uuid.uuid4().hex})
+
+    def prepare_results():
+        state['round_id'], state['cards'] = current_round()
+        post_guesses(client, state['round_id'])
+
+    def prepare_last_round():
+        # Jump a fresh game straight to its final round so results finish it
+        start_game()
+        with app.app_context():
+            game = db.session.get(Game, state['play_id'])
+            round_obj = Round.query.filter_by(game_id=game.id, round_number=1).first()
+            game.current_round = round_obj.round_number = game.max_rounds
+            round_obj.cards_per_player = 1
+            # Drop the log so the game is adopted again from the rows changed here
+            GameEvent.query.filter_by(game_id=game.id).delete()
+            db.session.commit()
+            state['round_id'], state['cards'] = round_obj.id, 1
+        post_guesses(client, state['round_id'])
+
+    def results(client, submission_id=None, round_version=None):
+        data = {'game_id': state['play_id'], 'round_id': state['round_id'],
+                f'hits_{seats[0]}': state['cards'], f'hits_{seats[1]}': 0,
+                'submission_id': submission_id or uuid.uuid4().hex}
+        if round_version is not None:
+            data['round_version'] = round_version
+        return client.post('/submit_results', data=data)
+
+    def prepare_repeat():
+        # Score a round, then send the very same form again
+        prepare_results()
+        state['submission_id'] = uuid.uuid4().hex
+        results(client, state['submission_id'])
+
+    start_game()
+
+    def fetch_etag(url):
+        return lambda: state.update(etag=client.get(url).headers['ETag'])
+
+    def revalidate(url):
+        # Ask again with the validator of a previous response; the page is not rendered
+        return lambda c: c.get(url, headers={'If-None-Match': state['etag']})
+
+    def edit_post(client):
+        # Alternate one cell between two values so every request saves a real change
+        state['edit_hits'] = 0 if state.get('edit_hits') else edit_cards
+        return client.post(f'/edit_game/{finished_id}', data={
+            f'guess_{edit_round_id}_{seats[0]}': edit_guess,
+            f'hits_{edit_round_id}_{seats[0]}': state['edit_hits'],
+        })
+
+    cases = [
+        ('index', lambda c: c.get('/'), None),
+        ('history', lambda c: c.get('/history'), None),
+        ('history_filtered', lambda c: c.get(f'/history?player={busiest_player}&deck=single'), None),
+        ('game', lambda c: c.get(f'/game/{active_id}'), None),
+        ('game_summary_cold', lambda c: c.get(f'/game_summary/{finished_id}'), render_cache.clear),
+        ('game_summary_warm', lambda c: c.get(f'/game_summary/{finished_id}'), None),
+        ('game_summary_revalidate', revalidate(f'/game_summary/{finished_id}'),
+         fetch_etag(f'/game_summary/{finished_id}')),
+        ('player', lambda c: c.get(f'/player/{busiest_player}'), None),
+        ('player_revalidate', revalidate(f'/player/{busiest_player}'),
+         fetch_etag(f'/player/{busiest_player}')),
+        ('leaderboards', lambda c: c.get('/leaderboards?period=year&date=2022-06-01&sort=accuracy'), None),
+        ('analytics', lambda c: c.get('/analytics'), None),
+        ('players', lambda c: c.get('/players'), None),
+        ('player_search', lambda c: c.get('/api/players/search?q=player0'), None),
+        ('new_game_get', lambda c: c.get('/new_game'), None),
+        ('edit_game_get', lambda c: c.get(f'/edit_game/{finished_id}'), None),
+        ('edit_game_post', edit_post, None),
+        ('submit_guesses', lambda c: post_guesses(c, state['round_id']), prepare_results),
+        ('submit_results', lambda c: results(c), prepare_results),
+        ('submit_results_final', lambda c: results(c), prepare_last_round),
+        ('submit_results_repeated', lambda c: results(c, state['submission_id']), prepare_repeat),
+        # Guesses moved the round past version 0, so this form is out of date
+        ('submit_results_stale', lambda c: results(c, round_version=0), prepare_results),
+    ]
+
+    # One untimed pass warms templates and connections
+    for name, request, before in cases:
+        measure(client, counter, name, request, 1, before)
+    return [measure(client, counter, name, request, repeat, before) for name, request, before in cases]
+
+
+def report(measurements):
+    """Print a table and return the names of routes over budget."""
+    print(f"\n{'route':<24} {'median ms':>10} {'p95 ms':>10} {'max ms':>10} {'sql':>5} {'budget':>7}")
+    over_budget = []
+    for row in measurements:
+        timings = sorted(row['timings'])
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        budget = ROUTE_BUDGETS[row['name']]
+        flag = ''
+        if row['statements'] > budget:
+            over_budget.append(row['name'])
+            flag = '  ❌ over budget'
+        print(f"{row['name']:<24} {statistics.median(timings):>10.2f} {p95:>10.2f} {timings[-1]:>10.2f} "
+              f"{row['statements']:>5} {budget:>7}{flag}")
+    return over_budget
+
+
+def measure_startup(repeat):
+    """Cold starts in fresh interpreters; returns the samples with the whole process time added."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process'] = time.perf_counter() - start
+        samples.append(sample)
+    return samples
+
+
+def report_startup(samples):
+    """Print the phase timings; returns False if startup ran SQL statements."""
+    print(f"\n{'phase':<24} {'median ms':>10} {'max ms':>10}")
+    for phase in STARTUP_PHASES + ('process',):
+        timings = sorted(sample[phase] * 1000 for sample in samples)
+        print(f"{phase:<24} {statistics.median(timings):>10.2f} {timings[-1]:>10.2f}")
+    statements = max(sample['statements'] for sample in samples)
+    print(f"\nSQL statements while starting the app: {statements} (budget {STARTUP_STATEMENT_BUDGET})")
+    return statements <= STARTUP_STATEMENT_BUDGET
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark Rikiki routes against synthetic data.')
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', help='Reuse or create this SQLite file instead of a temporary one')
+    parser.add_argument('--startup', action='store_true', help='Time cold starts of the app instead of the routes')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='rikiki-bench-'), 'bench.db')
+    existing = os.path.exists(db_path)
+    configure_database(db_path)
+    if not existing:
+        print(f"🎲 Generating {args.games} games for {args.players} players in {db_path}...")
+        generate(args.players, args.games, seed=args.seed)
+
+    if args.startup:
+        if not report_startup(measure_startup(args.repeat)):
+            print("\n❌ Startup touched the database")
+            sys.exit(1)
+        print("\n✅ Startup runs no SQL")
+        sys.exit(0)
+
+    failed = report(run(args.repeat))
+    if failed:
+        print(f"\n❌ SQL budget exceeded: {', '.join(failed)}")
+        sys.exit(1)
+    print("\n✅ All routes within their SQL budgets")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Script to fill a database with synthetic players and complete game histories.
+Games follow the round schedule, dealer rotation and scoring rules from app.py.
+
+Usage:
+    python generate_data.py --db /tmp/rikiki-bench.db --players 100 --games 5000
+"""
+
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+
+def configure_database(path):
+    """Point the app at the given SQLite file; must run before create_app()."""
+    os.environ['RIKIKI_DATABASE_URI'] = f'sqlite:///{os.path.abspath(path)}'
+
+
+def deal_guesses(rng, n_players, cards, force_conflict):
+    """Guesses in bidding order (the dealer bids last)."""
+    guesses = [min(cards, max(0, round(rng.gauss(cards / n_players, 0.8)))) for _ in range(n_players)]
+    if force_conflict and sum(guesses) == cards:
+        # The dealer is not allowed to make the total match the cards
+        last = guesses[-1]
+        guesses[-1] = last + 1 if last < cards else last - 1
+    return guesses
+
+
+def play_tricks(rng, guesses, cards):
+    """Hits per player; every trick is won by exactly one player."""
+    hits = [0] * len(guesses)
+    weights = [guess + 0.5 for guess in guesses]
+    for _ in range(cards):
+        hits[rng.choices(range(len(guesses)), weights=weights)[0]] += 1
+    return hits
+
+
+def generate(n_players=50, n_games=1000, n_active=5, seed=0, early_end_rate=0.05, batch_size=200, verbose=True):
+    """Insert players and games with full round histories, then rebuild the derived tables."""
+    from app import (create_app, db, Player, Game, GamePlayer, Round, RoundResult, migrate_database,
+                     max_rounds_for, cards_for_round, score_round, rebuild_player_stats, recompute_ratings_from)
+
+    rng = random.Random(seed)
+    app = create_app()
+    with app.app_context():
+        migrate_database()
+
+        # Explicit ids let every table be written with one executemany per batch
+        def next_id(model):
+            return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+        first_player_id = next_id(Player)
+        players = [{'id': first_player_id + i, 'nickname': f'player{first_player_id + i:05d}',
+                    'created_at': datetime(2020, 1, 1)} for i in range(n_players)]
+        db.session.execute(db.insert(Player), players)
+        db.session.commit()
+        player_ids = [player['id'] for player in players]
+
+        # A core of regulars shows up far more often than everyone else
+        player_weights = [1 / (rank + 1) ** 0.5 for rank in range(n_players)]
+
+        game_id, seat_id, round_id, result_id = next_id(Game), next_id(GamePlayer), next_id(Round), next_id(RoundResult)
+        clock = datetime(2022, 1, 1)
+        total_games = n_games + n_active
+        batch = {Game: [], GamePlayer: [], Round: [], RoundResult: []}
+
+        def flush_batch():
+            for model, rows in batch.items():
+                if rows:
+                    db.session.execute(db.insert(model), rows)
+                    rows.clear()
+            db.session.commit()
+
+        for index in range(total_games):
+            is_active = index >= n_games
+            table_size = min(n_players, rng.choice([2, 3, 3, 4, 4, 4, 5, 5, 6, 7]))
+            seated = []
+            while len(seated) < table_size:
+                player_id = rng.choices(player_ids, weights=player_weights)[0]
+                if player_id not in seated:
+                    seated.append(player_id)
+
+            deck_type = 'double' if rng.random() < 0.3 else 'single'
+            force_conflict = rng.random() < 0.7
+            max_rounds = max_rounds_for(table_size, deck_type)
+            dealer_index = rng.randrange(table_size)
+
+            if is_active:
+                rounds_played = rng.randrange(1, max_rounds)
+            elif rng.random() < early_end_rate:
+                rounds_played = rng.randrange(1, max_rounds)
+            else:
+                rounds_played = max_rounds
+
+            clock += timedelta(hours=rng.uniform(2, 72))
+            created_at = clock
+            started_at = created_at + timedelta(minutes=2)
+            totals = [0] * table_size
+
+            for round_number in range(1, rounds_played + 1):
+                cards = cards_for_round(round_number, max_rounds)
+                # Bidding starts after the dealer and ends with the dealer
+                order = [(dealer_index + 1 + i) % table_size for i in range(table_size)]
+                guesses_in_order = deal_guesses(rng, table_size, cards, force_conflict)
+                hits_in_order = play_tricks(rng, guesses_in_order, cards)
+
+                batch[Round].append({'id': round_id, 'game_id': game_id, 'round_number': round_number,
+                                     'cards_per_player': cards, 'is_completed': True})
+                for seat, guess, hits in zip(order, guesses_in_order, hits_in_order):
+                    points = score_round(guess, hits)
+                    totals[seat] += points
+                    batch[RoundResult].append({'id': result_id, 'round_id': round_id, 'player_id': seated[seat],
+                                               'guess': guess, 'hits': hits, 'points': points})
+                    result_id += 1
+                round_id += 1
+                # The dealer only moves on when another round follows
+                if round_number < rounds_played or is_active:
+                    dealer_index = (dealer_index + 1) % table_size
+
+            if is_active:
+                # The running round has no results yet
+                batch[Round].append({'id': round_id, 'game_id': game_id, 'round_number': rounds_played + 1,
+                                     'cards_per_player': cards_for_round(rounds_played + 1, max_rounds),
+                                     'is_completed': False})
+                round_id += 1
+
+            ended_at = None if is_active else started_at + timedelta(minutes=4 * rounds_played)
+            batch[Game].append({
+                'id': game_id, 'created_at': created_at, 'started_at': started_at, 'ended_at': ended_at,
+                'is_active': is_active, 'current_round': rounds_played + 1 if is_active else rounds_played,
+                'max_rounds': max_rounds, 'round_direction': 'up', 'current_dealer_index': dealer_index,
+                'ended_early': not is_active and rounds_played < max_rounds, 'deck_type': deck_type,
+                'force_conflict': force_conflict, 'version': 0
+            })
+            for seat, player_id in enumerate(seated):
+                batch[GamePlayer].append({'id': seat_id, 'game_id': game_id, 'player_id': player_id,
+                                          'total_points': totals[seat]})
+                seat_id += 1
+            game_id += 1
+
+            if (index + 1) % batch_size == 0:
+                flush_batch()
+                if verbose:
+                    print(f'  {index + 1}/{total_games} games')
+        flush_batch()
+
+        if verbose:
+            print('  Rebuilding statistics and ratings')
+        rebuild_player_stats()
+        recompute_ratings_from(None)
+        db.session.commit()
+
+        summary = {
+            'players': Player.query.count(),
+            'games': Game.query.count(),
+            'rounds': Round.query.count(),
+            'results': RoundResult.query.count(),
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fill a SQLite database with synthetic Rikiki games.')
+    parser.add_argument('--db', required=True, help='SQLite file to write (created if missing)')
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--games', type=int, default=1000, help='Finished games')
+    parser.add_argument('--active', type=int, default=5, help='Games left in progress')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    configure_database(args.db)
+    print(f"🎲 Generating {args.games} games for {args.players} players in {args.db}...")
+    summary = generate(args.players, args.games, args.active, args.seed)
+    print(f"\n✅ {summary['players']} players, {summary['games']} games, "
+          f"{summary['rounds']} rounds, {summary['results']} results")
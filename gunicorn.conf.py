@@ -0,0 +1,39 @@
+"""
+Gunicorn settings for serving Rikiki from several worker processes.
+The app is created once in the master process (preload_app) and the workers are forked
+from it, so a worker is ready as soon as it exists. The server refuses to start on a
+database that still needs migrations.
+
+Usage:
+    flask --app app migrate-db
+    gunicorn
+"""
+
+import multiprocessing
+import os
+
+# Several processes share the SQLite file: WAL lets them read while one of them writes
+os.environ.setdefault('RIKIKI_STORAGE', 'production')
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('RIKIKI_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('RIKIKI_WORKERS', min(4, multiprocessing.cpu_count())))
+# Threaded workers, so a live game event stream holds a thread rather than a whole process
+worker_class = 'gthread'
+threads = int(os.environ.get('RIKIKI_THREADS', 8))
+preload_app = True
+accesslog = '-'
+
+
+def on_starting(server):
+    from app import db, pending_migrations, warm_up
+    from wsgi import app
+
+    # Compiled templates and static file hashes are inherited by every worker
+    warm_up(app)
+    with app.app_context():
+        pending = pending_migrations()
+        # Workers open their own connections after the fork
+        db.engine.dispose()
+    if pending:
+        raise SystemExit(f"❌ The database needs migrations ({', '.join(pending)}): run flask --app app migrate-db")
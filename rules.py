@@ -0,0 +1,251 @@
+"""
+Rikiki rules engine.
+A game is a list of events; GameState applies them one by one and rejects any that break
+the rules, so the same state can be rebuilt at any time by replaying the log.
+No Flask or database code lives here.
+
+Events are plain dicts that round-trip through JSON:
+    {'type': 'game_created', 'player_ids': [...], 'deck_type': 'single', 'force_conflict': True, 'dealer_index': 0}
+    {'type': 'guesses_set', 'round': 3, 'guesses': [[player_id, guess], ...]}
+    {'type': 'results_set', 'round': 3, 'hits': [[player_id, hits], ...]}
+    {'type': 'game_ended_early'}
+    {'type': 'results_edited', 'cells': [[round, player_id, guess, hits], ...]}
+    {'type': 'game_adopted', 'state': {...}}  # history recorded before the log existed
+"""
+
+import math
+
+DECK_CARDS = {'single': 51, 'double': 103}  # Cards dealt from the deck(s) after turning up the trump
+
+
+def max_rounds_for(n_players, deck_type):
+    """Rounds in a full game: cards go 1, 2, ..., max and back down to 1."""
+    max_cards_per_player = math.floor(DECK_CARDS.get(deck_type, DECK_CARDS['single']) / n_players)
+    return max_cards_per_player * 2 - 1
+
+
+def cards_for_round(round_number, max_rounds):
+    """Cards per player in a given round."""
+    max_cards = max_rounds // 2 + 1
+    if round_number <= max_cards:
+        # Going up: 1, 2, 3, ..., max_cards_per_player
+        return round_number
+    # Going down: max_cards_per_player-1, max_cards_per_player-2, ..., 1
+    return max_cards - (round_number - max_cards)
+
+
+def score_round(guess, hits):
+    """Points for one player's round."""
+    if guess == hits:
+        # Correct guess: 10 + 2*n_hits
+        return 10 + 2 * hits
+    # Incorrect guess: -2*abs(guess-hits) (negative points)
+    return -2 * abs(guess - hits)
+
+
+class RuleError(ValueError):
+    """An event that the current game state does not allow."""
+
+
+class RoundState:
+    __slots__ = ('number', 'cards', 'completed', 'guesses', 'hits', 'points')
+
+    def __init__(self, number, cards, n_players, completed=False):
+        self.number = number
+        self.cards = cards
+        self.completed = completed
+        # One entry per seat; None until entered
+        self.guesses = [None] * n_players
+        self.hits = [None] * n_players
+        self.points = [None] * n_players
+
+
+class GameState:
+    """Seats in GamePlayer order; rounds[-1] is the current round."""
+
+    __slots__ = ('seq', 'player_ids', 'seats', 'deck_type', 'force_conflict', 'max_rounds', 'dealer_index',
+                 'rounds', 'totals', 'is_active', 'ended_early')
+
+    def __init__(self):
+        self.seq = 0  # Events applied so far
+        self.player_ids = []
+        self.seats = {}  # player_id -> seat index
+        self.deck_type = 'single'
+        self.force_conflict = True
+        self.max_rounds = 0
+        self.dealer_index = 0
+        self.rounds = []
+        self.totals = []
+        self.is_active = False
+        self.ended_early = False
+
+    @classmethod
+    def replay(cls, events, snapshot=None):
+        """State after the given events, starting from a to_dict() snapshot if there is one."""
+        state = cls.from_dict(snapshot) if snapshot else cls()
+        for event in events:
+            state.apply(event)
+        return state
+
+    @property
+    def current(self):
+        return self.rounds[-1] if self.rounds else None
+
+    def round_state(self, number):
+        for round_state in reversed(self.rounds):
+            if round_state.number == number:
+                return round_state
+        raise RuleError(f'Round {number} has not been played')
+
+    def apply(self, event):
+        """Apply one event; raises RuleError and leaves the state untouched if it is not allowed."""
+        handler = getattr(self, '_on_' + event.get('type', ''), None)
+        if handler is None:
+            raise RuleError(f"Unknown event type {event.get('type')!r}")
+        if event['type'] not in ('game_created', 'game_adopted') and not self.player_ids:
+            raise RuleError('The game has not been created')
+        handler(event)
+        self.seq += 1
+        return self
+
+    # Validation helpers
+    def _seat(self, player_id):
+        if player_id not in self.seats:
+            raise RuleError(f'Player {player_id} is not seated in this game')
+        return self.seats[player_id]
+
+    def _open_round(self, number):
+        if not self.is_active:
+            raise RuleError('The game has already ended')
+        current = self.current
+        if number != current.number or current.completed:
+            raise RuleError(f'Round {number} is not the round being played')
+        return current
+
+    def _seat_values(self, pairs, cards, what):
+        values = {}
+        for player_id, value in pairs:
+            if not 0 <= value <= cards:
+                raise RuleError(f'{what.capitalize()} must be between 0 and {cards}, got {value}')
+            values[self._seat(player_id)] = value
+        return values
+
+    # Event handlers
+    def _on_game_created(self, event):
+        if self.player_ids:
+            raise RuleError('The game already exists')
+        player_ids = list(event['player_ids'])
+        if len(player_ids) < 2:
+            raise RuleError('At least 2 players are required!')
+        if len(set(player_ids)) != len(player_ids):
+            raise RuleError('A player can only take one seat')
+        self._seat_players(player_ids)
+        self.deck_type = event.get('deck_type', 'single')
+        self.force_conflict = event.get('force_conflict', True)
+        self.max_rounds = max_rounds_for(len(player_ids), self.deck_type)
+        self.dealer_index = event.get('dealer_index', 0) % len(player_ids)
+        self.rounds = [RoundState(1, cards_for_round(1, self.max_rounds), len(player_ids))]
+        self.is_active = True
+        self.ended_early = False
+
+    def _on_guesses_set(self, event):
+        current = self._open_round(event['round'])
+        guesses = self._seat_values(event['guesses'], current.cards, 'guesses')
+        total = sum(guesses.values())
+        if self.force_conflict and total == current.cards:
+            raise RuleError(f'Total guesses ({total}) cannot equal the number of cards ({current.cards}) in this round! '
+                            'Please adjust your guesses.')
+        # New guesses replace whatever was entered before
+        n_players = len(self.player_ids)
+        current.guesses = [guesses.get(seat) for seat in range(n_players)]
+        current.hits = [None] * n_players
+        current.points = [None] * n_players
+
+    def _on_results_set(self, event):
+        current = self._open_round(event['round'])
+        if all(guess is None for guess in current.guesses):
+            raise RuleError(f'Round {current.number} has no guesses yet')
+        hits = self._seat_values(event['hits'], current.cards, 'hits')
+        for seat, seat_hits in hits.items():
+            # Only seats that made a guess are scored
+            if current.guesses[seat] is None:
+                continue
+            current.hits[seat] = seat_hits
+            current.points[seat] = score_round(current.guesses[seat], seat_hits)
+            self.totals[seat] += current.points[seat]
+        current.completed = True
+
+        if current.number < self.max_rounds:
+            self.dealer_index = (self.dealer_index + 1) % len(self.player_ids)
+            number = current.number + 1
+            self.rounds.append(RoundState(number, cards_for_round(number, self.max_rounds), len(self.player_ids)))
+        else:
+            self.is_active = False
+
+    def _on_game_ended_early(self, event):
+        if not self.is_active:
+            raise RuleError('The game has already ended')
+        self.is_active = False
+        self.ended_early = True
+
+    def _on_results_edited(self, event):
+        # Corrections are not held to the trick rules: validate everything before changing anything
+        cells = []
+        for number, player_id, guess, hits in event['cells']:
+            cells.append((self.round_state(number), self._seat(player_id), guess, hits))
+        for round_state, seat, guess, hits in cells:
+            round_state.guesses[seat] = guess
+            round_state.hits[seat] = hits
+            round_state.points[seat] = score_round(guess, hits)
+            round_state.completed = True
+        self._recount_totals()
+
+    def _on_game_adopted(self, event):
+        if self.player_ids:
+            raise RuleError('The game already exists')
+        adopted = GameState.from_dict(event['state'])
+        for name in self.__slots__:
+            if name != 'seq':
+                setattr(self, name, getattr(adopted, name))
+
+    def _seat_players(self, player_ids):
+        self.player_ids = player_ids
+        self.seats = {player_id: seat for seat, player_id in enumerate(player_ids)}
+        self.totals = [0] * len(player_ids)
+
+    def _recount_totals(self):
+        self.totals = [sum(round_state.points[seat] or 0 for round_state in self.rounds)
+                       for seat in range(len(self.player_ids))]
+
+    # Snapshots
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'player_ids': self.player_ids,
+            'deck_type': self.deck_type,
+            'force_conflict': self.force_conflict,
+            'max_rounds': self.max_rounds,
+            'dealer_index': self.dealer_index,
+            'is_active': self.is_active,
+            'ended_early': self.ended_early,
+            'rounds': [[r.number, r.cards, r.completed, r.guesses, r.hits, r.points] for r in self.rounds],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        state.seq = data.get('seq', 0)
+        state._seat_players(list(data['player_ids']))
+        state.deck_type = data['deck_type']
+        state.force_conflict = data['force_conflict']
+        state.max_rounds = data['max_rounds']
+        state.dealer_index = data['dealer_index']
+        state.is_active = data['is_active']
+        state.ended_early = data['ended_early']
+        n_players = len(state.player_ids)
+        for number, cards, completed, guesses, hits, points in data['rounds']:
+            round_state = RoundState(number, cards, n_players, completed)
+            round_state.guesses, round_state.hits, round_state.points = list(guesses), list(hits), list(points)
+            state.rounds.append(round_state)
+        state._recount_totals()
+        return state
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Trick-taking simulator for bid advice.
+Deals random hands and plays them out with baseline strategies, many deals at once: every
+deal is a row of NumPy arrays, so a trick is played for the whole batch with a few array
+operations. The hit counts per seat give the expected score of every possible bid.
+
+Cards are integers: card % 52 gives suit (// 13) and rank (% 13, ace high). A double deck
+holds every card twice; between two identical cards the one played first wins.
+Seats are numbered in bidding order: seat 0 sits after the dealer and leads the first
+trick, the last seat is the dealer.
+
+Usage:
+    python simulator.py --players 4 --cards 10 --hands 200000 --workers 4
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# random: any legal card; low/high: weakest/strongest legal card;
+# greedy: lead high, then win as cheaply as possible or throw the weakest card
+STRATEGIES = ('random', 'low', 'high', 'greedy')
+
+# Value of a card within a trick: trumps beat the led suit, which beats everything else
+_TRUMP, _LED_SUIT = 100, 50
+_NEVER = 1000
+
+
+def deal(rng, n_hands, n_players, cards, deck_size=52):
+    """Shuffle n_hands decks; returns hands (n_hands, n_players, cards) and the trump suit per deal."""
+    decks = rng.permuted(np.tile(np.arange(deck_size, dtype=np.int16), (n_hands, 1)), axis=1)
+    dealt = n_players * cards
+    hands = decks[:, :dealt].reshape(n_hands, n_players, cards)
+    # The card after the dealt ones is turned up for trumps
+    trump = (decks[:, dealt] % 52) // 13
+    return hands, trump
+
+
+def _choose(strategy, legal, value, best, leading, rng):
+    """Index of the card each deal's player puts down."""
+    if strategy == 'random':
+        return np.where(legal, rng.random(legal.shape), -1.0).argmax(axis=1)
+    lowest = np.where(legal, value, _NEVER).argmin(axis=1)
+    if strategy == 'low':
+        return lowest
+    highest = np.where(legal, value, -1).argmax(axis=1)
+    if strategy == 'high' or leading:
+        return highest
+    winning = legal & (value > best[:, None])
+    cheapest_win = np.where(winning, value, _NEVER).argmin(axis=1)
+    return np.where(winning.any(axis=1), cheapest_win, lowest)
+
+
+def play_hands(hands, trump, strategies, rng):
+    """Play out every deal; returns tricks won per seat, shape (n_hands, n_players)."""
+    n_hands, n_players, cards = hands.shape
+    if isinstance(strategies, str):
+        strategies = (strategies,) * n_players
+    if len(strategies) != n_players:
+        raise ValueError(f'Expected {n_players} strategies, got {len(strategies)}')
+    seat_strategy = np.array([STRATEGIES.index(name) for name in strategies])
+    used = [(code, STRATEGIES[code]) for code in np.unique(seat_strategy)]
+
+    suits = (hands % 52) // 13
+    ranks = hands % 13
+    trumps = suits == trump[:, None, None]
+    played = np.zeros(hands.shape, dtype=bool)
+    hits = np.zeros((n_hands, n_players), dtype=np.int16)
+    deals = np.arange(n_hands)
+    leader = np.zeros(n_hands, dtype=np.intp)
+
+    for _ in range(cards):
+        best = np.full(n_hands, -1)
+        winner = leader.copy()
+        led = None
+        for step in range(n_players):
+            seat = (leader + step) % n_players
+            hand_suits = suits[deals, seat]
+            available = ~played[deals, seat]
+            if led is None:
+                # Any card may be led, and it sets the suit to follow
+                legal = available
+                follows = np.ones_like(available)
+            else:
+                follows = hand_suits == led[:, None]
+                must_follow = available & follows
+                legal = np.where(must_follow.any(axis=1, keepdims=True), must_follow, available)
+            rank = ranks[deals, seat]
+            value = np.where(trumps[deals, seat], _TRUMP + rank, np.where(follows, _LED_SUIT + rank, rank))
+
+            if len(used) == 1:
+                choice = _choose(used[0][1], legal, value, best, led is None, rng)
+            else:
+                choice = np.zeros(n_hands, dtype=np.intp)
+                for code, name in used:
+                    choice = np.where(seat_strategy[seat] == code,
+                                      _choose(name, legal, value, best, led is None, rng), choice)
+
+            played[deals, seat, choice] = True
+            if led is None:
+                led = hand_suits[deals, choice]
+            card_value = value[deals, choice]
+            beats = card_value > best
+            best = np.where(beats, card_value, best)
+            winner = np.where(beats, seat, winner)
+        hits[deals, winner] += 1
+        leader = winner
+    return hits
+
+
+def simulate(n_players, cards, deck_size=52, n_hands=10000, strategies='greedy', seed=None, batch_size=5000):
+    """Hit counts per seat: element [seat, k] is how many deals that seat won exactly k tricks."""
+    if n_players * cards >= deck_size:
+        raise ValueError(f'{n_players} players cannot get {cards} cards each from {deck_size} cards')
+    rng = np.random.default_rng(seed)
+    histogram = np.zeros((n_players, cards + 1), dtype=np.int64)
+    seat_offsets = np.arange(n_players) * (cards + 1)
+    remaining = n_hands
+    while remaining > 0:
+        batch = min(batch_size, remaining)
+        hands, trump = deal(rng, batch, n_players, cards, deck_size)
+        hits = play_hands(hands, trump, strategies, rng)
+        histogram += np.bincount((hits + seat_offsets).ravel(),
+                                 minlength=n_players * (cards + 1)).reshape(n_players, cards + 1)
+        remaining -= batch
+    return histogram
+
+
+def _simulate_job(args):
+    return simulate(*args)
+
+
+def simulate_parallel(n_players, cards, deck_size=52, n_hands=10000, strategies='greedy', seed=None,
+                      executor=None, workers=None):
+    """simulate() split over a process pool; each worker gets its own random stream."""
+    if executor is None and (workers or 1) <= 1:
+        return simulate(n_players, cards, deck_size, n_hands, strategies, seed)
+    workers = workers or getattr(executor, '_max_workers', os.cpu_count() or 1)
+    shares = [n_hands // workers + (1 if index < n_hands % workers else 0) for index in range(workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    jobs = [(n_players, cards, deck_size, share, strategies, job_seed)
+            for share, job_seed in zip(shares, seeds) if share]
+    if executor is not None:
+        return sum(executor.map(_simulate_job, jobs))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_simulate_job, jobs))
+
+
+def score_matrix(cards):
+    """Points for bid g and hits k at [g, k]; the same rule as rules.score_round."""
+    bids = np.arange(cards + 1)[:, None]
+    hits = np.arange(cards + 1)[None, :]
+    return np.where(bids == hits, 10 + 2 * hits, -2 * np.abs(bids - hits))
+
+
+def bid_advice(histogram):
+    """Per seat: hit probabilities, expected points for every bid and the best bid."""
+    cards = histogram.shape[1] - 1
+    probabilities = histogram / histogram.sum(axis=1, keepdims=True)
+    expected = probabilities @ score_matrix(cards).T
+    advice = []
+    for seat in range(histogram.shape[0]):
+        best_bid = int(expected[seat].argmax())
+        advice.append({
+            'seat': seat,
+            'hit_probabilities': [round(float(p), 4) for p in probabilities[seat]],
+            'expected_points': [round(float(points), 2) for points in expected[seat]],
+            'best_bid': best_bid,
+            'best_expected_points': round(float(expected[seat, best_bid]), 2),
+            'expected_hits': round(float(probabilities[seat] @ np.arange(cards + 1)), 2),
+        })
+    return advice
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate Rikiki hands and measure throughput.')
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--cards', type=int, default=10)
+    parser.add_argument('--deck', choices=['single', 'double'], default='single')
+    parser.add_argument('--hands', type=int, default=100000)
+    parser.add_argument('--strategy', choices=STRATEGIES, default='greedy')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    deck_size = 104 if args.deck == 'double' else 52
+    print(f"🃏 {args.hands} hands, {args.players} players, {args.cards} cards, {args.deck} deck, "
+          f"strategy {args.strategy}")
+
+    runs = [('1 process', 1)]
+    if args.workers > 1:
+        runs.append((f'{args.workers} processes', args.workers))
+    for label, workers in runs:
+        start = time.perf_counter()
+        histogram = simulate_parallel(args.players, args.cards, deck_size, args.hands, args.strategy,
+                                      args.seed, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<12} {args.hands / elapsed:>12,.0f} hands/s ({elapsed:.2f}s)")
+
+    print(f"\n{'seat':<8} {'best bid':>8} {'expected pts':>13} {'expected hits':>14}")
+    for row in bid_advice(histogram):
+        label = 'dealer' if row['seat'] == args.players - 1 else str(row['seat'] + 1)
+        print(f"{label:<8} {row['best_bid']:>8} {row['best_expected_points']:>13.2f} {row['expected_hits']:>14.2f}")
@@ -0,0 +1,43 @@
+// Write forms: every form with a submission_id field gets a fresh random token each time the
+// page is shown, so the server applies a double-tapped or re-sent form only once.
+function newSubmissionId() {
+    const bytes = new Uint8Array(16);
+    crypto.getRandomValues(bytes);
+    return Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+// Also fired when the browser restores the page from its back/forward cache
+window.addEventListener('pageshow', function() {
+    document.querySelectorAll('input[name="submission_id"]').forEach(function(input) {
+        input.value = newSubmissionId();
+    });
+});
+
+// Player filters: the nickname box looks players up as you type and keeps the picked player's id in
+// the hidden field it names, so the page never has to list the whole roster.
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[data-player-filter]').forEach(function(input) {
+        const idInput = document.getElementById(input.dataset.playerFilter);
+        const options = input.list;
+        const ids = new Map(input.value ? [[input.value, idInput.value]] : []);
+        let searchTimer = null;
+
+        input.addEventListener('input', function() {
+            const prefix = input.value.trim();
+            idInput.value = ids.get(prefix) || '';
+            clearTimeout(searchTimer);
+            if (!prefix || idInput.value) {
+                return;
+            }
+            searchTimer = setTimeout(() => {
+                fetch(`${input.dataset.searchUrl}?q=${encodeURIComponent(prefix)}`)
+                    .then(response => response.json())
+                    .then(data => {
+                        data.players.forEach(player => ids.set(player.nickname, String(player.id)));
+                        options.replaceChildren(...data.players.map(player => new Option(player.nickname)));
+                        idInput.value = ids.get(input.value.trim()) || '';
+                    });
+            }, 150);
+        });
+    });
+});
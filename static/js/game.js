@@ -0,0 +1,324 @@
+// Game page: score chart, guess and hits checks, the bid advice panel and live updates.
+// Values from the server are in the #gamePageData JSON block of game.html.
+const gamePage = JSON.parse(document.getElementById('gamePageData').textContent);
+
+// Wait for Chart.js to load
+function waitForChart() {
+    if (typeof Chart !== 'undefined') {
+        createChart();
+    } else {
+        setTimeout(waitForChart, 100);
+    }
+}
+
+function createChart() {
+    // Chart data from backend
+    const chartData = gamePage.chartData;
+    
+    // Create chart
+    const ctx = document.getElementById('pointsChart');
+    
+    if (ctx) {
+        try {
+            new Chart(ctx, {
+                type: 'line',
+                data: chartData,
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    scales: {
+                        y: {
+                            beginAtZero: true,
+                            title: {
+                                display: true,
+                                text: 'Points'
+                            }
+                        },
+                        x: {
+                            title: {
+                                display: true,
+                                text: 'Rounds'
+                            }
+                        }
+                    },
+                    plugins: {
+                        legend: {
+                            display: true,
+                            position: 'top'
+                        },
+                        title: {
+                            display: true,
+                            text: 'Points Progress'
+                        }
+                    }
+                }
+            });
+        } catch (error) {
+            console.error('Error creating chart:', error);
+            // Fallback: show a message if chart fails
+            ctx.parentElement.innerHTML = '<div class="alert alert-info">Chart loading...</div>';
+        }
+    }
+}
+
+// Start the chart process
+waitForChart();
+
+// Real-time sum calculation for guesses
+document.addEventListener('DOMContentLoaded', function() {
+    const guessInputs = document.querySelectorAll('.guess-input');
+    const sumAlert = document.getElementById('sumAlert');
+    const currentSumSpan = document.getElementById('currentSum');
+    const maxCards = gamePage.cards;
+    const forceConflict = gamePage.forceConflict;
+    
+    function updateGuessSum() {
+        let sum = 0;
+        guessInputs.forEach(input => {
+            const value = parseInt(input.value) || 0;
+            sum += value;
+        });
+        
+        currentSumSpan.textContent = sum;
+        
+        // Form validation for guesses
+        const submitGuessesBtn = document.getElementById('submitGuessesBtn');
+        const guessesHint = document.getElementById('guessesHint');
+        
+        if (sum >= 0) {
+            sumAlert.style.display = 'block';
+            if (forceConflict && sum === maxCards) {
+                sumAlert.className = 'alert alert-danger mt-3';
+                sumAlert.innerHTML = `<strong>Current Sum:</strong> <span id="currentSum">${sum}</span><br><small>⚠️ Sum equals ${maxCards} - this is not allowed!</small>`;
+                submitGuessesBtn.disabled = true;
+                guessesHint.textContent = `Sum equals ${maxCards} - not allowed!`;
+                guessesHint.className = 'text-danger d-block mt-1';
+            } else {
+                sumAlert.className = 'alert alert-info mt-3';
+                if (forceConflict) {
+                    sumAlert.innerHTML = `<strong>Current Sum:</strong> <span id="currentSum">${sum}</span><br><small>Sum must not equal ${maxCards}</small>`;
+                } else {
+                    sumAlert.innerHTML = `<strong>Current Sum:</strong> <span id="currentSum">${sum}</span><br><small>Sum can equal ${maxCards} (conflict allowed)</small>`;
+                }
+                submitGuessesBtn.disabled = false;
+                guessesHint.textContent = 'Ready to submit!';
+                guessesHint.className = 'text-success d-block mt-1';
+            }
+        } else {
+            sumAlert.style.display = 'none';
+            submitGuessesBtn.disabled = true;
+            guessesHint.textContent = 'Enter guesses to submit';
+            guessesHint.className = 'text-muted d-block mt-1';
+        }
+    }
+    
+    // Bid advice: the dealer's best bid skips the total that the conflict rule forbids
+    const bidAdviceBtn = document.getElementById('bidAdviceBtn');
+    let bidAdvice = null;
+    
+    function renderBidAdvice() {
+        const rows = document.getElementById('bidAdviceRows');
+        rows.innerHTML = '';
+        let othersSum = 0;
+        bidAdvice.seats.forEach(seat => {
+            let bid = seat.best_bid;
+            let note = '';
+            if (seat.is_dealer && bidAdvice.force_conflict) {
+                const forbidden = bidAdvice.cards - othersSum;
+                if (bid === forbidden) {
+                    const allowed = seat.expected_points.map((points, guess) => [points, guess]).filter(([, guess]) => guess !== forbidden);
+                    allowed.sort((a, b) => b[0] - a[0]);
+                    bid = allowed[0][1];
+                    note = ` <small class="text-muted">(${forbidden} not allowed)</small>`;
+                }
+            }
+            const input = document.getElementById(`guess_${seat.player_id}`);
+            othersSum += input ? (parseInt(input.value) || 0) : 0;
+            const row = document.createElement('tr');
+            row.innerHTML = `<td>${seat.nickname}${seat.is_dealer ? ' <span class="badge bg-warning">Dealer</span>' : ''}</td>` +
+                `<td><strong>${bid}</strong>${note}</td>` +
+                `<td>${seat.expected_points[bid].toFixed(1)}</td>` +
+                `<td>${seat.expected_hits.toFixed(2)}</td>` +
+                `<td>${(seat.hit_probabilities[0] * 100).toFixed(0)}%</td>`;
+            rows.appendChild(row);
+        });
+    }
+    
+    if (bidAdviceBtn) {
+        bidAdviceBtn.addEventListener('click', function() {
+            const panel = document.getElementById('bidAdvicePanel');
+            if (panel.style.display === 'block') {
+                panel.style.display = 'none';
+                bidAdviceBtn.textContent = 'Show advice';
+                return;
+            }
+            panel.style.display = 'block';
+            bidAdviceBtn.textContent = 'Hide advice';
+            if (bidAdvice) {
+                return;
+            }
+            fetch(gamePage.bidAdviceUrl)
+                .then(response => response.json())
+                .then(data => {
+                    bidAdvice = data;
+                    document.getElementById('bidAdviceNote').textContent =
+                        `Based on ${data.hands.toLocaleString()} simulated deals where everyone plays greedily. It does not know your cards: adjust for strong trumps or a weak hand.`;
+                    renderBidAdvice();
+                })
+                .catch(() => {
+                    document.getElementById('bidAdviceNote').textContent = 'Bid advice is not available right now.';
+                });
+        });
+        guessInputs.forEach(input => input.addEventListener('input', () => { if (bidAdvice) renderBidAdvice(); }));
+    }
+    
+    // Keep guess sum visible when entering hits
+    if (guessInputs.length > 0) {
+        updateGuessSum(); // Show initial state
+    }
+    
+    guessInputs.forEach(input => {
+        input.addEventListener('input', updateGuessSum);
+    });
+    
+    // Real-time sum calculation for hits with form validation
+    const hitsInputs = document.querySelectorAll('.hits-input');
+    const hitsSumAlert = document.getElementById('hitsSumAlert');
+    const totalHitsSpan = document.getElementById('totalHits');
+    const targetHits = gamePage.cards;
+    const submitResultsBtn = document.getElementById('submitResultsBtn');
+    const submitHint = document.getElementById('submitHint');
+    
+    function updateHitsSum() {
+        let sum = 0;
+        hitsInputs.forEach(input => {
+            const value = parseInt(input.value) || 0;
+            sum += value;
+        });
+        
+        totalHitsSpan.textContent = sum;
+        
+        // Form validation
+        if (sum === targetHits) {
+            submitResultsBtn.disabled = false;
+            submitHint.textContent = 'Ready to submit!';
+            submitHint.className = 'text-success d-block mt-1';
+        } else {
+            submitResultsBtn.disabled = true;
+            if (sum > targetHits) {
+                submitHint.textContent = `Too many hits! Must equal ${targetHits}`;
+                submitHint.className = 'text-danger d-block mt-1';
+            } else {
+                submitHint.textContent = `Need ${targetHits - sum} more hits to submit`;
+                submitHint.className = 'text-warning d-block mt-1';
+            }
+        }
+        
+        if (sum > 0) {
+            hitsSumAlert.style.display = 'block';
+            if (sum === targetHits) {
+                hitsSumAlert.className = 'alert alert-success mt-3';
+                hitsSumAlert.innerHTML = `<strong>Total Hits:</strong> <span id="totalHits">${sum}</span> / ${targetHits}<br><small>✅ Total hits equals ${targetHits} - perfect!</small>`;
+            } else if (sum > targetHits) {
+                hitsSumAlert.className = 'alert alert-danger mt-3';
+                hitsSumAlert.innerHTML = `<strong>Total Hits:</strong> <span id="totalHits">${sum}</span> / ${targetHits}<br><small>⚠️ Too many hits! Must equal ${targetHits}</small>`;
+            } else {
+                hitsSumAlert.className = 'alert alert-warning mt-3';
+                hitsSumAlert.innerHTML = `<strong>Total Hits:</strong> <span id="totalHits">${sum}</span> / ${targetHits}<br><small>Total hits must equal ${targetHits}</small>`;
+            }
+        } else {
+            hitsSumAlert.style.display = 'none';
+        }
+    }
+    
+    hitsInputs.forEach(input => {
+        input.addEventListener('input', updateHitsSum);
+    });
+    
+    // Initialize hits sum if we're on the hits page
+    if (hitsInputs.length > 0) {
+        updateHitsSum();
+    }
+});
+
+// Live updates: when the game changes on another device, reload so the scoreboard, chart and
+// forms show the new state. If guesses or hits were typed here, offer the reload instead.
+// The server streams the changes; when it has no stream to spare, the state is polled.
+const LIVE_POLL_SECONDS = 15;
+
+document.addEventListener('DOMContentLoaded', function() {
+    const liveNotice = document.getElementById('liveNotice');
+    let gameEvents = null;
+    let pollTimer = null;
+    let typed = false;
+    
+    document.querySelectorAll('.guess-input, .hits-input').forEach(input => {
+        input.addEventListener('input', () => { typed = true; });
+    });
+    
+    function showNotice(message, withReload) {
+        liveNotice.textContent = message + ' ';
+        if (withReload) {
+            const link = document.createElement('a');
+            link.href = window.location.href;
+            link.className = 'alert-link';
+            link.textContent = 'Reload';
+            liveNotice.appendChild(link);
+        }
+        liveNotice.style.display = 'block';
+    }
+    
+    function stopListening() {
+        if (gameEvents) {
+            gameEvents.close();
+        }
+        clearInterval(pollTimer);
+    }
+    
+    function versionSeen(version) {
+        // The stream can replay changes this page already shows
+        if (version <= gamePage.version) {
+            return;
+        }
+        if (!typed) {
+            stopListening();
+            window.location.reload();
+            return;
+        }
+        showNotice('This game has been updated on another device.', true);
+    }
+    
+    function gameDeleted() {
+        stopListening();
+        showNotice('This game has been deleted.', false);
+    }
+    
+    function pollState() {
+        fetch(gamePage.stateUrl)
+            .then(response => {
+                if (response.status === 404) {
+                    gameDeleted();
+                    return null;
+                }
+                return response.ok ? response.json() : null;
+            })
+            .then(state => { if (state) versionSeen(state.version); })
+            .catch(() => {});
+    }
+    
+    if (!window.EventSource) {
+        pollTimer = setInterval(pollState, LIVE_POLL_SECONDS * 1000);
+        return;
+    }
+    gameEvents = new EventSource(gamePage.eventsUrl);
+    ['guesses', 'results', 'ended', 'state'].forEach(name => gameEvents.addEventListener(name, event => {
+        versionSeen(JSON.parse(event.data).version);
+    }));
+    gameEvents.addEventListener('deleted', gameDeleted);
+    gameEvents.addEventListener('error', function() {
+        // A closed stream (204 when the server's streams are all taken) is not retried: poll instead
+        if (gameEvents.readyState === EventSource.CLOSED && pollTimer === null) {
+            pollTimer = setInterval(pollState, LIVE_POLL_SECONDS * 1000);
+        }
+    });
+});
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production servers.
+Creating the app only reads configuration, so importing this module is fast and never
+touches the database; gunicorn.conf.py loads it once and forks the workers from it.
+
+Usage:
+    gunicorn wsgi:app
+"""
+
+from app import create_app
+
+app = create_app()